@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
+from importlib.util import find_spec
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,7 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'librarymanagement.middleware.MetricsMiddleware',
+    'librarymanagement.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'librarymanagement.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,15 +84,77 @@ WSGI_APPLICATION = 'library.wsgi.application'
 
 DATABASES = {
     'default': {
-        "ENGINE": "django.db.backends.mysql",
-        "NAME": "db",         
-        "USER": "root",               
-        "PASSWORD": "root",  
-        "HOST": "localhost",          
-        "PORT": "3306", 
+        "ENGINE": os.environ.get('DB_ENGINE', "django.db.backends.mysql"),
+        "NAME": os.environ.get('DB_NAME', "db"),
+        "USER": os.environ.get('DB_USER', "root"),
+        "PASSWORD": os.environ.get('DB_PASSWORD', "root"),
+        "HOST": os.environ.get('DB_HOST', "localhost"),
+        "PORT": os.environ.get('DB_PORT', "3306"),
+        # Keep connections open between requests and check them before reuse.
+        "CONN_MAX_AGE": int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Read replicas (librarymanagement/routers.py): DB_REPLICAS is a comma-separated
+# list of HOST[:PORT] entries, or of database files when DB_ENGINE is SQLite.
+for _number, _replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    _alias = DATABASES['default'].copy()
+    if _alias['ENGINE'].endswith('sqlite3'):
+        _alias['NAME'] = _replica
+    else:
+        _alias['HOST'], _, _port = _replica.partition(':')
+        _alias['PORT'] = _port or _alias['PORT']
+    _alias['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{_number}'] = _alias
+
+DATABASE_ROUTERS = ['librarymanagement.routers.ReplicaRouter']
+
+REPLICA_HEALTH_CHECK_INTERVAL = 5
+
+READ_YOUR_WRITES_SECONDS = 5
+
+TEST_RUNNER = 'librarymanagement.test_runner.UnmanagedModelTestRunner'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Shared by every worker on the host without any extra service. Sized so
+    # the cache of a normal catalog never fills: at MAX_ENTRIES a set deletes
+    # a random 1/CULL_FREQUENCY of the files, generation keys included. Each
+    # set still lists the directory to count entries, so busy deployments
+    # should set CACHE_REDIS_URL instead.
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'library-cache'),
+        'OPTIONS': {'MAX_ENTRIES': 200000, 'CULL_FREQUENCY': 10},
+    },
+}
+
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_REDIS_URL'],
+    }
+
+# Cache used for API responses (librarymanagement/caching.py). Every worker
+# on the host shares it, so a write in one worker invalidates the others'
+# cached responses; 'default' is per-process and only fits a single worker.
+RESPONSE_CACHE_ALIAS = os.environ.get('RESPONSE_CACHE_ALIAS', 'shared')
+
+RESPONSE_CACHE_TIMEOUT = 300
+
+# False builds every GET from the database; the benchmark commands use it to
+# time the views rather than cache hits.
+RESPONSE_CACHE_ENABLED = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -129,3 +196,145 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Django REST framework
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'librarymanagement.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    # orjson-backed JSON (librarymanagement/renderers.py); MessagePack when msgpack is installed.
+    'DEFAULT_RENDERER_CLASSES': [
+        'librarymanagement.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (['librarymanagement.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'librarymanagement.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ] + (['librarymanagement.renderers.MessagePackParser'] if find_spec('msgpack') else []),
+    # Proxies in front of the app that append to X-Forwarded-For. The client
+    # address used for throttling trusts that many entries; 0 uses the
+    # connection's address, since without a proxy the header is the client's own.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# Build GET list pages for Book, Borrowing and Review from .values() rows
+# (librarymanagement/rowserializers.py) instead of running the serializers.
+FAST_LIST_SERIALIZATION = True
+
+
+# API docs (librarymanagement/apischema.py). The schema is generated once per
+# process; set OPENAPI_SCHEMA_FILE to the JSON file written by
+# `manage.py generate_openapi` to serve it and the YAML file next to it instead.
+
+API_VERSION = 'v1'
+
+OPENAPI_SCHEMA_FILE = os.environ.get('OPENAPI_SCHEMA_FILE') or None
+
+SWAGGER_SETTINGS = {'SPEC_URL': 'schema-json'}
+
+REDOC_SETTINGS = {'SPEC_URL': 'schema-json'}
+
+
+# Book search index (librarymanagement/search.py)
+
+SEARCH_RESULT_LIMIT = 20
+
+SEARCH_MAX_RESULT_LIMIT = 100
+
+SEARCH_INDEX_REBUILD_INTERVAL = 300
+
+
+# Response compression (librarymanagement/middleware.py): JSON, MessagePack and
+# export bodies of at least this many bytes; brotli when installed, else gzip.
+
+COMPRESSION_MIN_BYTES = 1024
+
+COMPRESSION_GZIP_LEVEL = 6
+
+COMPRESSION_BROTLI_QUALITY = 4
+
+
+# Bulk borrow/return endpoints
+
+BULK_CIRCULATION_MAX_ITEMS = 200
+
+# Longest loan a borrow request may ask for with ``days``.
+MAX_LOAN_DAYS = 365
+
+# Rows per request to /api/books/bulk/ (librarymanagement/catalog.py)
+BULK_BOOKS_MAX_ITEMS = 5000
+
+
+# Admission control for write endpoints (librarymanagement/admission.py)
+
+# Token buckets: '<requests>/<period>' per member and per API client; None disables a limit.
+THROTTLE_RATES = {
+    'member': '20/min',
+    'client': '300/min',
+}
+
+# 'local' keeps buckets in each worker; a cache alias such as 'shared' shares them on the host.
+THROTTLE_STORE = os.environ.get('THROTTLE_STORE', 'local')
+
+# API clients without a login are told apart by address. A gateway in
+# THROTTLE_TRUSTED_PROXIES can name the client in THROTTLE_CLIENT_HEADER
+# instead (e.g. 'X-Client-Id' with the API key id); the header is ignored
+# on requests from anywhere else.
+THROTTLE_CLIENT_HEADER = None
+THROTTLE_TRUSTED_PROXIES = ()
+
+# Writes running at once per worker; None disables the limit.
+WRITE_CONCURRENCY_LIMIT = 8
+
+# Seconds a write waits for a slot before it is shed with 429, and the Retry-After it gets.
+WRITE_QUEUE_TIMEOUT = 0.05
+
+WRITE_RETRY_AFTER = 1
+
+
+# Statistics counters (librarymanagement/statistics.py)
+
+STATISTICS_COUNTER_SHARDS = 8
+
+# /api/books/top-rated/ leaves out books with fewer reviews unless ?min_reviews= says otherwise.
+TOP_RATED_MIN_REVIEWS = 3
+
+
+# In-process availability map (librarymanagement/availability.py)
+
+AVAILABILITY_MAX_ENTRIES = 100000
+
+AVAILABILITY_MAX_AGE = 30
+
+AVAILABILITY_BATCH_MAX_IDS = 500
+
+
+# Streaming exports (librarymanagement/exports.py)
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+# Late fees (librarymanagement/fees.py)
+
+LATE_FEE_PER_DAY = '0.50'
+
+
+# Metrics (librarymanagement/metrics.py)
+
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# Log requests slower than this many seconds with their SQL; None disables.
+METRICS_SLOW_REQUEST_SECONDS = (
+    float(os.environ['SLOW_REQUEST_SECONDS']) if os.environ.get('SLOW_REQUEST_SECONDS') else None
+)
+
+
+# Recommendations (librarymanagement/recommendations.py)
+
+RECOMMENDATIONS_TOP_K = 10
+
+RECOMMENDATIONS_MIN_CO_BORROWERS = 2
+
+RECOMMENDATIONS_MAX_BOOKS_PER_MEMBER = 200
@@ -0,0 +1,34 @@
+"""
+Settings for running the tests without a MySQL server:
+
+    python manage.py test --settings=library.test_settings
+
+Both databases are SQLite. ``replica1`` stands in for a read replica for the
+routing tests (ReplicaRoutingTests); the router keeps it free of tables, so
+reads sent to it fail unless a test creates the table first. Both caches are
+in memory, so the tests never touch the file-based ``shared`` cache that
+running servers use.
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+    },
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test-replica.sqlite3',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library-tests',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library-tests-shared',
+    },
+}
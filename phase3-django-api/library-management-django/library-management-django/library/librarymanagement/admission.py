@@ -0,0 +1,216 @@
+"""
+Admission control for the write endpoints (borrow, return, bulk circulation,
+bulk book import, review create).
+
+Two checks run before a write view touches the database:
+
+- Token-bucket rate limits (``MemberRateThrottle``, ``ClientRateThrottle``),
+  configured in THROTTLE_RATES as ``'<requests>/<period>'``. A bucket holds up
+  to ``<requests>`` tokens and refills continuously over ``<period>``, so a
+  client can burst that many requests and is then held to the average rate.
+  Members are keyed by the ``member_id``/``member`` in the request body,
+  API clients by the authenticated user or else the client address
+  (``get_ident()``, which trusts NUM_PROXIES entries of X-Forwarded-For). A
+  THROTTLE_CLIENT_HEADER header, e.g. an API key id set by a gateway, is
+  only believed on requests from THROTTLE_TRUSTED_PROXIES: from anyone else
+  a fresh value per request would dodge the limit and fill the bucket
+  store. Buckets live in this process (THROTTLE_STORE='local')
+  or in a Django cache such as 'shared', which every worker on the host sees;
+  updates to a cache bucket are not atomic, so concurrent workers may admit a
+  request or two beyond the limit.
+- ``ConcurrencyLimiter``: at most WRITE_CONCURRENCY_LIMIT write requests run
+  at once in a worker. Past that a request waits up to WRITE_QUEUE_TIMEOUT
+  seconds for a slot and is then shed, so a burst is turned away with a cheap
+  429 instead of piling connections and row locks onto MySQL.
+
+Rejections are 429 with Retry-After (DRF's ``Throttled``). Every decision is
+counted in ``library_admission_requests_total`` by route and outcome.
+"""
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+metrics.registry.describe(
+    'library_admission_requests_total', 'counter',
+    'Write requests admitted or rejected (member_rate, client_rate, concurrency) by route.',
+)
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60,
+           'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """``'30/min'`` -> ``(capacity, tokens per second)``, or None for no limit."""
+    if not rate:
+        return None
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d*)\s*([a-z]+)\s*', rate)
+    if not match or match.group(3) not in PERIODS:
+        raise ValueError(f'Invalid rate {rate!r}; expected e.g. "30/min"')
+    capacity = int(match.group(1))
+    seconds = int(match.group(2) or 1) * PERIODS[match.group(3)]
+    return capacity, capacity / seconds
+
+
+def _take(state, now, capacity, refill):
+    """Refill ``state`` (``(tokens, stamp)``) and take a token: ``(new state, seconds to wait or 0)``."""
+    tokens, stamp = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - stamp) * refill)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / refill
+
+
+class LocalBuckets:
+    """Buckets in a dict in this process."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill):
+        now = time.monotonic()
+        with self._lock:
+            self._buckets[key], wait = _take(self._buckets.get(key), now, capacity, refill)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, capacity, refill)
+        return wait
+
+    def _prune(self, now, capacity, refill):
+        # A bucket that has refilled completely is the same as no bucket.
+        full = [key for key, (tokens, stamp) in self._buckets.items()
+                if tokens + (now - stamp) * refill >= capacity]
+        for key in full:
+            del self._buckets[key]
+
+
+class CacheBuckets:
+    """Buckets in a Django cache, shared by the workers that use the same cache."""
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, capacity, refill):
+        key = f'throttle:{key}'
+        state, wait = _take(self.cache.get(key), time.time(), capacity, refill)
+        # Expire once the bucket would be full again anyway.
+        self.cache.set(key, state, int((capacity - state[0]) / refill) + 1)
+        return wait
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+
+    def acquire(self, timeout=0):
+        if timeout > 0:
+            return self._slots.acquire(timeout=timeout)
+        return self._slots.acquire(blocking=False)
+
+    def release(self):
+        self._slots.release()
+
+
+_lock = threading.Lock()
+_store = None
+_limiter = None
+
+
+def get_store():
+    global _store
+    with _lock:
+        if _store is None:
+            alias = getattr(settings, 'THROTTLE_STORE', 'local')
+            _store = LocalBuckets() if alias == 'local' else CacheBuckets(alias)
+        return _store
+
+
+def get_limiter():
+    """The worker's limiter, or None when WRITE_CONCURRENCY_LIMIT is unset."""
+    global _limiter
+    with _lock:
+        limit = getattr(settings, 'WRITE_CONCURRENCY_LIMIT', None)
+        if not limit:
+            return None
+        if _limiter is None:
+            _limiter = ConcurrencyLimiter(limit)
+        return _limiter
+
+
+def reset():
+    """Forget all buckets and recreate the limiter from settings, e.g. between tests."""
+    global _store, _limiter
+    with _lock:
+        _store = None
+        _limiter = None
+
+
+def record(request, outcome):
+    match = request.resolver_match
+    route = (match.url_name or match.view_name) if match else 'unmatched'
+    metrics.registry.inc('library_admission_requests_total', (('route', route), ('outcome', outcome)))
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Base class: one bucket per ``bucket_key()`` value, rate THROTTLE_RATES[scope]."""
+    scope = None
+
+    def bucket_key(self, request):
+        """The bucket ``request`` draws from, or None to let it through."""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if request.method in SAFE_METHODS:
+            return True
+        rate = parse_rate(getattr(settings, 'THROTTLE_RATES', {}).get(self.scope))
+        key = self.bucket_key(request) if rate else None
+        if key is None:
+            return True
+        wait = get_store().take(f'{self.scope}:{key}', *rate)
+        if wait:
+            self.wait_seconds = wait
+            record(request, f'{self.scope}_rate')
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class MemberRateThrottle(TokenBucketThrottle):
+    scope = 'member'
+    member_fields = ('member_id', 'member')
+
+    def bucket_key(self, request):
+        data = request.data
+        if not hasattr(data, 'get'):
+            return None
+        for field in self.member_fields:
+            value = data.get(field)
+            if value not in (None, ''):
+                return str(value)
+        return None
+
+
+class ClientRateThrottle(TokenBucketThrottle):
+    scope = 'client'
+
+    def bucket_key(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        header = getattr(settings, 'THROTTLE_CLIENT_HEADER', None)
+        if header and request.META.get('REMOTE_ADDR') in getattr(settings, 'THROTTLE_TRUSTED_PROXIES', ()):
+            client = request.headers.get(header)
+            if client:
+                return f'key:{client[:128]}'
+        return f'addr:{self.get_ident(request)}'
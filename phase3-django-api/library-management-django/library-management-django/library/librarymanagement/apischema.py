@@ -0,0 +1,150 @@
+"""
+The OpenAPI schema, generated once and served from memory.
+
+drf_yasg's schema view introspects every view and serializer on each
+request. Here the schema is built once per process (on the first docs
+request) or read from the files ``generate_openapi`` wrote when OPENAPI_SCHEMA_FILE
+points at the JSON one (the YAML file is read from next to it), encoded once,
+and served as bytes with an ETag, so repeated fetches by client generators
+cost a dictionary lookup or a 304. Configured files are read when the app
+starts, so the first docs request does not wait for the disk either.
+
+drf_yasg is only imported when a docs URL is first requested, so workers
+that never serve the docs do not pay for importing it at boot.
+"""
+import hashlib
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+FORMATS = {
+    'json': 'application/json',
+    'yaml': 'application/yaml',
+}
+
+_lock = threading.RLock()
+_schema = None
+_documents = {}
+_ui_views = {}
+
+
+def api_version():
+    return getattr(settings, 'API_VERSION', 'v1')
+
+
+def _info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="My API",
+        default_version=api_version(),
+        description="API documentation",
+    )
+
+
+def _generator_class():
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    class CachedSchemaGenerator(OpenAPISchemaGenerator):
+        """Returns the process-wide schema instead of introspecting the views again."""
+
+        def get_schema(self, request=None, public=False):
+            return get_schema()
+
+    return CachedSchemaGenerator
+
+
+def build_schema():
+    """Introspect the URLconf into a drf_yasg ``Swagger`` object (slow; see get_schema)."""
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    # Without a request the schema carries no host, so it is the same for
+    # every client; Swagger UI fills in the host it was loaded from.
+    return OpenAPISchemaGenerator(_info(), version=api_version()).get_schema(request=None, public=True)
+
+
+def encode(schema, fmt):
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+
+    codec = OpenAPICodecJson(validators=[], pretty=True) if fmt == 'json' else OpenAPICodecYaml(validators=[])
+    return codec.encode(schema)
+
+
+def get_schema():
+    global _schema
+    if _schema is None:
+        with _lock:
+            if _schema is None:
+                _schema = build_schema()
+    return _schema
+
+
+def schema_file(fmt):
+    """The ``generate_openapi`` file for ``fmt`` next to OPENAPI_SCHEMA_FILE, or None if there is none."""
+    path = getattr(settings, 'OPENAPI_SCHEMA_FILE', None)
+    if not path:
+        return None
+    path = Path(path).with_suffix(f'.{fmt}')
+    return path if path.exists() else None
+
+
+def _load(fmt):
+    path = schema_file(fmt)
+    return path.read_bytes() if path else encode(get_schema(), fmt)
+
+
+def _tagged(body):
+    return body, '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def document(fmt='json'):
+    """``(body, etag)`` of the encoded schema, built on first use."""
+    if fmt not in _documents:
+        with _lock:
+            if fmt not in _documents:
+                _documents[fmt] = _tagged(_load(fmt))
+    return _documents[fmt]
+
+
+def load_files():
+    """Read the schema files next to OPENAPI_SCHEMA_FILE now; formats without one are still built on first use."""
+    with _lock:
+        for fmt in FORMATS:
+            path = schema_file(fmt)
+            if path and fmt not in _documents:
+                _documents[fmt] = _tagged(path.read_bytes())
+
+
+def reset():
+    """Forget the generated schema, e.g. after the URLconf changed in tests."""
+    global _schema
+    with _lock:
+        _schema = None
+        _documents.clear()
+
+
+def schema_view(request, fmt='json'):
+    body, etag = document(fmt)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+        if '*' in etags or etag in etags:
+            return HttpResponseNotModified(headers=headers)
+    return HttpResponse(body, content_type=FORMATS[fmt], headers=headers)
+
+
+def ui_view(request, renderer='swagger'):
+    """Swagger UI or ReDoc, pointed at ``schema_view`` and rendered from the cached schema."""
+    if renderer not in _ui_views:
+        from drf_yasg.views import get_schema_view
+        from rest_framework import permissions
+
+        _ui_views[renderer] = get_schema_view(
+            _info(), public=True, permission_classes=(permissions.AllowAny,),
+            generator_class=_generator_class(),
+        ).with_ui(renderer, cache_timeout=0)
+    return _ui_views[renderer](request)
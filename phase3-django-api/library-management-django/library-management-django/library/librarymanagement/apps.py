@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class LibrarymanagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'librarymanagement'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        if getattr(settings, 'OPENAPI_SCHEMA_FILE', None):
+            from . import apischema
+
+            apischema.load_files()
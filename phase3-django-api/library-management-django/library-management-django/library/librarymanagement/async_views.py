@@ -0,0 +1,92 @@
+"""
+Async versions of the hot read endpoints, mounted under ``/api/async/``.
+
+They return the same JSON as their DRF counterparts but are plain Django
+``async def`` views, so under the ASGI application (``library/asgi.py``) a
+request waiting on the database does not hold a worker thread. Rows are read
+with the async ORM; relations are prefetched in the same call so the
+serializers never touch the database from the event loop.
+
+These views skip the response cache used by the sync endpoints.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.exceptions import NotFound
+
+from . import availability, search
+from .models import Book, Member, Borrowing
+from .pagination import MemberBorrowingsPagination
+from .serializers import BookSerializer, BorrowingSerializer
+
+
+def _int_param(request, name, default, maximum):
+    try:
+        value = int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(1, min(value, maximum))
+
+
+def _not_found(message):
+    return JsonResponse({'error': message}, status=404)
+
+
+async def book_detail(request, pk):
+    try:
+        book = await BookSerializer.setup_eager_loading(Book.objects.all()).aget(pk=pk)
+    except Book.DoesNotExist:
+        return _not_found('Book not found')
+    return JsonResponse(BookSerializer(book).data)
+
+
+async def book_availability(request, pk):
+    found = await sync_to_async(availability.get_map().get_many)([pk])
+    entry = found.get(pk)
+    if entry is None:
+        return _not_found('Book not found')
+    return JsonResponse(entry.as_dict(pk))
+
+
+async def book_search(request):
+    query = request.GET.get('q', '').strip()
+    limit = _int_param(
+        request, 'limit',
+        getattr(settings, 'SEARCH_RESULT_LIMIT', 20),
+        getattr(settings, 'SEARCH_MAX_RESULT_LIMIT', 100),
+    )
+    books_qs = BookSerializer.setup_eager_loading(Book.objects.all())
+
+    if not query:
+        books = [book async for book in books_qs.order_by('id')[:limit]]
+        total = len(books)
+    else:
+        # Only the first build reads the database; later calls are in-memory.
+        if search.loaded_index() is not None:
+            index = search.get_index()
+        else:
+            index = await sync_to_async(search.get_index)()
+        total, hits = index.search(query, limit=limit)
+        found = await books_qs.ain_bulk([book_id for book_id, _ in hits])
+        books = [found[book_id] for book_id, _ in hits if book_id in found]
+
+    response = JsonResponse(BookSerializer(books, many=True).data, safe=False)
+    response['X-Total-Count'] = str(total)
+    return response
+
+
+async def member_borrowings(request, pk):
+    """
+    Newest first, with the same page shape (``{next, previous, results}``)
+    and ``cursor`` as the sync view: both use MemberBorrowingsPagination.
+    """
+    if not await Member.objects.filter(pk=pk).aexists():
+        return _not_found('Member not found')
+    paginator = MemberBorrowingsPagination()
+    borrowings = BorrowingSerializer.setup_eager_loading(Borrowing.objects.filter(member_id=pk))
+    try:
+        rows = paginator.page_queryset(borrowings, request)
+    except NotFound as exc:
+        return _not_found(str(exc.detail))
+    page = paginator.set_page([borrowing async for borrowing in rows])
+    return JsonResponse(paginator.get_paginated_data(BorrowingSerializer(page, many=True).data))
@@ -0,0 +1,148 @@
+"""
+In-process availability map behind BookAvailabilityAPIView.
+
+Holds ``book_id -> (title, available_copies, total_copies)`` for recently
+requested books. Each book also has a version number in the response cache
+(see ``caching.py``); every borrow, return or Book write bumps it on commit.
+A read compares the local entry's version with the cached one and re-reads
+only the stale books with a single ``values_list`` query, so a hit never
+touches the ORM.
+
+Writes only bump the version and drop the local entry; they never patch the
+entry with their change. A read that loaded the row after the commit but
+before the on-commit bump would otherwise get the change applied twice.
+Versions are read before the rows, so an entry is never stored under a
+version newer than its data, and books whose version moved within
+READ_YOUR_WRITES_SECONDS are re-read from the primary rather than from a
+replica that may not have the write yet. Entries older than
+AVAILABILITY_MAX_AGE seconds are re-read regardless, which bounds staleness
+when the response cache is per-process and another worker wrote. The same
+commits mark the books stale in the search index's availability facet.
+
+Versions a read has to create expire with the response cache timeout, and
+those of ids that turn out not to exist are dropped again, so requests for
+made-up ids cannot fill the cache. A version that expires comes back from
+the clock, which just makes the next read reload the row. Checking versions
+is one ``get_many`` per read, but on the file-based ``shared`` cache that is
+still a file read per book; with Redis (CACHE_REDIS_URL) it is one round
+trip.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import caching, routers, search
+from .models import Book
+
+
+class Entry:
+    __slots__ = ('title', 'available', 'total', 'version', 'loaded_at')
+
+    def __init__(self, title, available, total, version, loaded_at):
+        self.title = title
+        self.available = available
+        self.total = total
+        self.version = version
+        self.loaded_at = loaded_at
+
+    def as_dict(self, book_id):
+        return {
+            'book_id': book_id,
+            'title': self.title,
+            'is_available': self.available > 0,
+            'available_copies': self.available,
+            'total_copies': self.total,
+        }
+
+
+def _version_key(book_id):
+    return f'avail:{book_id}'
+
+
+class AvailabilityMap:
+    def __init__(self, max_entries=None, max_age=None):
+        self.max_entries = max_entries or getattr(settings, 'AVAILABILITY_MAX_ENTRIES', 100000)
+        self.max_age = max_age or getattr(settings, 'AVAILABILITY_MAX_AGE', 30)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, book_ids):
+        """Return ``{book_id: Entry}`` for the requested books that exist."""
+        now = time.monotonic()
+        cache = caching.get_cache()
+        found = cache.get_many([_version_key(book_id) for book_id in book_ids])
+        versions = {}
+        seeded = set()
+        for book_id in book_ids:
+            key = _version_key(book_id)
+            if key not in found:
+                cache.add(key, time.time_ns(), caching.cache_timeout())
+                found[key] = cache.get(key)
+                seeded.add(book_id)
+            versions[book_id] = found[key]
+
+        result = {}
+        stale = []
+        with self._lock:
+            for book_id in book_ids:
+                entry = self._entries.get(book_id)
+                if entry is not None and entry.version == versions[book_id] and now - entry.loaded_at < self.max_age:
+                    self._entries.move_to_end(book_id)
+                    result[book_id] = entry
+                else:
+                    stale.append(book_id)
+
+        if stale:
+            books = Book.objects
+            if routers.may_read_from_replica() and caching.bumped_recently([_version_key(book_id) for book_id in stale]):
+                # A replica may not have the write behind the new version yet.
+                books = Book.objects.using(DEFAULT_DB_ALIAS)
+            rows = books.filter(id__in=stale).values_list(
+                'id', 'title', 'available_copies', 'total_copies'
+            )
+            with self._lock:
+                for book_id, title, available, total in rows:
+                    entry = Entry(title, available or 0, total or 0, versions[book_id], now)
+                    self._entries[book_id] = entry
+                    self._entries.move_to_end(book_id)
+                    result[book_id] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        unknown = seeded.difference(result)
+        if unknown:
+            cache.delete_many([_version_key(book_id) for book_id in unknown])
+        return result
+
+    def invalidate(self, book_ids):
+        caching.bump_keys([_version_key(book_id) for book_id in book_ids])
+        with self._lock:
+            for book_id in book_ids:
+                self._entries.pop(book_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_map = AvailabilityMap()
+
+
+def get_map():
+    return _map
+
+
+def _mark_search_facets(book_ids):
+    search.apply_update('mark_availability_stale', book_ids)
+
+
+def invalidate_on_commit(*book_ids):
+    def invalidate():
+        _map.invalidate(book_ids)
+        _mark_search_facets(book_ids)
+    transaction.on_commit(invalidate)
@@ -0,0 +1,249 @@
+"""
+Load drivers for the benchmark commands.
+
+Requests go straight into the WSGI handler (from a thread pool) or the ASGI
+application (as concurrent tasks on one event loop), so the numbers measure
+Django, the views and the database without a web server or network in
+between. ``run_http`` sends the same requests to a running server instead.
+"""
+import asyncio
+import http.client
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+
+HOST = 'testserver'
+
+
+@contextmanager
+def settings_changed(**values):
+    """Change settings for an in-process run and restore them afterwards."""
+    missing = object()
+    saved = {name: getattr(settings, name, missing) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is missing:
+                delattr(settings, name)
+            else:
+                setattr(settings, name, value)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Throughput and latency percentiles (in milliseconds) for one run."""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed': elapsed,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def _request(spec):
+    """Requests are a path (GET) or ``(method, path, json_body)``."""
+    if isinstance(spec, str):
+        return 'GET', spec, b''
+    method, path, data = spec
+    return method, path, json.dumps(data).encode() if data is not None else b''
+
+
+def _finish(results, elapsed, collect):
+    summary = summarize([latency for latency, _, _ in results], elapsed,
+                        sum(1 for _, status, _ in results if status >= 400))
+    if collect:
+        summary['responses'] = [(status, body) for _, status, body in results]
+    return summary
+
+
+def _wsgi_environ(method, url, body):
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if body:
+        environ['CONTENT_TYPE'] = 'application/json'
+        environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def run_wsgi(requests, concurrency, collect=False):
+    """Send ``requests`` through the WSGI handler from ``concurrency`` threads."""
+    handler = WSGIHandler()
+
+    def call(spec):
+        status = []
+        chunks = []
+        started = time.perf_counter()
+        body = handler(_wsgi_environ(*_request(spec)), lambda s, headers, exc_info=None: status.append(s))
+        try:
+            for chunk in body:
+                chunks.append(chunk)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return time.perf_counter() - started, int(status[0].split()[0]), b''.join(chunks) if collect else None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, requests))
+    return _finish(results, time.perf_counter() - started, collect)
+
+
+async def _asgi_call(app, spec, collect):
+    method, url, request_body = _request(spec)
+    parts = urlsplit(url)
+    headers = [(b'host', HOST.encode())]
+    if request_body:
+        headers += [(b'content-type', b'application/json'), (b'content-length', str(len(request_body)).encode())]
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': headers,
+        'server': (HOST, 80),
+        'client': ('127.0.0.1', 0),
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+    status = []
+    chunks = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': request_body, 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif collect and message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    started = time.perf_counter()
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+    return time.perf_counter() - started, status[0], b''.join(chunks) if collect else None
+
+
+def run_asgi(requests, concurrency, collect=False):
+    """Send ``requests`` through the ASGI application, ``concurrency`` at a time."""
+    app = ASGIHandler()
+
+    async def main():
+        pending = list(enumerate(requests))
+        pending.reverse()
+        results = [None] * len(requests)
+
+        async def client():
+            while pending:
+                index, spec = pending.pop()
+                results[index] = await _asgi_call(app, spec, collect)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(main())
+    return _finish(results, elapsed, collect)
+
+
+def run_http(base_url, requests, concurrency, collect=False):
+    """Send ``requests`` to a running server at ``base_url``, one keep-alive connection per thread."""
+    parts = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    local = threading.local()
+
+    def call(spec):
+        method, path, body = _request(spec)
+        if not hasattr(local, 'connection'):
+            local.connection = connection_class(parts.netloc, timeout=60)
+        headers = {'Content-Type': 'application/json'} if body else {}
+        started = time.perf_counter()
+        try:
+            local.connection.request(method, parts.path.rstrip('/') + path, body=body or None, headers=headers)
+            response = local.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            local.connection.close()
+            del local.connection
+            return time.perf_counter() - started, 599, None
+        return time.perf_counter() - started, response.status, data if collect else None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, requests))
+    return _finish(results, time.perf_counter() - started, collect)
+
+
+def query_totals_from_text(text, name='library_db_queries_per_request'):
+    """``{route: (sum, count)}`` for a histogram in Prometheus text from ``/metrics``."""
+    totals = {}
+    for line in text.splitlines():
+        for suffix, position in (('_sum{', 0), ('_count{', 1)):
+            if line.startswith(name + suffix):
+                labels, _, value = line[len(name) + len(suffix):].rpartition('} ')
+                route = labels.partition('route="')[2].partition('"')[0]
+                entry = totals.setdefault(route, [0.0, 0])
+                entry[position] = float(value)
+    return {route: tuple(entry) for route, entry in totals.items()}
+
+
+def counter_totals_from_text(text, name):
+    """``{((label, value), ...): total}`` for a counter in Prometheus text from ``/metrics``."""
+    totals = {}
+    for line in text.splitlines():
+        if line.startswith(name + '{'):
+            labels, _, value = line[len(name) + 1:].rpartition('} ')
+            pairs = (pair.partition('=') for pair in labels.split(','))
+            totals[tuple((label, quoted.strip('"')) for label, _, quoted in pairs)] = float(value)
+    return totals
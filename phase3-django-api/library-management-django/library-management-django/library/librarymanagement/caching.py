@@ -0,0 +1,143 @@
+"""
+Generation-based invalidation for cached API responses.
+
+Cached responses are keyed by generation numbers kept in the cache, so a write
+only has to bump the generations it affects: keys built from the old numbers
+are never read again and simply expire. Every model has
+
+- a model generation, bumped by writes that may touch any of its rows (bulk
+  imports, generated data); every response built from the model depends on it,
+- a generation per row, and one for "some row changed", both bumped by
+  ``bump_rows()``. A detail response depends on its own row's generation; a
+  list, search or other multi-row response depends on the "rows" one.
+
+So a borrow, which changes one Book row, drops the book lists and that book's
+detail response, while the other books' detail responses stay cached.
+Generations are bumped on commit by the signal handlers in ``signals.py`` and
+by code that writes with ``update()`` or bulk operations (see
+``circulation.py``).
+
+Generations bumped within READ_YOUR_WRITES_SECONDS are rebuilt from the
+primary rather than from a replica that may not have the write yet.
+
+RESPONSE_CACHE_ALIAS defaults to the file-based cache every worker on the
+host shares, so a write in one worker invalidates the others' entries too.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from . import metrics, routers
+
+metrics.registry.describe(
+    'library_response_cache_total', 'counter', 'Cached GET views served from the cache (hit) or built (miss), by route.',
+)
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'shared')]
+
+
+def cache_timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+
+ROWS = 'rows'
+
+
+def _generation_key(model, scope=None):
+    key = f'gen:{model._meta.label_lower}'
+    return key if scope is None else f'{key}:{scope}'
+
+
+def generation_keys(models, row=None):
+    """
+    The generations a response built from ``models`` depends on; ``row`` is
+    ``(model, pk)`` when it renders that one row rather than a list.
+    """
+    keys = []
+    for model in models:
+        keys.append(_generation_key(model))
+        if row is None or model is not row[0]:
+            keys.append(_generation_key(model, ROWS))
+    if row is not None:
+        if row[0] not in models:
+            keys.append(_generation_key(row[0]))
+        keys.append(_generation_key(*row))
+    return keys
+
+
+def generations(keys):
+    cache = get_cache()
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Start from the clock rather than 1 so a generation that was
+            # evicted can never come back with a number that was used before.
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bumped_at_key(key):
+    return f'{key}:at'
+
+
+def bump_keys(keys):
+    """Move generations ``keys`` on, and note when for ``bumped_recently()``."""
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    window = routers.read_your_writes_seconds()
+    cache.set_many({_bumped_at_key(key): time.time() for key in keys}, window + 1)
+
+
+def bumped_recently(keys):
+    """
+    True if any of generations ``keys`` moved within READ_YOUR_WRITES_SECONDS:
+    a replica may not have the write behind it yet, and anything read from
+    one would be cached under the new generation.
+    """
+    since = time.time() - routers.read_your_writes_seconds()
+    stamps = get_cache().get_many([_bumped_at_key(key) for key in keys])
+    return any(stamp > since for stamp in stamps.values())
+
+
+def bump(*models):
+    """Invalidate every response built from ``models``."""
+    bump_keys([_generation_key(model) for model in models])
+
+
+def bump_rows(model, pks):
+    """Invalidate the responses showing rows ``pks`` of ``model``: its lists and those rows' details."""
+    bump_keys([_generation_key(model, ROWS)] + [_generation_key(model, pk) for pk in pks])
+
+
+def bump_on_commit(*models):
+    transaction.on_commit(lambda: bump(*models))
+
+
+def bump_rows_on_commit(model, pks):
+    pks = list(pks)
+    transaction.on_commit(lambda: bump_rows(model, pks))
+
+
+def response_key(request, view_name, models, row=None):
+    params = sorted(request.query_params.lists())
+    parts = [
+        view_name, request.get_host(), request.path, repr(params),
+        *map(str, generations(generation_keys(models, row))),
+    ]
+    return 'resp:' + hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def record(request, outcome):
+    match = request.resolver_match
+    route = (match.url_name or match.view_name) if match else 'unmatched'
+    metrics.registry.inc('library_response_cache_total', (('route', route), ('outcome', outcome)))
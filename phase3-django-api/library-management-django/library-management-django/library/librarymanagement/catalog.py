@@ -0,0 +1,268 @@
+"""
+Bulk insert-or-update of books keyed by ISBN, behind BookBulkUpsertAPIView.
+
+A batch costs a fixed number of queries whatever its size: one each to
+resolve the referenced authors, categories and libraries, one
+``SELECT ... FOR UPDATE`` for the books that already exist, one
+``bulk_create`` and one ``bulk_update``, and for each link table one read
+of the current links plus one DELETE and one INSERT for the books whose
+links changed. A batch that races another inserting the same ISBN is
+rerun (see ``upsert_books``).
+
+None of this goes through ``save()`` or the m2m managers, so the model
+signals do not fire; the search index, response caches, availability map and
+statistics counters are updated here instead, on commit.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+
+from . import availability, caching, search, statistics
+from .models import Library, Book, Author, Category, BookAuthor, BookCategory
+from .serializers import BookUpsertSerializer
+
+BATCH_SIZE = 1000
+
+# Times a batch is rerun after losing a race to insert the same new ISBN.
+CONFLICT_RETRIES = 2
+CONFLICT_MESSAGE = 'conflicts with a concurrent write of the same books; not applied'
+
+BOOK_FIELDS = ('title', 'publication_date', 'total_copies', 'available_copies', 'library')
+
+
+def _error(code, message):
+    return {'status': code, 'error': message}
+
+
+def _existing_ids(model, ids):
+    return set(model.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+
+
+def _unknown_references(row, authors, categories, libraries):
+    missing = []
+    for key, known in (('author_ids', authors), ('category_ids', categories)):
+        unknown = sorted(set(row.get(key, ())) - known)
+        if unknown:
+            missing.append(f"{key} {unknown}")
+    if row.get('library_id') is not None and row['library_id'] not in libraries:
+        missing.append(f"library_id {row['library_id']}")
+    return 'unknown ' + ', '.join(missing) if missing else None
+
+
+def _apply(book, row):
+    """Copy ``row`` onto an existing book; returns the changed fields or an error dict."""
+    changed = [
+        field for field in ('title', 'publication_date', 'library_id')
+        if field in row and getattr(book, field) != row[field]
+    ]
+    total = row.get('total_copies', book.total_copies or 0)
+    if 'available_copies' in row:
+        available = row['available_copies']
+    else:
+        # Copies added or withdrawn; the ones on loan stay on loan.
+        available = (book.available_copies or 0) + total - (book.total_copies or 0)
+    if available > total:
+        return _error(status.HTTP_400_BAD_REQUEST, 'available_copies cannot exceed total_copies')
+    if available < 0:
+        on_loan = (book.total_copies or 0) - (book.available_copies or 0)
+        return _error(status.HTTP_409_CONFLICT, f'{on_loan} copies are on loan; total_copies cannot be {total}')
+    for field in changed:
+        setattr(book, field, row[field])
+    for field, value in (('total_copies', total), ('available_copies', available)):
+        if getattr(book, field) != value:
+            setattr(book, field, value)
+            changed.append(field)
+    return changed
+
+
+def _replace_links(through, column, wanted, now):
+    """Make the links of each book in ``wanted`` (book_id -> ids) exactly those ids; returns relinked books."""
+    if not wanted:
+        return []
+    current = defaultdict(set)
+    for book_id, linked_id in through.objects.filter(book_id__in=wanted).values_list('book_id', column):
+        current[book_id].add(linked_id)
+    relinked = [book_id for book_id, ids in wanted.items() if current[book_id] != ids]
+    if relinked:
+        through.objects.filter(book_id__in=relinked).delete()
+        through.objects.bulk_create(
+            [
+                through(book_id=book_id, created_at=now, updated_at=now, **{column: linked_id})
+                for book_id in relinked for linked_id in sorted(wanted[book_id])
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    return relinked
+
+
+def _refresh_search(books, relinked):
+    if search.loaded_index() is None:
+        return
+    for book_id, (title, library_id) in books.items():
+        search.apply_update('update_book', book_id, title, library_id)
+    search.apply_update('refresh_links', relinked)
+
+
+def validate_rows(rows):
+    """
+    Validate raw rows against BookUpsertSerializer; returns ``(valid, errors)``
+    as ``[(index, validated_data)]`` and ``{index: errors}``. One serializer
+    instance checks every row, so its fields are built (deep-copied) once
+    rather than once per row.
+    """
+    serializer = BookUpsertSerializer()
+    valid, errors = [], {}
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, serializer.run_validation(row)))
+        except serializers.ValidationError as exc:
+            errors[index] = exc.detail
+    return valid, errors
+
+
+def upsert_books(rows):
+    """
+    Insert or update books from ``rows``, the ``(index, validated_data)``
+    pairs ``validate_rows`` returns; ``index`` is the row's position in the
+    caller's input and is what messages refer to. A key missing from a row
+    leaves that field, or those links, of an existing book untouched.
+    Returns ``{index: result}``: ``{'status': 201 or 200, 'id': book_id}`` or
+    ``{'status': 4xx, 'error': message}``.
+
+    A new ISBN can be inserted by a concurrent batch after this one looked
+    it up. The batch is then rolled back and run again, up to
+    CONFLICT_RETRIES times, so that row becomes an update. Rows of a batch
+    that keeps conflicting get 409. A batch the database rejects for any
+    other reason (a library deleted meanwhile, a NULL it does not allow) is
+    run again one row at a time, and only the rows it rejects get 400.
+    """
+    results = {}
+    first_row = {}
+    for index, row in rows:
+        if row['isbn'] in first_row:
+            results[index] = _error(status.HTTP_400_BAD_REQUEST, f"duplicate of row {first_row[row['isbn']]}")
+        else:
+            first_row[row['isbn']] = index
+
+    pending = [(index, row) for index, row in rows if index not in results]
+    authors = _existing_ids(Author, {i for _, row in pending for i in row.get('author_ids', ())})
+    categories = _existing_ids(Category, {i for _, row in pending for i in row.get('category_ids', ())})
+    libraries = _existing_ids(Library, {row.get('library_id') for _, row in pending} - {None})
+    for index, row in pending:
+        unknown = _unknown_references(row, authors, categories, libraries)
+        if unknown:
+            results[index] = _error(status.HTTP_400_BAD_REQUEST, unknown)
+    pending = [(index, row) for index, row in pending if index not in results]
+
+    for attempt in range(CONFLICT_RETRIES + 1):
+        if not pending:
+            break
+        try:
+            with transaction.atomic():
+                results.update(_write_books(pending))
+            break
+        except IntegrityError as exc:
+            if not _is_isbn_conflict(exc):
+                results.update(_write_each(pending))
+                break
+            if attempt == CONFLICT_RETRIES:
+                for index, _ in pending:
+                    results[index] = _error(status.HTTP_409_CONFLICT, CONFLICT_MESSAGE)
+    return results
+
+
+def _is_isbn_conflict(exc):
+    """True if ``exc`` is a duplicate key on Book.isbn (MySQL or SQLite wording)."""
+    message = str(exc)
+    return 'isbn' in message.lower() and ('Duplicate entry' in message or 'UNIQUE constraint' in message)
+
+
+def _write_each(rows):
+    """Apply ``(index, data)`` rows one per savepoint; returns ``{index: result}``."""
+    results = {}
+    for index, row in rows:
+        try:
+            with transaction.atomic():
+                results.update(_write_books([(index, row)]))
+        except IntegrityError as exc:
+            if _is_isbn_conflict(exc):
+                results[index] = _error(status.HTTP_409_CONFLICT, CONFLICT_MESSAGE)
+            else:
+                results[index] = _error(status.HTTP_400_BAD_REQUEST, f'rejected by the database: {exc}')
+    return results
+
+
+def _write_books(rows):
+    """Apply ``(index, data)`` rows in the current transaction; returns ``{index: result}``."""
+    now = timezone.now()
+    results = {}
+    existing = {
+        book.isbn: book for book in
+        Book.objects.select_for_update().filter(isbn__in=[row['isbn'] for _, row in rows])
+        .only('id', 'isbn', *BOOK_FIELDS).order_by('id')
+    }
+    created, updated, update_fields, restocked = [], [], set(), []
+    books = {}   # row index -> (Book, row)
+    for index, row in rows:
+        book = existing.get(row['isbn'])
+        if book is None:
+            if not row.get('title'):
+                results[index] = _error(status.HTTP_400_BAD_REQUEST, 'title is required for new books')
+                continue
+            total = row.get('total_copies', 0)
+            available = row.get('available_copies', total)
+            if available > total:
+                results[index] = _error(status.HTTP_400_BAD_REQUEST, 'available_copies cannot exceed total_copies')
+                continue
+            book = Book(
+                isbn=row['isbn'], title=row['title'], publication_date=row.get('publication_date'),
+                total_copies=total, available_copies=available, library_id=row.get('library_id'),
+                created_at=now, updated_at=now,
+            )
+            created.append(book)
+            results[index] = {'status': status.HTTP_201_CREATED}
+        else:
+            changed = _apply(book, row)
+            if isinstance(changed, dict):
+                results[index] = changed
+                continue
+            if changed:
+                book.updated_at = now
+                updated.append(book)
+                update_fields.update(changed)
+                if 'available_copies' in changed:
+                    restocked.append(book.id)
+            results[index] = {'status': status.HTTP_200_OK}
+        books[index] = (book, row)
+
+    if created:
+        Book.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        if created[0].pk is None:
+            # MySQL does not return ids from a multi-row INSERT; ISBNs are unique.
+            ids = dict(Book.objects.filter(isbn__in=[book.isbn for book in created]).values_list('isbn', 'id'))
+            for book in created:
+                book.pk = ids[book.isbn]
+        statistics.increment(total_books=len(created))
+    if updated:
+        fields = sorted('library' if field == 'library_id' else field for field in update_fields)
+        Book.objects.bulk_update(updated, fields + ['updated_at'], batch_size=BATCH_SIZE)
+
+    links = {}
+    for through, column, key in ((BookAuthor, 'author_id', 'author_ids'), (BookCategory, 'category_id', 'category_ids')):
+        wanted = {book.id: set(row[key]) for book, row in books.values() if key in row}
+        links[through] = _replace_links(through, column, wanted, now)
+
+    for index, (book, _) in books.items():
+        results[index]['id'] = book.id
+
+    if created or updated or any(links.values()):
+        caching.bump_on_commit(Book, Author, Category)
+        relinked = set(links[BookAuthor]) | set(links[BookCategory])
+        touched = {book.id for book in created} | {book.id for book in updated} | relinked
+        search_books = {book.id: (book.title, book.library_id) for book, _ in books.values() if book.id in touched}
+        transaction.on_commit(lambda: _refresh_search(search_books, relinked))
+    if restocked:
+        availability.invalidate_on_commit(*restocked)
+    return results
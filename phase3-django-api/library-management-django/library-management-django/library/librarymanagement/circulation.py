@@ -0,0 +1,232 @@
+"""
+Borrow and return transactions.
+
+Both operations are a single conditional UPDATE on the Book row plus the
+Borrowing INSERT/UPDATE, inside one transaction:
+
+    borrow:  UPDATE Book SET available_copies = available_copies - 1
+             WHERE book_id = %s AND available_copies > 0;
+             INSERT INTO Borrowing ...;
+
+    return:  UPDATE Borrowing SET return_date = %s, late_fee = %s
+             WHERE borrowing_id = %s AND return_date IS NULL;
+             UPDATE Book SET available_copies = available_copies + 1 ...;
+
+The database decides availability, so two members can never both take the
+last copy: the second UPDATE waits on the first one's row lock and, once it
+commits, matches zero rows. Contention is therefore per book row and lasts
+for one INSERT after the decrement. The decrement runs before the INSERT on
+purpose: on InnoDB the INSERT's foreign-key check takes a shared lock on the
+Book row, and taking that before the exclusive lock would let two concurrent
+borrows deadlock on the upgrade.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import availability, caching, fees, statistics
+from .models import Book, Member, Borrowing
+
+
+class CirculationError(Exception):
+    status_code = 400
+
+
+class NotFound(CirculationError):
+    status_code = 404
+
+
+class BookUnavailable(CirculationError):
+    pass
+
+
+class AlreadyReturned(CirculationError):
+    pass
+
+
+def borrow_book(book_id, member_id, days=14):
+    try:
+        member = Member.objects.only('id', 'first_name', 'last_name').get(id=member_id)
+    except Member.DoesNotExist:
+        raise NotFound('Member not found')
+
+    now = timezone.now()
+    borrow_date = timezone.localdate(now)
+    with transaction.atomic():
+        taken = Book.objects.filter(id=book_id, available_copies__gt=0).update(
+            available_copies=F('available_copies') - 1, borrow_count=F('borrow_count') + 1
+        )
+        if not taken:
+            if Book.objects.filter(id=book_id).exists():
+                raise BookUnavailable('Book not available')
+            raise NotFound('Book not found')
+        borrowing = Borrowing.objects.create(
+            book_id=book_id,
+            member=member,
+            borrow_date=borrow_date,
+            due_date=borrow_date + timedelta(days=days),
+            created_at=now,
+            updated_at=now,
+        )
+        # active_borrowings is counted, and the Borrowing's cache generation
+        # bumped, by the Borrowing post_save handlers.
+        caching.bump_rows_on_commit(Book, [book_id])
+        availability.invalidate_on_commit(book_id)
+    return borrowing
+
+
+def return_book(borrowing_id):
+    try:
+        borrowing = Borrowing.objects.select_related('member').get(id=borrowing_id)
+    except Borrowing.DoesNotExist:
+        raise NotFound('Borrowing not found')
+    if borrowing.return_date is not None:
+        raise AlreadyReturned('Book already returned')
+
+    now = timezone.now()
+    return_date = timezone.localdate(now)
+    late_fee = fees.late_fee(borrowing.due_date, return_date)
+    with transaction.atomic():
+        closed = Borrowing.objects.filter(id=borrowing.id, return_date__isnull=True).update(
+            return_date=return_date, late_fee=late_fee, updated_at=now
+        )
+        if not closed:
+            raise AlreadyReturned('Book already returned')
+        Book.objects.filter(
+            id=borrowing.book_id, available_copies__lt=F('total_copies')
+        ).update(available_copies=F('available_copies') + 1)
+        statistics.increment(active_borrowings=-1)
+        caching.bump_rows_on_commit(Book, [borrowing.book_id])
+        caching.bump_rows_on_commit(Borrowing, [borrowing.id])
+        availability.invalidate_on_commit(borrowing.book_id)
+
+    borrowing.return_date = return_date
+    borrowing.late_fee = late_fee
+    borrowing.updated_at = now
+    return borrowing
+
+
+def borrow_books(items, days=14):
+    """
+    Borrow many books at once. ``items`` is a list of ``(book_id, member_id)``
+    pairs; returns a list with a Borrowing or a CirculationError per item.
+
+    Members are read in one query and the books are locked with one
+    ``SELECT ... FOR UPDATE``; copies are then allocated in request order and
+    written back with one ``bulk_update`` and one ``bulk_create``.
+    """
+    results = [None] * len(items)
+    members = Member.objects.only('id', 'first_name', 'last_name').in_bulk(
+        {member_id for _, member_id in items}
+    )
+    now = timezone.now()
+    borrow_date = timezone.localdate(now)
+    due_date = borrow_date + timedelta(days=days)
+
+    with transaction.atomic():
+        books = {
+            book.id: book for book in
+            Book.objects.select_for_update().filter(id__in={book_id for book_id, _ in items}).order_by('id')
+        }
+        changed = {}
+        new_borrowings = []
+        for i, (book_id, member_id) in enumerate(items):
+            book = books.get(book_id)
+            member = members.get(member_id)
+            if book is None:
+                results[i] = NotFound('Book not found')
+            elif member is None:
+                results[i] = NotFound('Member not found')
+            elif (book.available_copies or 0) <= 0:
+                results[i] = BookUnavailable('Book not available')
+            else:
+                book.available_copies -= 1
+                book.borrow_count += 1
+                changed[book.id] = book
+                borrowing = Borrowing(
+                    book=book, member=member, borrow_date=borrow_date, due_date=due_date,
+                    created_at=now, updated_at=now,
+                )
+                new_borrowings.append(borrowing)
+                results[i] = borrowing
+
+        if new_borrowings:
+            Book.objects.bulk_update(changed.values(), ['available_copies', 'borrow_count'])
+            Borrowing.objects.bulk_create(new_borrowings)
+            if new_borrowings[0].pk is None:
+                _assign_inserted_ids(new_borrowings, books.keys())
+            statistics.increment(active_borrowings=len(new_borrowings))
+            caching.bump_rows_on_commit(Book, changed)
+            caching.bump_rows_on_commit(Borrowing, [borrowing.pk for borrowing in new_borrowings])
+            availability.invalidate_on_commit(*changed)
+    return results
+
+
+def _assign_inserted_ids(borrowings, book_ids):
+    # MySQL does not return ids from a multi-row INSERT. While we hold the
+    # Book row locks nobody else can insert a Borrowing for these books (the
+    # foreign-key check needs a lock on the same rows), so the newest rows for
+    # them are exactly ours, numbered in insertion order.
+    ids = Borrowing.objects.filter(book_id__in=book_ids).order_by('-id').values_list('id', flat=True)
+    for borrowing, pk in zip(borrowings, sorted(ids[:len(borrowings)])):
+        borrowing.pk = pk
+
+
+def return_books(borrowing_ids):
+    """
+    Return many borrowings at once; returns a Borrowing or a CirculationError
+    per requested id. Uses a constant number of queries for any batch size,
+    plus one UPDATE per distinct late fee among the returned loans.
+    """
+    results = [None] * len(borrowing_ids)
+    now = timezone.now()
+    return_date = timezone.localdate(now)
+
+    with transaction.atomic():
+        borrowings = {
+            borrowing.id: borrowing for borrowing in
+            Borrowing.objects.select_for_update(of=('self',)).select_related('member')
+            .filter(id__in=set(borrowing_ids)).order_by('id')
+        }
+        returned_per_book = {}
+        closing = []
+        for i, borrowing_id in enumerate(borrowing_ids):
+            borrowing = borrowings.get(borrowing_id)
+            if borrowing is None:
+                results[i] = NotFound('Borrowing not found')
+            elif borrowing.return_date is not None:
+                results[i] = AlreadyReturned('Book already returned')
+            else:
+                borrowing.return_date = return_date
+                borrowing.late_fee = fees.late_fee(borrowing.due_date, return_date)
+                borrowing.updated_at = now
+                returned_per_book[borrowing.book_id] = returned_per_book.get(borrowing.book_id, 0) + 1
+                closing.append(borrowing.id)
+                results[i] = borrowing
+
+        if closing:
+            for late_fee, due_dates in fees.group_by_fee(
+                {borrowings[borrowing_id].due_date for borrowing_id in closing}, return_date
+            ).items():
+                Borrowing.objects.filter(id__in=closing, due_date__in=due_dates).update(
+                    return_date=return_date, late_fee=late_fee, updated_at=now
+                )
+            books = {
+                book.id: book for book in
+                Book.objects.select_for_update().filter(id__in=returned_per_book).order_by('id')
+            }
+            for book in books.values():
+                book.available_copies = min(
+                    (book.available_copies or 0) + returned_per_book[book.id], book.total_copies or 0
+                )
+            Book.objects.bulk_update(books.values(), ['available_copies'])
+            statistics.increment(active_borrowings=-len(closing))
+            caching.bump_rows_on_commit(Book, books)
+            caching.bump_rows_on_commit(Borrowing, closing)
+            availability.invalidate_on_commit(*books)
+            for borrowing in results:
+                if isinstance(borrowing, Borrowing) and borrowing.book_id in books:
+                    borrowing.book = books[borrowing.book_id]
+    return results
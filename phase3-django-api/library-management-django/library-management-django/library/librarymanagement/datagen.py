@@ -0,0 +1,432 @@
+"""
+Synthetic library data at any scale.
+
+``generate(scale, sink)`` produces libraries, authors, categories, members,
+books (with their author and category links), borrowings and reviews. On
+a given day the same ``scale`` always produces the same rows (dates are
+relative to today).
+
+- Book popularity follows a Zipf distribution (exponent ``scale.zipf``) over
+  a shuffled ranking, and popular books get more copies. Member activity is
+  skewed the same way, more gently.
+- Borrow dates cover the last ``scale.days`` days, fewer at weekends and in
+  the summer, and borrowing ids increase with the borrow date as they would
+  in production. Loans run 14 days for students and 28 for faculty. Most
+  are returned on time, some late (with the late fee from ``fees.py``) and
+  the most recent ones are still open. A loan only stays open while its book
+  has a free copy, so ``available_copies = total_copies - open loans`` holds
+  for every book. Concurrency in the past is not modelled.
+- Reviews come from a sample of returned loans, at most one per member and
+  book.
+
+Rows are streamed to a sink in batches, so memory stays proportional to the
+number of books and members rather than borrowings. ``CsvSink`` writes one
+file per table plus a ``load.sql`` for ``LOAD DATA``; ``DatabaseSink``
+inserts with ``bulk_create`` after the existing rows.
+"""
+import csv
+import itertools
+import os
+import random
+from array import array
+from bisect import bisect
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+
+from . import caching, fees, search, statistics
+from .models import Library, Book, Author, Category, Member, Borrowing, Review, BookAuthor, BookCategory
+
+FIRST_NAMES = (
+    'Alice', 'Bob', 'Carmen', 'David', 'Elena', 'Farid', 'Grace', 'Hiro', 'Ines', 'James', 'Kofi', 'Lena',
+    'Mateo', 'Nadia', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sven', 'Tara', 'Umar', 'Vera', 'Wei', 'Yara', 'Zane',
+)
+LAST_NAMES = (
+    'Adams', 'Brown', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jones', 'Khan', 'Lopez',
+    'Moreau', 'Nguyen', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Usman', 'Virtanen', 'Walker', 'Young',
+)
+NATIONALITIES = ('American', 'British', 'Canadian', 'French', 'German', 'Indian', 'Japanese', 'Nigerian', 'Spanish')
+SUBJECTS = (
+    'Fiction', 'Science', 'History', 'Mystery', 'Fantasy', 'Biography', 'Philosophy', 'Poetry', 'Mathematics',
+    'Engineering', 'Medicine', 'Law', 'Economics', 'Art', 'Music', 'Travel', 'Cooking', 'Psychology',
+    'Computer Science', 'Romance', 'Horror', 'Politics', 'Religion', 'Education', 'Sports',
+)
+PLACES = ('Central', 'Science', 'Arts', 'Medical', 'Law', 'Engineering', 'Music', 'North', 'South', 'East', 'West')
+ADJECTIVES = (
+    'Silent', 'Broken', 'Hidden', 'Golden', 'Last', 'Lost', 'Crimson', 'Distant', 'Quiet', 'Burning', 'Frozen',
+    'Secret', 'Endless', 'Wild', 'Forgotten', 'Bright', 'Dark', 'Little', 'Great', 'Strange',
+)
+NOUNS = (
+    'River', 'Garden', 'Empire', 'Winter', 'Shadow', 'Harbor', 'Forest', 'Kingdom', 'Letters', 'Orchard',
+    'Storm', 'Station', 'Mountain', 'Island', 'Machine', 'Theory', 'History', 'Voyage', 'Crown', 'Mirror',
+)
+COMMENTS = (None, None, 'Loved it', 'Not for me', 'Great for coursework', 'Hard to put down', 'Too long',
+            'Recommended', 'Dense but rewarding', 'Solid introduction')
+RATING_WEIGHTS = (5, 8, 20, 35, 32)
+
+STUDENT_LOAN_DAYS = 14
+FACULTY_LOAN_DAYS = 28
+
+
+@dataclass
+class Scale:
+    libraries: int = 5
+    authors: int = 2000
+    categories: int = 25
+    books: int = 10000
+    members: int = 5000
+    borrowings: int = 100000
+    reviews: int = 10000
+    days: int = 3 * 365
+    zipf: float = 1.1
+    seed: int = 42
+
+    @classmethod
+    def proportional(cls, books, members, seed=42):
+        """A scale sized around ``books`` and ``members`` with matching circulation."""
+        borrowings = books * 5 if members else 0
+        return cls(
+            libraries=max(1, books // 20000), authors=max(1, books // 5), categories=min(len(SUBJECTS), 25),
+            books=books, members=members, borrowings=borrowings, reviews=borrowings // 10, seed=seed,
+        )
+
+
+# Columns written per model, in load order.
+TABLES = (
+    (Library, ('id', 'name', 'campus_location', 'contact_email', 'phone_number', 'created_at', 'updated_at')),
+    (Author, ('id', 'first_name', 'last_name', 'birth_date', 'nationality', 'biography', 'created_at', 'updated_at')),
+    (Category, ('id', 'name', 'description', 'created_at', 'updated_at')),
+    (Member, ('id', 'first_name', 'last_name', 'email', 'phone', 'member_type', 'registration_date',
+              'created_at', 'updated_at')),
+    (Book, ('id', 'title', 'isbn', 'publication_date', 'total_copies', 'available_copies', 'library_id',
+            'borrow_count', 'rating_count', 'rating_sum', 'average_rating', 'created_at', 'updated_at')),
+    (BookAuthor, ('book_id', 'author_id', 'created_at', 'updated_at')),
+    (BookCategory, ('book_id', 'category_id', 'created_at', 'updated_at')),
+    (Borrowing, ('id', 'member_id', 'book_id', 'borrow_date', 'due_date', 'return_date', 'late_fee',
+                 'created_at', 'updated_at')),
+    (Review, ('id', 'member_id', 'book_id', 'rating', 'comment', 'review_date', 'created_at', 'updated_at')),
+)
+COLUMNS = dict(TABLES)
+
+
+def _unique_name(names, index):
+    """``names[index]``, then ``names[i] 2``, ``names[i] 3``... once the list runs out."""
+    base = names[index % len(names)]
+    round_ = index // len(names)
+    return base if round_ == 0 else f'{base} {round_ + 1}'
+
+
+def _zipf_sampler(n, exponent, rng):
+    """Return ``sample(rng) -> index in range(n)`` with Zipf-distributed popularity."""
+    ranking = list(range(n))
+    rng.shuffle(ranking)
+    cumulative = list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+    total = cumulative[-1]
+
+    def sample(random_):
+        return ranking[bisect(cumulative, random_() * total, 0, n - 1)]
+
+    return sample, ranking
+
+
+def _day_sampler(first_day, days):
+    """Map a position in [0, 1) to a day, weighting weekdays and term time."""
+    weights = []
+    for offset in range(days):
+        day = date.fromordinal(first_day + offset)
+        weight = 0.4 if day.weekday() >= 5 else 1.0
+        if day.month in (7, 8):
+            weight *= 0.5
+        weights.append(weight)
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+
+    def day_at(position):
+        return first_day + bisect(cumulative, position * total, 0, days - 1)
+
+    return day_at
+
+
+class _Batcher:
+    def __init__(self, sink, model, size):
+        self.sink, self.model, self.size = sink, model, size
+        self.rows = []
+        self.written = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.sink.write(self.model, self.rows)
+            self.written += len(self.rows)
+            self.rows = []
+
+
+def generate(scale, sink, batch_size=5000, progress=None):
+    """
+    Stream the data for ``scale`` into ``sink``. Returns ``{table: rows}``.
+    ``progress(table, rows_so_far)`` is called after every batch of borrowings.
+    """
+    rng = random.Random(scale.seed)
+    ids = sink.first_ids()
+    today = date.today()
+    today_ord = today.toordinal()
+    first_day = today_ord - scale.days
+    stamp = sink.timestamp(datetime.combine(date.fromordinal(first_day), datetime.min.time()))
+    counts = {}
+
+    def emit(model, rows):
+        batch = _Batcher(sink, model, batch_size)
+        for row in rows:
+            batch.add(row)
+        batch.flush()
+        counts[model._meta.db_table] = counts.get(model._meta.db_table, 0) + batch.written
+
+    library_ids = range(ids[Library], ids[Library] + scale.libraries)
+    emit(Library, (
+        (library_id, _unique_name(PLACES, library_id - 1) + ' Library',
+         f'{PLACES[(library_id - 1) % len(PLACES)]} Campus', f'library{library_id}@univ.edu',
+         f'555{library_id:07d}', stamp, stamp)
+        for library_id in library_ids
+    ))
+
+    author_ids = range(ids[Author], ids[Author] + scale.authors)
+    names = len(FIRST_NAMES) * len(LAST_NAMES)
+    # First/last name and birth date are derived from the id so that the
+    # (first_name, last_name, birth_date) unique key can never collide.
+    emit(Author, (
+        (author_id, FIRST_NAMES[author_id % len(FIRST_NAMES)],
+         LAST_NAMES[(author_id // len(FIRST_NAMES)) % len(LAST_NAMES)],
+         date(1900, 1, 1) + timedelta(days=(author_id // names) % 36500),
+         NATIONALITIES[author_id % len(NATIONALITIES)], None, stamp, stamp)
+        for author_id in author_ids
+    ))
+
+    category_ids = range(ids[Category], ids[Category] + scale.categories)
+    emit(Category, (
+        (category_id, _unique_name(SUBJECTS, category_id - 1), None, stamp, stamp)
+        for category_id in category_ids
+    ))
+
+    member_rng = random.Random(f'{scale.seed}-members')
+    member_ids = range(ids[Member], ids[Member] + scale.members)
+    faculty = array('b', (member_rng.random() < 0.15 for _ in member_ids))
+    emit(Member, (
+        (member_id, member_rng.choice(FIRST_NAMES), member_rng.choice(LAST_NAMES), f'member{member_id}@univ.edu',
+         f'555{member_id:07d}'[:20], 'faculty' if faculty[n] else 'student',
+         date.fromordinal(first_day - member_rng.randrange(4 * 365)), stamp, stamp)
+        for n, member_id in enumerate(member_ids)
+    ))
+
+    # Copies depend on popularity rank: the top 1% get 6-12, the next 10% 3-6.
+    book_ids = range(ids[Book], ids[Book] + scale.books)
+    sample_book, ranking = _zipf_sampler(scale.books, scale.zipf, rng) if scale.books else (None, [])
+    total_copies = array('H', [0] * scale.books)
+    for rank, n in enumerate(ranking):
+        if rank < scale.books // 100:
+            total_copies[n] = rng.randint(6, 12)
+        elif rank < scale.books // 10:
+            total_copies[n] = rng.randint(3, 6)
+        else:
+            total_copies[n] = rng.randint(1, 3)
+    open_loans = array('H', [0] * scale.books)
+    borrow_counts = array('I', [0] * scale.books)
+    rating_counts = array('I', [0] * scale.books)
+    rating_sums = array('I', [0] * scale.books)
+
+    def book_rows(final):
+        # Re-seeded on every call so the initial and final passes agree.
+        book_rng = random.Random(f'{scale.seed}-books')
+        for n, book_id in enumerate(book_ids):
+            title = (
+                f'The {book_rng.choice(ADJECTIVES)} {book_rng.choice(NOUNS)}' if book_rng.random() < 0.6
+                else f'{book_rng.choice(NOUNS)} of the {book_rng.choice(ADJECTIVES)} {book_rng.choice(NOUNS)}'
+            )
+            published = date.fromordinal(book_rng.randint(date(1900, 1, 1).toordinal(), today_ord))
+            library_id = library_ids[book_rng.randrange(scale.libraries)] if scale.libraries else None
+            available = total_copies[n] - open_loans[n] if final else total_copies[n]
+            ratings = (rating_counts[n], rating_sums[n]) if final else (0, 0)
+            average = (Decimal(ratings[1]) / ratings[0]).quantize(fees.CENT, ROUND_HALF_UP) if ratings[0] else None
+            yield (book_id, title, f'979{book_id:010d}', published, total_copies[n], available, library_id,
+                   borrow_counts[n] if final else 0, *ratings, average, stamp, stamp)
+
+    if sink.parents_first:
+        emit(Book, book_rows(final=False))
+
+    link_rng = random.Random(f'{scale.seed}-links')
+    book_authors, book_categories = [], []
+    for book_id in book_ids:
+        how_many = 1 if link_rng.random() < 0.8 else (2 if link_rng.random() < 0.85 else 3)
+        for author_id in link_rng.sample(author_ids, min(how_many, scale.authors)):
+            book_authors.append((book_id, author_id, stamp, stamp))
+        for category_id in link_rng.sample(category_ids, min(1 if link_rng.random() < 0.7 else 2, scale.categories)):
+            book_categories.append((book_id, category_id, stamp, stamp))
+        if len(book_authors) >= batch_size:
+            emit(BookAuthor, book_authors)
+            emit(BookCategory, book_categories)
+            book_authors, book_categories = [], []
+    emit(BookAuthor, book_authors)
+    emit(BookCategory, book_categories)
+
+    borrowings = _Batcher(sink, Borrowing, batch_size)
+    reviews = _Batcher(sink, Review, batch_size)
+    if scale.borrowings and scale.books and scale.members:
+        sample_member, _ = _zipf_sampler(scale.members, 0.6, rng)
+        day_at = _day_sampler(first_day, scale.days)
+        review_rate = min(1.0, scale.reviews / scale.borrowings * 1.2)
+        reviewed = set()
+        random_ = rng.random
+        next_review_id = ids[Review]
+        for n in range(scale.borrowings):
+            book = sample_book(random_)
+            member = sample_member(random_)
+            borrowed = day_at((n + random_()) / scale.borrowings)
+            due = borrowed + (FACULTY_LOAN_DAYS if faculty[member] else STUDENT_LOAN_DAYS)
+            roll = random_()
+            if roll < 0.78:
+                returned = borrowed + int(random_() * (due - borrowed + 1))
+            elif roll < 0.95:
+                returned = due + 1 + int(rng.expovariate(1 / 6))
+            else:
+                returned = due + 1 + int(rng.expovariate(1 / 40))
+            if returned > today_ord:
+                if open_loans[book] < total_copies[book]:
+                    open_loans[book] += 1
+                    returned = None
+                else:
+                    returned = rng.randint(borrowed, today_ord)
+            borrow_counts[book] += 1
+
+            borrow_day = date.fromordinal(borrowed)
+            return_day = date.fromordinal(returned) if returned is not None else None
+            late_fee = (
+                fees.late_fee(date.fromordinal(due), return_day) if returned is not None and returned > due
+                else Decimal('0.00')
+            )
+            created = sink.timestamp(datetime.combine(borrow_day, datetime.min.time()))
+            updated = sink.timestamp(datetime.combine(return_day, datetime.min.time())) if return_day else created
+            borrowings.add((ids[Borrowing] + n, member_ids[member], book_ids[book], borrow_day,
+                            date.fromordinal(due), return_day, late_fee, created, updated))
+
+            if (returned is not None and next_review_id - ids[Review] < scale.reviews
+                    and random_() < review_rate):
+                pair = book * scale.members + member
+                if pair not in reviewed:
+                    reviewed.add(pair)
+                    rating = rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0]
+                    rating_counts[book] += 1
+                    rating_sums[book] += rating
+                    reviews.add((next_review_id, member_ids[member], book_ids[book],
+                                 rating, rng.choice(COMMENTS), return_day, updated, updated))
+                    next_review_id += 1
+            if progress and len(borrowings.rows) == 0:
+                progress('Borrowing', borrowings.written)
+    borrowings.flush()
+    reviews.flush()
+    counts['Borrowing'] = borrowings.written
+    counts['Review'] = reviews.written
+
+    if sink.parents_first:
+        sink.finish_books(book_ids)
+    else:
+        emit(Book, book_rows(final=True))
+    sink.close()
+    return counts
+
+
+class CsvSink:
+    """
+    One CSV file per table in ``directory`` plus ``load.sql``, which loads
+    them with ``LOAD DATA LOCAL INFILE`` in foreign-key order. Ids start at
+    1, so load into empty tables.
+    """
+    parents_first = False
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._files = {}
+
+    def first_ids(self):
+        return {model: 1 for model, _ in TABLES}
+
+    def timestamp(self, value):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+
+    def _path(self, model):
+        return os.path.join(self.directory, f'{model._meta.db_table}.csv')
+
+    def write(self, model, rows):
+        if model not in self._files:
+            handle = open(self._path(model), 'w', newline='')
+            writer = csv.writer(handle, lineterminator='\n')
+            writer.writerow(self._columns(model))
+            self._files[model] = (handle, writer)
+        _, writer = self._files[model]
+        writer.writerows(['\\N' if value is None else value for value in row] for row in rows)
+
+    def _columns(self, model):
+        return [model._meta.get_field(name).column for name in COLUMNS[model]]
+
+    def close(self):
+        for handle, _ in self._files.values():
+            handle.close()
+        statements = ['SET FOREIGN_KEY_CHECKS = 0;']
+        for model, _ in TABLES:
+            if model in self._files:
+                statements.append(
+                    f"LOAD DATA LOCAL INFILE '{os.path.abspath(self._path(model))}' INTO TABLE {model._meta.db_table}\n"
+                    f"  FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n'\n"
+                    f"  IGNORE 1 LINES ({', '.join(self._columns(model))});"
+                )
+        statements.append('SET FOREIGN_KEY_CHECKS = 1;')
+        with open(os.path.join(self.directory, 'load.sql'), 'w') as f:
+            f.write('\n'.join(statements) + '\n')
+
+
+class DatabaseSink:
+    """
+    Inserts with ``bulk_create``, numbering new rows after the current
+    maximum id of each table. Books are inserted before their borrowings and
+    ``available_copies``/``borrow_count`` are recomputed from the borrowings
+    at the end; the statistics counters are reconciled too.
+    """
+    parents_first = True
+
+    def first_ids(self):
+        return {
+            model: (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+            for model, columns in TABLES if columns[0] == 'id'
+        }
+
+    def timestamp(self, value):
+        return value.replace(tzinfo=dt_timezone.utc) if settings.USE_TZ else value
+
+    def write(self, model, rows):
+        names = COLUMNS[model]
+        with transaction.atomic():
+            model.objects.bulk_create([model(**dict(zip(names, row))) for row in rows])
+
+    def finish_books(self, book_ids, chunk_size=10000):
+        open_loans = (
+            Borrowing.objects.filter(book_id=OuterRef('id'), return_date__isnull=True)
+            .order_by().values('book_id').annotate(n=Count('*')).values('n')
+        )
+        for start in range(book_ids.start, book_ids.stop, chunk_size):
+            Book.objects.filter(id__gte=start, id__lt=min(start + chunk_size, book_ids.stop)).update(
+                available_copies=F('total_copies') - Coalesce(Subquery(open_loans, output_field=IntegerField()), 0)
+            )
+        statistics.reconcile(chunk_size=chunk_size)
+
+    def close(self):
+        search.reset_index()
+        caching.bump(Library, Book, Author, Category, Member, Borrowing, Review)
+
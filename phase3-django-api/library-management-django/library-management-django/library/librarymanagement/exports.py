@@ -0,0 +1,75 @@
+"""
+Streaming exports of whole tables as NDJSON or CSV.
+
+Rows are read in primary-key order in chunks of EXPORT_CHUNK_SIZE with
+``WHERE id > <last id> ORDER BY id LIMIT n``. ``QuerySet.iterator()`` only
+streams on backends with server-side cursors; MySQL's client library buffers
+the whole result set, so keyset chunks are what keep memory flat there.
+"""
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Book, Member, Borrowing, Review
+
+EXPORTS = {
+    'books': (Book, (
+        'id', 'title', 'isbn', 'publication_date', 'total_copies', 'available_copies',
+        'library_id', 'borrow_count', 'created_at', 'updated_at',
+    )),
+    'borrowings': (Borrowing, (
+        'id', 'member_id', 'book_id', 'borrow_date', 'due_date', 'return_date',
+        'late_fee', 'created_at', 'updated_at',
+    )),
+    'members': (Member, (
+        'id', 'first_name', 'last_name', 'email', 'phone', 'member_type',
+        'registration_date', 'created_at', 'updated_at',
+    )),
+    'reviews': (Review, (
+        'id', 'member_id', 'book_id', 'rating', 'comment', 'review_date',
+        'created_at', 'updated_at',
+    )),
+}
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_rows(model, fields, after=0, chunk_size=None):
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    last_id = after
+    while True:
+        rows = list(
+            model.objects.filter(id__gt=last_id).order_by('id').values_list(*fields)[:chunk_size]
+        )
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(fields, rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream(resource, fmt, after=0):
+    model, fields = EXPORTS[resource]
+    rows = iter_rows(model, fields, after=after)
+    return ndjson_lines(fields, rows) if fmt == 'ndjson' else csv_lines(fields, rows)
@@ -0,0 +1,95 @@
+"""
+Late fees.
+
+A loan accrues LATE_FEE_PER_DAY for every day past its due date (the same
+rule as the computed_late_fee column in phase1-sql/queries.sql), capped at
+what Borrowing.late_fee (DECIMAL(6,2)) can hold.
+
+The fee is written to ``Borrowing.late_fee`` in two places:
+
+- ``circulation.py`` sets the final fee when a loan is returned,
+- ``assess()`` (``python manage.py assess_late_fees``, run daily) brings the
+  fee of every open overdue loan up to date.
+
+``assess()`` walks the table in fixed primary-key windows. For each window
+it counts the overdue loans per due date and issues one UPDATE per distinct
+fee, skipping rows that already hold it, so a run never loads model
+instances, each UPDATE commits on its own, and a rerun (or a run resumed
+with ``start_id`` after an interruption) only touches rows still wrong.
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from . import caching
+from .models import Borrowing
+
+MAX_LATE_FEE = Decimal('9999.99')
+CENT = Decimal('0.01')
+
+
+def late_fee_per_day():
+    return Decimal(str(getattr(settings, 'LATE_FEE_PER_DAY', '0.50')))
+
+
+def days_overdue(due_date, as_of):
+    if due_date is None:
+        return 0
+    return max(0, (as_of - due_date).days)
+
+
+def late_fee(due_date, as_of):
+    """Fee accrued by ``as_of`` on a loan due on ``due_date``."""
+    fee = late_fee_per_day() * days_overdue(due_date, as_of)
+    return min(fee, MAX_LATE_FEE).quantize(CENT)
+
+
+def group_by_fee(due_dates, as_of):
+    """``{fee: [due_date, ...]}`` for the given due dates."""
+    groups = {}
+    for due_date in due_dates:
+        groups.setdefault(late_fee(due_date, as_of), []).append(due_date)
+    return groups
+
+
+def assess(as_of=None, chunk_size=10000, start_id=None, on_chunk=None):
+    """
+    Persist the current late fee of every open overdue borrowing.
+
+    Returns ``{'scanned', 'updated', 'last_id', 'elapsed'}``, where
+    ``scanned`` counts the open overdue loans checked (not the width of the id
+    windows, which gaps and returned loans leave mostly empty); ``on_chunk``
+    is called with the same dict after every window.
+    """
+    as_of = as_of or timezone.localdate()
+    open_overdue = Borrowing.objects.filter(return_date__isnull=True, due_date__lt=as_of)
+    bounds = Borrowing.objects.aggregate(first=Min('id'), last=Max('id'))
+    progress = {'scanned': 0, 'updated': 0, 'last_id': None, 'elapsed': 0.0}
+    if bounds['first'] is None:
+        return progress
+
+    started = time.perf_counter()
+    low = max(bounds['first'], start_id or 0)
+    while low <= bounds['last']:
+        high = low + chunk_size - 1
+        window = open_overdue.filter(id__gte=low, id__lte=high)
+        loans_due = dict(window.order_by().values_list('due_date').annotate(loans=Count('id')))
+        progress['scanned'] += sum(loans_due.values())
+        now = timezone.now()
+        for fee, dates in group_by_fee(loans_due, as_of).items():
+            progress['updated'] += (
+                window.filter(due_date__in=dates).exclude(late_fee=fee)
+                .update(late_fee=fee, updated_at=now)
+            )
+        progress['last_id'] = min(high, bounds['last'])
+        progress['elapsed'] = time.perf_counter() - started
+        if on_chunk:
+            on_chunk(progress)
+        low = high + 1
+
+    if progress['updated']:
+        caching.bump(Borrowing)
+    return progress
@@ -0,0 +1,48 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from librarymanagement import fees
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the current late fee to every open overdue borrowing. Idempotent: "
+        "rows already holding the right fee are left alone. Schedule daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Borrowing ids per window.')
+        parser.add_argument('--start-id', type=int, help='Resume from this borrowing id.')
+        parser.add_argument('--as-of', help='Assess as of this date (YYYY-MM-DD); defaults to today.')
+        parser.add_argument('--progress-every', type=int, default=50, help='Report every N windows.')
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            try:
+                as_of = date.fromisoformat(options['as_of'])
+            except ValueError:
+                raise CommandError('--as-of must be YYYY-MM-DD')
+
+        windows = 0
+
+        def report(progress):
+            nonlocal windows
+            windows += 1
+            if windows % options['progress_every'] == 0:
+                self.stdout.write(self._line(progress))
+
+        progress = fees.assess(
+            as_of=as_of, chunk_size=options['chunk_size'],
+            start_id=options['start_id'], on_chunk=report,
+        )
+        self.stdout.write(self.style.SUCCESS(self._line(progress)))
+
+    def _line(self, progress):
+        elapsed = progress['elapsed'] or 1e-9
+        return (
+            f"up to id {progress['last_id']}: {progress['scanned']} overdue loans checked, "
+            f"{progress['updated']} updated in {progress['elapsed']:.2f}s "
+            f"({progress['scanned'] / elapsed:.0f} rows/s)"
+        )
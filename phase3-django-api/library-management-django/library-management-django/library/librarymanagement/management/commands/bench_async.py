@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from librarymanagement import benchmarking
+from librarymanagement.models import Book, Member
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec and tail latency of the sync DRF read endpoints "
+        "under WSGI with their /api/async/ versions under ASGI, in-process. The "
+        "async views do not cache, so the sync ones run with the response cache off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per endpoint and mode.')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--book', type=int, help='Book id to request (default: the first book).')
+        parser.add_argument('--member', type=int, help='Member id to request (default: the first member).')
+        parser.add_argument('--query', default='the', help='Search query.')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per endpoint and mode.')
+
+    def handle(self, *args, **options):
+        book_id = options['book'] or Book.objects.order_by('id').values_list('id', flat=True).first()
+        member_id = options['member'] or Member.objects.order_by('id').values_list('id', flat=True).first()
+        if book_id is None or member_id is None:
+            raise CommandError('Need at least one book and one member to benchmark.')
+
+        search_query = f"?q={options['query']}"
+        endpoints = [
+            ('book detail', reverse('book-detail', args=[book_id]),
+             reverse('async-book-detail', args=[book_id])),
+            ('availability', reverse('book-availability', args=[book_id]),
+             reverse('async-book-availability', args=[book_id])),
+            ('search', reverse('book-search') + search_query,
+             reverse('async-book-search') + search_query),
+            ('member borrowings', reverse('member-borrowings', args=[member_id]),
+             reverse('async-member-borrowings', args=[member_id])),
+        ]
+
+        self.stdout.write(
+            f"{options['requests']} requests per run, concurrency {options['concurrency']}\n"
+            f"{'endpoint':<18} {'mode':<5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}"
+        )
+        with benchmarking.settings_changed(RESPONSE_CACHE_ENABLED=False):
+            for name, sync_url, async_url in endpoints:
+                for mode, run, url in (
+                    ('wsgi', benchmarking.run_wsgi, sync_url),
+                    ('asgi', benchmarking.run_asgi, async_url),
+                ):
+                    if options['warmup']:
+                        run([url] * options['warmup'], options['concurrency'])
+                    result = run([url] * options['requests'], options['concurrency'])
+                    self.stdout.write(
+                        f"{name:<18} {mode:<5} {result['rps']:>8.0f} {result['p50']:>8.2f} "
+                        f"{result['p95']:>8.2f} {result['p99']:>8.2f} {result['errors']:>6}"
+                    )
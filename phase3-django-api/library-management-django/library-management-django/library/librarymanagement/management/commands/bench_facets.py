@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from librarymanagement import benchmarking, datagen, search
+from librarymanagement.models import Book
+
+# Broad to narrow on a generate_data catalog: titles are "The <adjective>
+# <noun>" or "<noun> of the <adjective> <noun>", authors come from datagen's
+# name lists.
+DEFAULT_QUERIES = ('the', 'river', 'silent river', 'silent river adams')
+
+
+def _median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return benchmarking.percentile(sorted(timings), 50) * 1000, result
+
+
+class Command(BaseCommand):
+    help = (
+        "Time search facet counts (search.py) on the current catalog for queries from broad to "
+        "narrow: facets() as it chooses, one AND per facet value over bitmaps, and counting the "
+        "matching books one by one. Checks that both give the same counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-books', type=int, default=0,
+                            help='Generate synthetic books (no members or loans) up to this many.')
+        parser.add_argument('--query', action='append', help='Queries to time (default: a broad-to-narrow set).')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        missing = max(0, options['seed_books'] - Book.objects.count())
+        if missing:
+            datagen.generate(datagen.Scale.proportional(missing, 0), datagen.DatabaseSink())
+
+        started = time.perf_counter()
+        index = search.get_index()
+        if not len(index):
+            raise CommandError('The catalog is empty; use --seed-books.')
+        self.stdout.write(f"{len(index)} books indexed in {time.perf_counter() - started:.1f}s")
+        index.facets()   # settle availability before timing
+
+        self.stdout.write(
+            f"{'query':<22} {'matches':>9} {'facets ms':>10} {'bitmap ms':>10} {'by book ms':>11}"
+        )
+        for query in [None, *(options['query'] or DEFAULT_QUERIES)]:
+            book_ids = None if query is None else index.match(query)
+            auto_ms, auto = _median_ms(lambda: index.facets(book_ids), options['repeat'])
+            if book_ids is None:
+                bitmap_ms, bitmap = _median_ms(lambda: index._count_bitmaps(index._all_bits), options['repeat'])
+                by_book_ms, by_book = None, bitmap
+            else:
+                bitmap_ms, bitmap = _median_ms(
+                    lambda: index._count_bitmaps(search.to_bitmap(book_ids) & index._all_bits), options['repeat'],
+                )
+                by_book_ms, by_book = _median_ms(lambda: index._count_books(book_ids), options['repeat'])
+            if not auto == bitmap == by_book:
+                raise CommandError(f'Facet counts differ between strategies for {query!r}')
+            matches = len(index) if book_ids is None else len(book_ids)
+            by_book_text = f'{by_book_ms:.2f}' if by_book_ms is not None else '-'
+            self.stdout.write(
+                f"{query or '(whole catalog)':<22} {matches:>9} {auto_ms:>10.2f} {bitmap_ms:>10.2f} {by_book_text:>11}"
+            )
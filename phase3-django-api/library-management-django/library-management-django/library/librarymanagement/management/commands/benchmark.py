@@ -0,0 +1,223 @@
+import json
+import random
+import subprocess
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from librarymanagement import benchmarking, datagen, metrics
+from librarymanagement.models import Book, Member
+
+ENDPOINTS = ('book-list-create', 'book-detail', 'book-search', 'statistics', 'book-borrow', 'book-return')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main API endpoints (list, detail, search, statistics, borrow, return) "
+        "in-process or against a running server. Reports req/s, p50/p95/p99, SQL queries "
+        "per request and the share served from the response cache, optionally saving JSON "
+        "and comparing with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi', help='In-process driver.')
+        parser.add_argument('--base-url', help='Benchmark a running server (e.g. http://127.0.0.1:8000) instead.')
+        parser.add_argument('--endpoint', action='append', choices=ENDPOINTS, help='Only these endpoints.')
+        parser.add_argument('--admission-control', action='store_true',
+                            help='Keep the write rate limits and concurrency cap on in-process '
+                                 '(every request comes from one client, so they would throttle the run).')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Turn the response cache off in-process, so every read is built '
+                                 '(after warmup most reads are otherwise cache hits).')
+        parser.add_argument('--seed-books', type=int, default=0, help='Generate synthetic data (see generate_data) up to this many books.')
+        parser.add_argument('--seed-members', type=int, default=0, help='Insert synthetic members up to this count.')
+        parser.add_argument('--random-seed', type=int, default=42)
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per endpoint.')
+        parser.add_argument('--output', help='Write results as JSON to this file.')
+        parser.add_argument('--compare', help='Compare with results saved by an earlier --output.')
+        parser.add_argument('--max-regression', type=float,
+                            help='With --compare, fail if any p95 grows by more than this many percent '
+                                 'or any endpoint needs more queries per request.')
+
+    def handle(self, *args, **options):
+        if options['base_url']:
+            if options['no_cache']:
+                raise CommandError('--no-cache only applies in-process; set RESPONSE_CACHE_ENABLED on the server.')
+            return self._benchmark(options)
+        changes = {}
+        if not options['admission_control']:
+            changes.update(THROTTLE_RATES={}, WRITE_CONCURRENCY_LIMIT=None)
+        if options['no_cache']:
+            changes['RESPONSE_CACHE_ENABLED'] = False
+        with benchmarking.settings_changed(**changes):
+            return self._benchmark(options)
+
+    def _benchmark(self, options):
+        rng = random.Random(options['random_seed'])
+        if settings.DEBUG and not options['base_url']:
+            self.stderr.write('DEBUG is on: Django records every query, so timings will be pessimistic.')
+        missing_books = max(0, options['seed_books'] - Book.objects.count())
+        missing_members = max(0, options['seed_members'] - Member.objects.count())
+        if missing_books or missing_members:
+            counts = datagen.generate(
+                datagen.Scale.proportional(missing_books, missing_members, seed=options['random_seed']),
+                datagen.DatabaseSink(),
+            )
+            self.stdout.write('Seeded ' + ', '.join(f'{rows} {table}' for table, rows in counts.items() if rows))
+
+        book_ids = list(Book.objects.filter(available_copies__gt=0).values_list('id', flat=True)[:10000])
+        member_ids = list(Member.objects.values_list('id', flat=True)[:10000])
+        if not book_ids or not member_ids:
+            raise CommandError('Need books with available copies and members; use --seed-books/--seed-members.')
+        titles = Book.objects.filter(id__in=book_ids[:500]).values_list('title', flat=True)
+        terms = sorted({word.lower() for title in titles for word in title.split() if len(word) > 3}) or ['the']
+
+        if options['base_url']:
+            def run(requests, collect=False):
+                return benchmarking.run_http(options['base_url'], requests, options['concurrency'], collect)
+        else:
+            driver = benchmarking.run_wsgi if options['mode'] == 'wsgi' else benchmarking.run_asgi
+
+            def run(requests, collect=False):
+                return driver(requests, options['concurrency'], collect)
+
+        count = options['requests']
+        results = {}
+        borrowed = []
+        self.stdout.write(
+            f"{count} requests per endpoint, concurrency {options['concurrency']}, "
+            f"{'server ' + options['base_url'] if options['base_url'] else options['mode'] + ' in-process'}\n"
+            f"{'endpoint':<18} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} "
+            f"{'cached':>7} {'errors':>6}"
+        )
+        for name in options['endpoint'] or ENDPOINTS:
+            if name == 'book-list-create':
+                requests = [reverse(name)] * count
+            elif name == 'book-detail':
+                requests = [reverse(name, args=[rng.choice(book_ids)]) for _ in range(count)]
+            elif name == 'book-search':
+                requests = [f"{reverse(name)}?q={rng.choice(terms)}" for _ in range(count)]
+            elif name == 'statistics':
+                requests = [reverse(name)] * count
+            elif name == 'book-borrow':
+                requests = [
+                    ('POST', reverse(name), {'book_id': book_ids[n % len(book_ids)], 'member_id': rng.choice(member_ids)})
+                    for n in range(count)
+                ]
+            else:
+                requests = [('POST', reverse(name), {'borrowing_id': borrowing_id}) for borrowing_id in borrowed]
+                borrowed = []
+                if not requests:
+                    self.stdout.write(f"{name:<18} skipped: run book-borrow first")
+                    continue
+
+            if options['warmup'] and name not in ('book-borrow', 'book-return'):
+                run(requests[:options['warmup']])
+            before, cache_before = self._totals(options['base_url'])
+            result = run(requests, collect=name == 'book-borrow')
+            after, cache_after = self._totals(options['base_url'])
+            if name == 'book-borrow':
+                borrowed = [json.loads(body)['id'] for status, body in result.pop('responses') if status == 201]
+
+            queries, served = (after.get(name, (0, 0))[i] - before.get(name, (0, 0))[i] for i in (0, 1))
+            result['queries_per_request'] = queries / served if served else None
+            # Reported apart from the timings: a run of cache hits says
+            # little about what a miss costs (see --no-cache).
+            for field, outcome in (('cache_hits', 'hit'), ('cache_misses', 'miss')):
+                key = (('route', name), ('outcome', outcome))
+                result[field] = int(cache_after.get(key, 0) - cache_before.get(key, 0))
+            looked_up = result['cache_hits'] + result['cache_misses']
+            results[name] = result
+            queries_text = f"{result['queries_per_request']:.1f}" if served else '-'
+            cached_text = f"{result['cache_hits'] / looked_up:.0%}" if looked_up else '-'
+            self.stdout.write(
+                f"{name:<18} {result['rps']:>8.0f} {result['p50']:>8.2f} {result['p95']:>8.2f} "
+                f"{result['p99']:>8.2f} {queries_text:>8} {cached_text:>7} {result['errors']:>6}"
+            )
+
+        if borrowed:
+            # Return what a borrow-only run took so repeated runs do not drain the catalog.
+            run([('POST', reverse('book-return'), {'borrowing_id': borrowing_id}) for borrowing_id in borrowed])
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'git_commit': _git_commit(),
+                'target': options['base_url'] or options['mode'],
+                'database': connection.vendor,
+                'concurrency': options['concurrency'],
+                'response_cache': not options['no_cache'],
+                'requests_per_endpoint': count,
+                'books': Book.objects.count(),
+                'members': Member.objects.count(),
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            self._compare(report, options['compare'], options['max_regression'])
+
+    def _totals(self, base_url):
+        """Queries per route (``{route: (sum, count)}``) and response cache hits and misses so far."""
+        if base_url:
+            with urllib.request.urlopen(base_url.rstrip('/') + reverse('metrics'), timeout=30) as response:
+                text = response.read().decode()
+            return (
+                benchmarking.query_totals_from_text(text),
+                benchmarking.counter_totals_from_text(text, 'library_response_cache_total'),
+            )
+        return (
+            {
+                dict(labels).get('route'): totals
+                for labels, totals in metrics.registry.histogram_totals('library_db_queries_per_request').items()
+            },
+            metrics.registry.counter_values('library_response_cache_total'),
+        )
+
+    def _compare(self, report, path, max_regression):
+        with open(path) as f:
+            baseline = json.load(f)
+        self.stdout.write(
+            f"\nCompared with {path} (commit {baseline['meta'].get('git_commit')})\n"
+            f"{'endpoint':<18} {'req/s':>9} {'p95':>9} {'p99':>9} {'queries':>9}"
+        )
+        regressions = []
+        for name, result in report['endpoints'].items():
+            old = baseline['endpoints'].get(name)
+            if old is None:
+                continue
+
+            def change(key):
+                return (result[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+
+            old_queries, new_queries = old.get('queries_per_request'), result.get('queries_per_request')
+            query_delta = new_queries - old_queries if None not in (old_queries, new_queries) else None
+            self.stdout.write(
+                f"{name:<18} {change('rps'):>+8.1f}% {change('p95'):>+8.1f}% {change('p99'):>+8.1f}% "
+                f"{(f'{query_delta:+.1f}' if query_delta is not None else '-'):>9}"
+            )
+            if max_regression is not None:
+                if change('p95') > max_regression:
+                    regressions.append(f"{name}: p95 {old['p95']:.2f}ms -> {result['p95']:.2f}ms")
+                if query_delta is not None and query_delta > 0.5:
+                    regressions.append(f"{name}: {old_queries:.1f} -> {new_queries:.1f} queries per request")
+        if regressions:
+            raise CommandError('Regressions:\n  ' + '\n  '.join(regressions))
@@ -0,0 +1,47 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from librarymanagement import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the \"members who borrowed this also borrowed\" lists behind "
+        "/api/books/<id>/recommendations/. After the first full run only books touched by "
+        "borrowings since the previous run are recomputed, unless --full is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every book.')
+        parser.add_argument('--since', help='Recompute books touched by borrowings from this date (YYYY-MM-DD).')
+        parser.add_argument('--chunk-size', type=int, default=recommendations.CHUNK_SIZE, help='Members per window.')
+        parser.add_argument('--partitions', type=int, default=1, help='Passes over Borrowing, each for a share of the books.')
+        parser.add_argument('--max-pairs', type=int, default=5_000_000,
+                            help='Co-borrowed pairs held per pass before doubling --partitions (about 100 bytes each).')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be YYYY-MM-DD')
+
+        def report(progress):
+            if progress['partitions'] > 1:
+                self.stdout.write(self._line(progress))
+
+        progress = recommendations.compute(
+            full=options['full'], since=since, chunk_size=options['chunk_size'],
+            partitions=options['partitions'], max_pairs=options['max_pairs'], on_pass=report,
+        )
+        self.stdout.write(self.style.SUCCESS(self._line(progress)))
+
+    def _line(self, progress):
+        members = '' if progress['members'] is None else f", {progress['members']} members read"
+        return (
+            f"{progress['mode']}: {progress['books']} books{members}, {progress['pairs']} pairs "
+            f"in {progress['partitions']} partition(s), {progress['rows']} recommendations written "
+            f"up to borrowing {progress['last_id']} in {progress['elapsed']:.2f}s"
+        )
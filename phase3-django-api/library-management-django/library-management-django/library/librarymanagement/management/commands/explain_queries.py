@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from librarymanagement import queryplans
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every API endpoint once, EXPLAIN the SQL each one runs against the configured "
+        "database and report full table scans and filesorts. With --check, fail if the plans differ "
+        "from the saved baseline; with --update, save them as the new baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default=queryplans.BASELINE_PATH)
+        parser.add_argument('--check', action='store_true', help='Fail if plans differ from the baseline.')
+        parser.add_argument('--update', action='store_true', help='Save these plans as the baseline.')
+        parser.add_argument('--sql', action='store_true', help='Print each statement, not just its plan.')
+
+    def handle(self, *args, **options):
+        results = queryplans.collect_plans()
+        flagged = 0
+        for name, entries in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name} ({len(entries)} statements)"))
+            for entry in entries:
+                if options['sql']:
+                    self.stdout.write(f"  {entry['sql']}")
+                for line in entry['plan']:
+                    self.stdout.write(f"    {line}")
+                for flag in entry['flags']:
+                    flagged += 1
+                    self.stdout.write(self.style.WARNING(f"    ! {flag}"))
+        self.stdout.write(f"{flagged} flagged plan steps")
+
+        summary = queryplans.plan_summary(results)
+        if options['update']:
+            queryplans.save_baseline(connection.vendor, summary, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Saved {connection.vendor} plans to {options['baseline']}"))
+        elif options['check']:
+            baseline = queryplans.load_baseline(connection.vendor, options['baseline'])
+            if baseline is None:
+                raise CommandError(f"No {connection.vendor} baseline in {options['baseline']}; run with --update")
+            changes = queryplans.diff(baseline, summary)
+            if changes:
+                raise CommandError('Query plans changed:\n' + '\n'.join(changes))
+            self.stdout.write(self.style.SUCCESS('Plans match the baseline'))
@@ -0,0 +1,41 @@
+import hashlib
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from librarymanagement import apischema
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the OpenAPI schema to openapi-<API_VERSION>.json/.yaml. Point "
+        "OPENAPI_SCHEMA_FILE at the JSON file to serve both without introspecting the views; "
+        "--check fails if the files on disk are out of date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default=str(Path(settings.BASE_DIR) / 'openapi'))
+        parser.add_argument('--format', action='append', choices=sorted(apischema.FORMATS),
+                            help='Formats to write (default: all).')
+        parser.add_argument('--check', action='store_true', help='Compare with the files instead of writing them.')
+
+    def handle(self, *args, **options):
+        output_dir = Path(options['output_dir'])
+        schema = apischema.build_schema()
+        stale = []
+        for fmt in options['format'] or sorted(apischema.FORMATS):
+            body = apischema.encode(schema, fmt)
+            path = output_dir / f'openapi-{apischema.api_version()}.{fmt}'
+            digest = hashlib.sha256(body).hexdigest()[:12]
+            if options['check']:
+                if not path.exists() or path.read_bytes() != body:
+                    stale.append(str(path))
+                continue
+            output_dir.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(body)
+            self.stdout.write(f"Wrote {path} ({len(body)} bytes, sha256 {digest})")
+        if stale:
+            raise CommandError('Out of date, rerun generate_openapi: ' + ', '.join(stale))
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('OpenAPI schema files are up to date'))
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from librarymanagement import circulation
+from librarymanagement.models import Book, Member, Borrowing
+
+
+def run_stress(book_id, member_id, threads=16, attempts=20):
+    """
+    Call ``borrow_book`` for one book from ``threads`` threads at once, each
+    making ``attempts`` borrows. Returns ``(borrowed, rejected, elapsed_seconds)``.
+    """
+    borrowed = []
+    rejected = []
+    errors = []
+    start_gate = threading.Barrier(threads)
+
+    def worker():
+        try:
+            start_gate.wait()
+            for _ in range(attempts):
+                try:
+                    borrowed.append(circulation.borrow_book(book_id, member_id).id)
+                except circulation.BookUnavailable:
+                    rejected.append(1)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    return len(borrowed), len(rejected), elapsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent borrows against a single book and check it is never "
+        "oversold. Creates a throwaway book and member unless --book/--member are given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, default=100)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--attempts', type=int, default=20, help='Borrows attempted per thread.')
+        parser.add_argument('--book', type=int, help='Existing book id to use.')
+        parser.add_argument('--member', type=int, help='Existing member id to use.')
+        parser.add_argument('--keep', action='store_true', help='Keep the rows created by the run.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        created = []
+        if options['book']:
+            book = Book.objects.get(id=options['book'])
+        else:
+            book = Book.objects.create(
+                title=f'stress-test {now:%Y%m%d%H%M%S}',
+                total_copies=options['copies'], available_copies=options['copies'],
+                created_at=now, updated_at=now,
+            )
+            created.append(book)
+        if options['member']:
+            member = Member.objects.get(id=options['member'])
+        else:
+            member = Member.objects.create(
+                first_name='Stress', last_name='Test', member_type='student',
+                registration_date=now.date(), created_at=now, updated_at=now,
+            )
+            created.append(member)
+
+        copies = book.available_copies
+        open_before = Borrowing.objects.filter(book=book, return_date__isnull=True).count()
+        borrowed, rejected, elapsed = run_stress(
+            book.id, member.id, options['threads'], options['attempts']
+        )
+        book.refresh_from_db()
+        open_after = Borrowing.objects.filter(book=book, return_date__isnull=True).count()
+
+        self.stdout.write(
+            f"{borrowed} borrowed, {rejected} rejected in {elapsed:.2f}s "
+            f"({(borrowed + rejected) / elapsed:.0f} attempts/s, {borrowed / elapsed:.0f} borrows/s)"
+        )
+        oversold = (
+            borrowed > copies
+            or book.available_copies != copies - borrowed
+            or open_after - open_before != borrowed
+        )
+
+        if not options['keep']:
+            new_borrowings = Borrowing.objects.filter(book=book, member=member, created_at__gte=now)
+            for borrowing_id in new_borrowings.values_list('id', flat=True):
+                circulation.return_book(borrowing_id)
+            if created:
+                new_borrowings.delete()
+                for obj in reversed(created):
+                    obj.delete()
+
+        if oversold:
+            raise CommandError(
+                f"Inventory mismatch: started with {copies} copies, {borrowed} borrowed, "
+                f"{book.available_copies} left, {open_after - open_before} new open borrowings"
+            )
+        self.stdout.write(self.style.SUCCESS('No oversell.'))
@@ -0,0 +1,168 @@
+"""
+In-process metrics in Prometheus text format.
+
+``MetricsMiddleware`` records, per resolved URL name, request latency, SQL
+query count and time (through ``connection.execute_wrapper``) and response
+size. Other modules can add their own counters and histograms with
+``registry.inc()`` / ``registry.observe()``. ``/metrics`` renders the lot.
+
+Recording a request costs a few dictionary updates under one lock; SQL text
+is only kept when the slow-request log is enabled (METRICS_SLOW_REQUEST_SECONDS).
+Every worker process keeps its own numbers, so scrape each worker or sum in
+Prometheus.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, labels=(), amount=1):
+        self.record_many(counters=[(name, labels, amount)])
+
+    def observe(self, name, labels, value, buckets):
+        self.record_many(observations=[(name, labels, value, buckets)])
+
+    def record_many(self, counters=(), observations=()):
+        """Apply several ``inc``/``observe`` calls under one lock acquisition."""
+        with self._lock:
+            for name, labels, amount in counters:
+                key = (name, tuple(labels))
+                self._counters[key] = self._counters.get(key, 0) + amount
+            for name, labels, value, buckets in observations:
+                key = (name, tuple(labels))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(buckets)
+                histogram.observe(value)
+
+    def counter_values(self, name):
+        """``{labels: value}`` for every series of counter ``name``."""
+        with self._lock:
+            return {labels: value for (series, labels), value in self._counters.items() if series == name}
+
+    def histogram_totals(self, name):
+        """``{labels: (sum, count)}`` for every series of histogram ``name``."""
+        with self._lock:
+            return {
+                labels: (histogram.sum, histogram.count)
+                for (series, labels), histogram in self._histograms.items() if series == name
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.cumulative()), h.sum, h.count)) for key, h in self._histograms.items()
+            )
+        lines = []
+        described = set()
+
+        def header(name, default_kind):
+            if name in described:
+                return
+            described.add(name)
+            kind, help_text = self._meta.get(name, (default_kind, ''))
+            if help_text:
+                lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        for (name, labels), (buckets, total, count) in histograms:
+            header(name, 'histogram')
+            for bound, cumulative in buckets:
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(float(bound))),))} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+registry.describe('library_http_requests_total', 'counter', 'Requests by route, method and status.')
+registry.describe('library_http_request_duration_seconds', 'histogram', 'Request latency by route.')
+registry.describe('library_db_queries_per_request', 'histogram', 'SQL queries per request by route.')
+registry.describe('library_db_query_seconds_total', 'counter', 'Time spent in SQL by route.')
+registry.describe('library_http_response_size_bytes', 'histogram', 'Response body size by route.')
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that counts and times queries, optionally keeping the SQL."""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.keep_sql = keep_sql
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if self.keep_sql:
+                self.statements.append((elapsed, sql))
+
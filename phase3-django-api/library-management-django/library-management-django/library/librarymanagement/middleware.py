@@ -0,0 +1,325 @@
+import gzip
+import logging
+import time
+import zlib
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics, routers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+slow_request_logger = logging.getLogger('librarymanagement.slow_requests')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+PRIMARY_COOKIE = 'read_primary_until'
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/msgpack', 'application/x-ndjson', 'text/csv')
+
+
+class _SyncAndAsyncMiddleware:
+    """
+    Runs natively in both stacks: under ASGI, Django awaits ``__acall__``
+    instead of running the middleware in a thread.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+@sync_and_async_middleware
+class MetricsMiddleware(_SyncAndAsyncMiddleware):
+    """
+    Records latency, SQL query count and time, and response size per URL
+    name into ``metrics.registry``. With METRICS_SLOW_REQUEST_SECONDS set,
+    requests slower than that are logged to ``librarymanagement.slow_requests``
+    with their slowest SQL statements.
+    """
+
+    def handle(self, request):
+        slow_after, recorder, started = self._start()
+        with self._recording(recorder):
+            response = self.get_response(request)
+        return self._finish(request, response, recorder, started, slow_after)
+
+    async def __acall__(self, request):
+        slow_after, recorder, started = self._start()
+        recording = await self._arecording(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        return self._finish(request, response, recorder, started, slow_after)
+
+    @staticmethod
+    def _start():
+        slow_after = getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', None)
+        return slow_after, metrics.QueryRecorder(keep_sql=slow_after is not None), time.perf_counter()
+
+    def _finish(self, request, response, recorder, started, slow_after):
+        def finish(size):
+            self._record(request, response, recorder, time.perf_counter() - started, size, slow_after)
+
+        if response.streaming:
+            # The body (and the queries behind it) is produced after we
+            # return; measure it once the server has consumed it.
+            measure = self._ameasure_stream if response.is_async else self._measure_stream
+            response.streaming_content = measure(response.streaming_content, recorder, finish)
+        else:
+            finish(len(response.content))
+        return response
+
+    @staticmethod
+    def _recording(recorder):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        return stack
+
+    @classmethod
+    async def _arecording(cls, recorder):
+        # Under ASGI, sync views and the async ORM run their queries in the
+        # request's sync_to_async thread, whose connections are not the event
+        # loop's: wrap those. Close the result there too.
+        return await sync_to_async(cls._recording)(recorder)
+
+    def _measure_stream(self, content, recorder, finish):
+        size = 0
+        try:
+            with self._recording(recorder):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            finish(size)
+
+    async def _ameasure_stream(self, content, recorder, finish):
+        size = 0
+        try:
+            recording = await self._arecording(recorder)
+            try:
+                async for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+            finally:
+                await sync_to_async(recording.close)()
+        finally:
+            finish(size)
+
+    def _record(self, request, response, recorder, elapsed, size, slow_after):
+        match = request.resolver_match
+        route = (match.url_name or match.view_name) if match else 'unmatched'
+        labels = (('route', route),)
+        metrics.registry.record_many(
+            counters=[
+                ('library_http_requests_total',
+                 (('route', route), ('method', request.method), ('status', response.status_code)), 1),
+                ('library_db_query_seconds_total', labels, recorder.duration),
+            ],
+            observations=[
+                ('library_http_request_duration_seconds', labels, elapsed, metrics.LATENCY_BUCKETS),
+                ('library_db_queries_per_request', labels, recorder.count, metrics.QUERY_COUNT_BUCKETS),
+                ('library_http_response_size_bytes', labels, size, metrics.SIZE_BUCKETS),
+            ],
+        )
+        if slow_after is not None and elapsed >= slow_after:
+            self._log_slow(request, route, elapsed, recorder)
+
+    def _log_slow(self, request, route, elapsed, recorder):
+        slowest = sorted(recorder.statements, key=lambda statement: statement[0], reverse=True)[:10]
+        slow_request_logger.warning(
+            '%s %s (%s) took %.3fs with %d queries (%.3fs in SQL)%s',
+            request.method, request.get_full_path(), route, elapsed, recorder.count, recorder.duration,
+            ''.join(f'\n  {duration * 1000:.1f}ms  {sql}' for duration, sql in slowest),
+        )
+
+
+@sync_and_async_middleware
+class ReplicaRoutingMiddleware(_SyncAndAsyncMiddleware):
+    """
+    Sends reads of safe requests to a replica (see ``routers.py``), including
+    those a streaming body makes after the view has returned. After a
+    successful write, the client gets a short-lived cookie that keeps its
+    reads on the primary until replicas have caught up. A view that fails on
+    a replica marks it down and is run once more on the primary.
+    """
+
+    def handle(self, request):
+        token = routers.begin_request(use_primary=self._use_primary(request))
+        try:
+            response = self._stream_in_request(self.get_response(request))
+        finally:
+            routers.end_request(token)
+        return self._remember_write(request, response)
+
+    async def __acall__(self, request):
+        token = routers.begin_request(use_primary=self._use_primary(request))
+        try:
+            response = self._stream_in_request(await self.get_response(request))
+        finally:
+            routers.end_request(token)
+        return self._remember_write(request, response)
+
+    def _use_primary(self, request):
+        return request.method not in SAFE_METHODS or self._sticky(request)
+
+    @staticmethod
+    def _stream_in_request(response):
+        if response.streaming:
+            response.streaming_content = routers.stream_in_request(response.streaming_content)
+        return response
+
+    @staticmethod
+    def _remember_write(request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            window = routers.read_your_writes_seconds()
+            response.set_cookie(
+                PRIMARY_COOKIE, str(int(time.time() + window)),
+                max_age=window, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def _sticky(self, request):
+        try:
+            return float(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def process_exception(self, request, exception):
+        replica = routers.current_replica()
+        match = request.resolver_match
+        if (replica is None or match is None or not isinstance(exception, DatabaseError)
+                or request.method not in SAFE_METHODS):
+            return None
+        routers.health.mark_down(replica)
+        routers.pin_primary()
+        # Retry the view alone: the middleware around it has already run,
+        # and running it again would repeat its side effects.
+        view = async_to_sync(match.func) if iscoroutinefunction(match.func) else match.func
+        return view(request, *match.args, **match.kwargs)
+
+
+def _accepted_encodings(header):
+    """``{coding: q}`` from an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _stream_compressor(coding, level):
+    """``(compress, finish)`` for a streamed body."""
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)   # wbits 31: gzip container
+    return compressor.compress, compressor.flush
+
+
+def _compress_stream(chunks, compress, finish):
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def _acompress_stream(chunks, compress, finish):
+    async for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+@sync_and_async_middleware
+class CompressionMiddleware(_SyncAndAsyncMiddleware):
+    """
+    Compresses API bodies (JSON, MessagePack, NDJSON/CSV exports) of at least
+    COMPRESSION_MIN_BYTES with brotli, when the ``brotli`` package is installed
+    and the client accepts ``br``, or else gzip. Streaming exports are
+    compressed as they are produced. HTML (admin, Swagger) is left alone: it
+    carries CSRF tokens, and compressing secrets next to reflected input is
+    what BREACH exploits.
+    """
+
+    def handle(self, request):
+        return self._compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._compress(request, await self.get_response(request))
+
+    def _compress(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in COMPRESSIBLE_TYPES or response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, 'COMPRESSION_MIN_BYTES', 1024):
+            return response
+
+        coding = self._choose(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if coding is None:
+            return response
+        if response.streaming:
+            level = self._brotli_quality() if coding == 'br' else self._gzip_level()
+            stream = _acompress_stream if response.is_async else _compress_stream
+            response.streaming_content = stream(response.streaming_content, *_stream_compressor(coding, level))
+            del response['Content-Length']
+        else:
+            compressed = (
+                brotli.compress(response.content, quality=self._brotli_quality()) if coding == 'br'
+                else gzip.compress(response.content, compresslevel=self._gzip_level(), mtime=0)
+            )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag   # the bytes differ from the uncompressed representation
+        return response
+
+    @staticmethod
+    def _choose(header):
+        accepted = _accepted_encodings(header)
+        default = accepted.get('*', 0.0)
+        if brotli is not None and accepted.get('br', default) > 0:
+            return 'br'
+        if accepted.get('gzip', default) > 0:
+            return 'gzip'
+        return None
+
+    @staticmethod
+    def _gzip_level():
+        return getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+
+    @staticmethod
+    def _brotli_quality():
+        return getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4)
@@ -0,0 +1,210 @@
+import hashlib
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from . import admission, caching, routers, rowserializers
+
+
+class EagerLoadingViewMixin:
+    """
+    Applies the serializer's declared ``select_related``/``prefetch_related``
+    needs to the view's queryset.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        setup = getattr(self.get_serializer_class(), 'setup_eager_loading', None)
+        return setup(queryset) if setup else queryset
+
+
+class AdmissionControlMixin:
+    """
+    Rate-limits writes per member and per API client and caps the writes
+    running at once in this worker; rejected requests get 429 with
+    Retry-After. Reads pass straight through. See ``admission.py``.
+    """
+    throttle_classes = (admission.MemberRateThrottle, admission.ClientRateThrottle)
+
+    def initial(self, request, *args, **kwargs):
+        self._admission_slot = None
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            return
+        limiter = admission.get_limiter()
+        if limiter is not None:
+            if not limiter.acquire(getattr(settings, 'WRITE_QUEUE_TIMEOUT', 0)):
+                admission.record(request, 'concurrency')
+                raise Throttled(wait=getattr(settings, 'WRITE_RETRY_AFTER', 1))
+            self._admission_slot = limiter
+        admission.record(request, 'admitted')
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        slot = getattr(self, '_admission_slot', None)
+        if slot is not None:
+            self._admission_slot = None
+            slot.release()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class SparseFieldsViewMixin:
+    """
+    ``?fields=id,title`` limits list rows to those keys and ``?expand=library``
+    renders a related object in place of its id (see SparseFieldsMixin).
+
+    GET lists are built by ``rowserializers`` from ``.values()`` rows, which
+    gives the same JSON without DRF's per-field overhead; set
+    FAST_LIST_SERIALIZATION = False to always use the serializer.
+    """
+
+    def _list_param(self, name):
+        value = self.request.query_params.get(name)
+        return None if value is None else [part.strip() for part in value.split(',') if part.strip()]
+
+    def sparse_params(self):
+        """``(fields frozenset or None, expand tuple)`` from the query string; 400 on unknown names."""
+        if not hasattr(self, '_sparse_params'):
+            serializer_class = self.get_serializer_class()
+            fields, expand = self._list_param('fields'), self._list_param('expand') or []
+            errors = {}
+            if fields is not None:
+                unknown = sorted(set(fields) - set(serializer_class.readable_field_names()))
+                if unknown or not fields:
+                    errors['fields'] = f"unknown fields {unknown}; choose from {list(serializer_class.readable_field_names())}"
+            unknown = sorted(set(expand) - set(serializer_class.expandable_fields))
+            if unknown:
+                errors['expand'] = f"cannot expand {unknown}; choose from {sorted(serializer_class.expandable_fields)}"
+            if errors:
+                raise ValidationError(errors)
+            self._sparse_params = (
+                frozenset(fields) if fields is not None else None,
+                tuple(sorted(set(expand))),
+            )
+        return self._sparse_params
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request is not None and self.request.method == 'GET':
+            context['sparse_fields'], context['expand'] = self.sparse_params()
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request is None or self.request.method != 'GET':
+            return queryset
+        fields, expand = self.sparse_params()
+        if fields is not None:
+            prefetch = getattr(self.get_serializer_class(), 'prefetch_related_fields', ())
+            queryset = queryset.prefetch_related(None).prefetch_related(*(name for name in prefetch if name in fields))
+        if expand:
+            queryset = queryset.select_related(*expand)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        plan = None
+        if getattr(settings, 'FAST_LIST_SERIALIZATION', True):
+            plan = rowserializers.plan_for(self.get_serializer_class(), *self.sparse_params())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        ordering = getattr(self.paginator, 'ordering', ())
+        ordering = (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        values = plan.values(queryset, *(field.lstrip('-') for field in ordering))
+        page = self.paginate_queryset(values)
+        if page is None:
+            return Response(plan.rows(values))
+        return self.get_paginated_response(plan.rows(page))
+
+
+class CachedResponseMixin:
+    """
+    Caches GET responses keyed by URL, query string and the generations of
+    ``cache_models`` (a detail view depends on its own row's generation
+    rather than on all of its model's rows; see ``caching.py``), and answers
+    conditional GETs (If-None-Match / If-Modified-Since) with 304. Detail
+    views derive Last-Modified from the object's ``updated_at``, which
+    ``perform_update()`` refreshes. Requests pinned to the primary database
+    (see ``routers.py``) rebuild the response instead of reading the cache;
+    misses within READ_YOUR_WRITES_SECONDS of a generation bump are built
+    from the primary, and RESPONSE_CACHE_ENABLED = False turns the cache
+    off. Plain APIViews implement ``uncached_get`` instead of ``get``.
+    """
+    cache_models = ()
+
+    def uncached_get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_object(self):
+        obj = super().get_object()
+        self._last_modified = getattr(obj, 'updated_at', None)
+        return obj
+
+    def perform_update(self, serializer):
+        # Serializers write updated_at back as it was read, so without this
+        # Last-Modified would never move and If-Modified-Since would keep
+        # answering 304.
+        serializer.save(updated_at=timezone.now())
+
+    def cache_row(self):
+        """``(model, pk)`` when the view renders one row of its queryset, for per-row invalidation."""
+        queryset = getattr(self, 'queryset', None)
+        pk = self.kwargs.get('pk')
+        if queryset is None or pk is None:
+            return None
+        return queryset.model, pk
+
+    def get(self, request, *args, **kwargs):
+        if not getattr(settings, 'RESPONSE_CACHE_ENABLED', True):
+            return self.uncached_get(request, *args, **kwargs)
+        cache = caching.get_cache()
+        row = self.cache_row()
+        key = caching.response_key(request, type(self).__name__, self.cache_models, row)
+        # A client reading its own writes may not be served a response that
+        # was built from a lagging replica.
+        entry = None if routers.pinned_to_primary() else cache.get(key)
+        caching.record(request, 'miss' if entry is None else 'hit')
+        if entry is None:
+            if routers.may_read_from_replica() and caching.bumped_recently(
+                caching.generation_keys(self.cache_models, row)
+            ):
+                # The write behind the new generation may not have reached the
+                # replica yet, and this response is cached under it.
+                routers.pin_primary()
+            self._last_modified = None
+            response = self.uncached_get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            last_modified = self._last_modified
+            digest = hashlib.md5(f'{key}|{last_modified}'.encode()).hexdigest()
+            entry = {
+                'data': response.data,
+                'headers': dict(response.items()),
+                'etag': f'W/"{digest}"',
+                'last_modified': int(last_modified.timestamp()) if last_modified else None,
+            }
+            cache.set(key, entry, caching.cache_timeout())
+
+        headers = {'ETag': entry['etag'], 'Cache-Control': 'no-cache'}
+        if entry['last_modified'] is not None:
+            headers['Last-Modified'] = http_date(entry['last_modified'])
+        if self._not_modified(request, entry):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(entry['data'], headers={**entry['headers'], **headers})
+
+    @staticmethod
+    def _not_modified(request, entry):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = [etag.removeprefix('W/') for etag in parse_etags(if_none_match)]
+            return '*' in etags or entry['etag'].removeprefix('W/') in etags
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return (
+            if_modified_since is not None and entry['last_modified'] is not None
+            and entry['last_modified'] <= if_modified_since
+        )
@@ -63,6 +63,12 @@ class Book(models.Model):
         Library, db_column='library_id', null=True,
         on_delete=models.DO_NOTHING, related_name='books'
     )
+    borrow_count = models.IntegerField(default=0, editable=False, db_column='borrow_count')
+    rating_count = models.IntegerField(default=0, editable=False, db_column='rating_count')
+    rating_sum = models.IntegerField(default=0, editable=False, db_column='rating_sum')
+    average_rating = models.DecimalField(
+        max_digits=3, decimal_places=2, null=True, editable=False, db_column='average_rating'
+    )
     created_at = models.DateTimeField(null=True, db_column='created_at')
     updated_at = models.DateTimeField(null=True, db_column='updated_at')
 
@@ -72,6 +78,10 @@ class Book(models.Model):
     class Meta:
         db_table = 'Book'
         managed = False
+        indexes = [
+            models.Index(fields=['borrow_count'], name='idx_book_borrow_count'),
+            models.Index(fields=['average_rating', 'rating_count'], name='idx_book_rating'),
+        ]
 
     def __str__(self):
         return self.title
@@ -100,7 +110,11 @@ class Member(models.Model):
 
 class Borrowing(models.Model):
     id = models.AutoField(primary_key=True, db_column='borrowing_id')
-    member = models.ForeignKey(Member, db_column='member_id', on_delete=models.DO_NOTHING, related_name='borrowings')
+    # schema.sql indexes member_id only as the leading column of the indexes
+    # below; db_index=False keeps the test database the same.
+    member = models.ForeignKey(
+        Member, db_column='member_id', on_delete=models.DO_NOTHING, related_name='borrowings', db_index=False,
+    )
     book = models.ForeignKey(Book, db_column='book_id', on_delete=models.DO_NOTHING, related_name='borrowings')
     borrow_date = models.DateField(null=True, db_column='borrow_date')
     due_date = models.DateField(null=True, db_column='due_date')
@@ -112,6 +126,11 @@ class Borrowing(models.Model):
     class Meta:
         db_table = 'Borrowing'
         managed = False
+        indexes = [
+            models.Index(fields=['return_date', 'due_date'], name='idx_borrowing_open_due'),
+            models.Index(fields=['member', 'borrow_date'], name='idx_borrowing_member_date'),
+            models.Index(fields=['member', 'id'], name='idx_borrowing_member_id'),
+        ]
 
     def __str__(self):
         return f"{self.member} borrowed {self.book}"
@@ -130,6 +149,7 @@ class Review(models.Model):
         db_table = 'Review'
         managed = False
         unique_together = (('book', 'member'),)
+        indexes = [models.Index(fields=['book'], name='idx_review_book')]
 
     def __str__(self):
         return f"{self.book} - {self.rating} stars"
@@ -156,3 +176,50 @@ class BookCategory(models.Model):
         managed = False
         unique_together = (('book', 'category'),)
 
+class BookRecommendation(models.Model):
+    id = models.AutoField(primary_key=True, db_column='recommendation_id')
+    book = models.ForeignKey(Book, db_column='book_id', on_delete=models.CASCADE, related_name='recommendations')
+    recommended_book = models.ForeignKey(
+        Book, db_column='recommended_book_id', on_delete=models.CASCADE, related_name='+'
+    )
+    position = models.SmallIntegerField(db_column='position')
+    score = models.FloatField(db_column='score')
+    co_borrowers = models.IntegerField(db_column='co_borrowers')
+    computed_at = models.DateTimeField(null=True, db_column='computed_at')
+
+    class Meta:
+        db_table = 'BookRecommendation'
+        managed = False
+        unique_together = (('book', 'position'),)
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.recommended_book_id} ({self.score:.3f})"
+
+
+class RecommendationWatermark(models.Model):
+    id = models.SmallIntegerField(primary_key=True, db_column='watermark_id')
+    last_borrowing_id = models.IntegerField(db_column='last_borrowing_id')
+    updated_at = models.DateTimeField(null=True, db_column='updated_at')
+
+    class Meta:
+        db_table = 'RecommendationWatermark'
+        managed = False
+
+    def __str__(self):
+        return f"recommendations up to borrowing {self.last_borrowing_id}"
+
+
+class StatisticCounter(models.Model):
+    id = models.AutoField(primary_key=True, db_column='counter_id')
+    name = models.CharField(max_length=50, db_column='name')
+    shard = models.SmallIntegerField(default=0, db_column='shard')
+    value = models.BigIntegerField(default=0, db_column='value')
+    updated_at = models.DateTimeField(null=True, db_column='updated_at')
+
+    class Meta:
+        db_table = 'StatisticCounter'
+        managed = False
+        unique_together = (('name', 'shard'),)
+
+    def __str__(self):
+        return f"{self.name}[{self.shard}] = {self.value}"
@@ -0,0 +1,107 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the primary key.
+
+    Each page is fetched with ``WHERE id > <cursor> ORDER BY id LIMIT n``, so
+    the cost of a page does not grow with how deep the client has paged.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = 'id'
+
+
+class MemberBorrowingsPagination(BasePagination):
+    """
+    A member's borrowings, newest first, keyset-paginated on the primary key:
+    ``WHERE member_id = m AND id < <cursor> ORDER BY id DESC LIMIT n``, which
+    idx_borrowing_member_id serves without a sort.
+
+    CursorPagination keys its cursor on the first ordering field only, so
+    ordering by ``-borrow_date`` made it page by offset within a day's
+    borrowings and stop at ``offset_cutoff``. The id is unique, so every row
+    is reachable. The response is CursorPagination's ``{next, previous,
+    results}``.
+
+    ``page_queryset()`` and ``set_page()`` are the two halves of
+    ``paginate_queryset()``, so the async view can evaluate the queryset with
+    the async ORM in between.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size)) if size > 0 else self.page_size
+
+    def decode_cursor(self, request):
+        """``(id, reverse)`` from the request's cursor, or None on the first page."""
+        encoded = request.GET.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            fields = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+            return int(fields['p'][0]), fields.get('r', ['0'])[0] == '1'
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        query = {'p': position, **({'r': '1'} if reverse else {})}
+        encoded = b64encode(parse.urlencode(query).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def page_queryset(self, queryset, request):
+        """The rows to fetch for this page: one more than the page size, to tell whether more follow."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            return queryset.order_by('-id')[:self.page_size + 1]
+        position, reverse = self.cursor
+        if reverse:
+            return queryset.filter(id__gt=position).order_by('id')[:self.page_size + 1]
+        return queryset.filter(id__lt=position).order_by('-id')[:self.page_size + 1]
+
+    def set_page(self, rows):
+        """The page out of the rows ``page_queryset()`` fetched; works out ``next`` and ``previous``."""
+        rows = list(rows)
+        has_more = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        reverse = self.cursor is not None and self.cursor[1]
+        if reverse:
+            page.reverse()
+        self.next = self.previous = None
+        if page:
+            if has_more or reverse:
+                self.next = self.encode_cursor(page[-1].id, reverse=False)
+            if self.cursor is not None and (has_more or not reverse):
+                self.previous = self.encode_cursor(page[0].id, reverse=True)
+        elif self.cursor is not None:
+            # Paged past either end: point back at the first page.
+            self.previous = remove_query_param(self.base_url, self.cursor_query_param)
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(self.page_queryset(queryset, request))
+
+    def get_paginated_data(self, data):
+        return {'next': self.next, 'previous': self.previous, 'results': data}
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
@@ -0,0 +1,213 @@
+"""
+Query plans of every API endpoint.
+
+``collect_plans()`` requests each endpoint in ``sample_requests()`` through
+the test client with the response cache cleared, records the SELECT, UPDATE
+and DELETE statements it runs, and EXPLAINs each one on the connection that
+ran it. A plan is reduced to one line per table access with the estimates
+left out, so it only changes when the access path does:
+
+    MySQL:  "SIMPLE Borrowing ref key=idx_borrowing_member_id Using where"
+    SQLite: "SEARCH Borrowing USING INDEX idx_borrowing_member_id (member_id=?)"
+
+Full table scans and sorts/temporary tables are reported as flags.
+
+``QueryPlanTests`` compares the plans of a small generated dataset with the
+per-vendor baseline in ``query_plans.json`` and fails on any change; run the
+tests with UPDATE_QUERY_PLANS=1 to accept new plans. ``python manage.py
+explain_queries`` prints the same report for the configured database.
+"""
+import json
+import os
+import re
+from contextlib import ExitStack
+
+from django.db import connections, transaction
+from django.test import Client
+from django.urls import reverse
+
+from . import availability, caching, search
+from .models import Library, Book, Author, Category, Member, Borrowing, Review
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'query_plans.json')
+
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+
+
+def sample_requests():
+    """``[(name, method, path, data)]`` covering every API endpoint, using existing rows."""
+    def first(model, **filters):
+        return model.objects.filter(**filters).order_by('id').values_list('id', flat=True).first()
+
+    book = first(Book, available_copies__gt=0) or first(Book)
+    member = first(Member)
+    borrower = Borrowing.objects.order_by('member_id').values_list('member_id', flat=True).first() or member
+    open_borrowing = first(Borrowing, return_date__isnull=True)
+    title_word = next(iter(Book.objects.filter(id=book).values_list('title', flat=True)), 'the').split()[-1]
+
+    requests = [
+        ('library-list-create', 'GET', reverse('library-list-create'), None),
+        ('library-detail', 'GET', reverse('library-detail', args=[first(Library)]), None),
+        ('book-list-create', 'GET', reverse('book-list-create'), None),
+        ('book-detail', 'GET', reverse('book-detail', args=[book]), None),
+        ('book-top-rated', 'GET', reverse('book-top-rated'), None),
+        ('book-search', 'GET', f"{reverse('book-search')}?q={title_word}", None),
+        ('book-recommendations', 'GET', reverse('book-recommendations', args=[book]), None),
+        ('book-availability', 'GET', reverse('book-availability', args=[book]), None),
+        ('book-availability-batch', 'GET', f"{reverse('book-availability-batch')}?ids={book}", None),
+        ('author-list-create', 'GET', reverse('author-list-create'), None),
+        ('author-detail', 'GET', reverse('author-detail', args=[first(Author)]), None),
+        ('category-list-create', 'GET', reverse('category-list-create'), None),
+        ('category-detail', 'GET', reverse('category-detail', args=[first(Category)]), None),
+        ('member-list-create', 'GET', reverse('member-list-create'), None),
+        ('member-detail', 'GET', reverse('member-detail', args=[member]), None),
+        ('member-borrowings', 'GET', reverse('member-borrowings', args=[borrower]), None),
+        ('member-summary', 'GET', reverse('member-summary', args=[borrower]), None),
+        ('borrowing-list-create', 'GET', reverse('borrowing-list-create'), None),
+        ('borrowing-detail', 'GET', reverse('borrowing-detail', args=[first(Borrowing)]), None),
+        ('review-list-create', 'GET', reverse('review-list-create'), None),
+        ('review-detail', 'GET', reverse('review-detail', args=[first(Review)]), None),
+        ('statistics', 'GET', reverse('statistics'), None),
+        ('export', 'GET', reverse('export', args=['borrowings', 'ndjson']), None),
+        ('book-borrow', 'POST', reverse('book-borrow'), {'book_id': book, 'member_id': member}),
+        ('book-borrow-bulk', 'POST', reverse('book-borrow-bulk'), {'items': [{'book_id': book, 'member_id': member}]}),
+        ('book-bulk-upsert', 'POST', reverse('book-bulk-upsert'), {'books': [
+            {'isbn': Book.objects.get(id=book).isbn, 'author_ids': [first(Author)], 'category_ids': [first(Category)]},
+            {'isbn': 'QUERYPLAN-0001', 'title': 'Query plan sample', 'total_copies': 1, 'library_id': first(Library)},
+        ]}),
+    ]
+    if open_borrowing:
+        requests += [
+            ('book-return', 'POST', reverse('book-return'), {'borrowing_id': open_borrowing}),
+            ('book-return-bulk', 'POST', reverse('book-return-bulk'), {'borrowing_ids': [open_borrowing]}),
+        ]
+    return requests
+
+
+class _StatementRecorder:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(EXPLAINED):
+            self.statements.append((context['connection'].alias, sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(alias, sql, params):
+    """Return ``(plan_lines, flags)`` for one statement."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0].lower() for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return _mysql_plan(rows)
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return _sqlite_plan([row[-1] for row in cursor.fetchall()])
+    raise NotImplementedError(f'No EXPLAIN support for {connection.vendor}')
+
+
+def _mysql_plan(rows):
+    lines, flags = [], []
+    for row in rows:
+        extra = row.get('extra') or ''
+        notes = [note for note in ('Using index', 'Using filesort', 'Using temporary') if note in extra]
+        lines.append(' '.join(filter(None, [
+            row.get('select_type'), row.get('table'), row.get('type'), f"key={row.get('key')}", *notes,
+        ])))
+        if row.get('type') == 'ALL':
+            flags.append(f"full scan of {row.get('table')}")
+        if 'Using filesort' in extra:
+            flags.append(f"filesort on {row.get('table')}")
+        if 'Using temporary' in extra:
+            flags.append(f"temporary table for {row.get('table')}")
+    return lines, flags
+
+
+def _sqlite_plan(details):
+    lines, flags = [], []
+    for detail in details:
+        lines.append(detail)
+        if re.match(r'SCAN \S+$', detail):
+            flags.append(f'full scan of {detail.split()[1]}')
+        if 'USE TEMP B-TREE' in detail:
+            flags.append(detail.lower())
+    return lines, flags
+
+
+def collect_plans(requests=None):
+    """``{endpoint: [{'sql', 'plan', 'flags'}, ...]}`` for ``sample_requests()``."""
+    client = Client()
+    search.get_index()
+    results = {}
+    for name, method, path, data in requests or sample_requests():
+        caching.get_cache().clear()
+        availability.get_map().clear()
+        recorder = _StatementRecorder()
+        # Writes are rolled back so every endpoint sees the same data.
+        with transaction.atomic():
+            with _record_all(recorder):
+                if method == 'GET':
+                    response = client.get(path)
+                else:
+                    response = client.post(path, data, content_type='application/json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            entries = []
+            for alias, sql, params in recorder.statements:
+                plan, flags = explain(alias, sql, params)
+                entries.append({'sql': sql, 'plan': plan, 'flags': flags})
+            transaction.set_rollback(True)
+        results[name] = entries
+    return results
+
+
+def _record_all(recorder):
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(recorder))
+    return stack
+
+
+def plan_summary(results):
+    """The part of ``collect_plans()`` output that is compared with the baseline."""
+    return {name: [entry['plan'] for entry in entries] for name, entries in results.items()}
+
+
+def load_baseline(vendor, path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(vendor)
+
+
+def save_baseline(vendor, summary, path=BASELINE_PATH):
+    baselines = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            baselines = json.load(f)
+    baselines[vendor] = summary
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def diff(baseline, summary):
+    """Human-readable differences between two plan summaries; empty if equal."""
+    changes = []
+    for name in sorted(set(baseline) | set(summary)):
+        old, new = baseline.get(name), summary.get(name)
+        if old == new:
+            continue
+        if old is None or new is None:
+            changes.append(f"{name}: {'new endpoint' if old is None else 'endpoint no longer checked'}")
+            continue
+        if len(old) != len(new):
+            changes.append(f'{name}: {len(old)} statements -> {len(new)}')
+        for index, (before, after) in enumerate(zip(old, new)):
+            if before != after:
+                changes.append(f'{name} statement {index + 1}:\n    - ' + '\n    - '.join(before)
+                               + '\n    + ' + '\n    + '.join(after))
+    return changes
@@ -0,0 +1,246 @@
+"""
+"Members who borrowed this also borrowed" recommendations.
+
+``compute()`` (``python manage.py compute_recommendations``) builds a sparse
+co-borrow matrix from Borrowing: for every member, each pair of distinct books
+they borrowed counts once. A neighbour's score is the cosine similarity
+
+    co_borrowers(a, b) / sqrt(borrowers(a) * borrowers(b))
+
+and the best RECOMMENDATIONS_TOP_K neighbours of each book (with at least
+RECOMMENDATIONS_MIN_CO_BORROWERS shared borrowers) are stored in
+BookRecommendation, so the API reads one book's list with a single indexed
+query.
+
+Borrowing is read in windows of members through idx_borrowing_member_date,
+so only one window of rows is held at a time. The matrix is the part that
+grows: it holds one dict entry per co-borrowed pair. Rows are split over
+``partitions`` passes by source book id, and a pass that would hold more than
+``max_pairs`` pairs restarts with twice as many partitions, so memory stays
+bounded whatever the size of the table. Members with very long histories only
+contribute their RECOMMENDATIONS_MAX_BOOKS_PER_MEMBER most recent books.
+
+After a full run the last borrowing id is kept in RecommendationWatermark. An
+incremental run only reads borrowings after it: the members who made them and
+the books those members borrowed are the only rows whose co-borrow counts
+changed, so only those books' lists are recomputed.
+"""
+import heapq
+import math
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from . import caching
+from .models import Borrowing, BookRecommendation, RecommendationWatermark
+
+WATERMARK_ID = 1
+CHUNK_SIZE = 5000
+WRITE_BATCH = 500
+
+
+def top_k():
+    return getattr(settings, 'RECOMMENDATIONS_TOP_K', 10)
+
+
+def min_co_borrowers():
+    return getattr(settings, 'RECOMMENDATIONS_MIN_CO_BORROWERS', 2)
+
+
+def max_books_per_member():
+    return getattr(settings, 'RECOMMENDATIONS_MAX_BOOKS_PER_MEMBER', 200)
+
+
+class _TooManyPairs(Exception):
+    pass
+
+
+def _chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _member_books(queryset):
+    """Yield ``(member_id, [book_id, ...])`` for the rows of ``queryset``, newest first, capped."""
+    rows = queryset.order_by('member_id', '-borrow_date', '-id').values_list('member_id', 'book_id')
+    cap = max_books_per_member()
+    current, books = None, {}
+    for member_id, book_id in rows.iterator(chunk_size=CHUNK_SIZE):
+        if member_id != current:
+            if books:
+                yield current, list(books)
+            current, books = member_id, {}
+        if len(books) < cap:
+            books[book_id] = None
+    if books:
+        yield current, list(books)
+
+
+def _member_windows(chunk_size, member_ids=None):
+    """Borrowing querysets covering ``member_ids`` (every member when None), ``chunk_size`` members each."""
+    if member_ids is not None:
+        for chunk in _chunks(sorted(member_ids), chunk_size):
+            yield Borrowing.objects.filter(member_id__in=chunk)
+        return
+    bounds = Borrowing.objects.aggregate(first=Min('member_id'), last=Max('member_id'))
+    if bounds['first'] is None:
+        return
+    for low in range(bounds['first'], bounds['last'] + 1, chunk_size):
+        yield Borrowing.objects.filter(member_id__gte=low, member_id__lt=low + chunk_size)
+
+
+def _co_borrow_counts(windows, sources, partitions, partition, max_pairs):
+    """``{a: {b: members who borrowed both}}`` for source books ``a`` in this partition."""
+    counts = defaultdict(dict)
+    pairs = 0
+    for queryset in windows:
+        for _, books in _member_books(queryset):
+            for a in books:
+                if a % partitions != partition or (sources is not None and a not in sources):
+                    continue
+                row = counts[a]
+                for b in books:
+                    if b == a:
+                        continue
+                    if b in row:
+                        row[b] += 1
+                    else:
+                        row[b] = 1
+                        pairs += 1
+                if pairs > max_pairs:
+                    raise _TooManyPairs
+    return counts, pairs
+
+
+def _borrower_counts(book_ids, known):
+    """Add the number of distinct borrowers of each of ``book_ids`` missing from ``known``."""
+    missing = [book_id for book_id in book_ids if book_id not in known]
+    for chunk in _chunks(missing, CHUNK_SIZE):
+        rows = (
+            Borrowing.objects.filter(book_id__in=chunk).order_by().values('book_id')
+            .annotate(n=Count('member_id', distinct=True)).values_list('book_id', 'n')
+        )
+        known.update(rows)
+    return known
+
+
+def _rank(counts, borrowers):
+    """``{a: [(b, score, co_borrowers), ...]}`` keeping the best ``top_k()`` neighbours of each book."""
+    k, minimum = top_k(), min_co_borrowers()
+    ranked = {}
+    for a, row in counts.items():
+        candidates = (
+            (b, n / math.sqrt(borrowers[a] * borrowers[b]), n)
+            for b, n in row.items() if n >= minimum
+        )
+        ranked[a] = heapq.nlargest(k, candidates, key=lambda item: (item[1], item[2], -item[0]))
+    return ranked
+
+
+def _store(ranked, now):
+    """Replace the stored lists of every book in ``ranked``; returns rows written."""
+    written = 0
+    for batch in _chunks(ranked, WRITE_BATCH):
+        rows = [
+            BookRecommendation(
+                book_id=a, recommended_book_id=b, position=position, score=score,
+                co_borrowers=n, computed_at=now,
+            )
+            for a in batch
+            for position, (b, score, n) in enumerate(ranked[a], start=1)
+        ]
+        with transaction.atomic():
+            BookRecommendation.objects.filter(book_id__in=batch).delete()
+            BookRecommendation.objects.bulk_create(rows)
+        written += len(rows)
+    return written
+
+
+def watermark():
+    return (
+        RecommendationWatermark.objects.filter(id=WATERMARK_ID)
+        .values_list('last_borrowing_id', flat=True).first()
+    )
+
+
+def _set_watermark(value):
+    RecommendationWatermark.objects.update_or_create(
+        id=WATERMARK_ID, defaults={'last_borrowing_id': value, 'updated_at': timezone.now()}
+    )
+
+
+def compute(full=False, since=None, chunk_size=CHUNK_SIZE, partitions=1, max_pairs=5_000_000, on_pass=None):
+    """
+    Recompute recommendations and return
+    ``{'mode', 'members', 'books', 'pairs', 'partitions', 'rows', 'last_id', 'elapsed'}``.
+
+    Incremental (the default once a full run has recorded its watermark) reads
+    only borrowings after the watermark, or borrowed on or after ``since``.
+    ``on_pass`` is called with the progress dict after every partition.
+    """
+    started = time.perf_counter()
+    last_id = Borrowing.objects.aggregate(last=Max('id'))['last'] or 0
+    previous = watermark()
+    incremental = not full and (since is not None or previous is not None)
+    progress = {
+        'mode': 'incremental' if incremental else 'full', 'members': None, 'books': 0, 'pairs': 0,
+        'partitions': partitions, 'rows': 0, 'last_id': last_id, 'elapsed': 0.0,
+    }
+
+    sources = members = None
+    if incremental:
+        recent = Borrowing.objects.filter(id__lte=last_id)
+        recent = recent.filter(borrow_date__gte=since) if since is not None else recent.filter(id__gt=previous)
+        recent_members = set(recent.order_by().values_list('member_id', flat=True).distinct())
+        sources = set()
+        for chunk in _chunks(recent_members, CHUNK_SIZE):
+            sources.update(
+                Borrowing.objects.filter(member_id__in=chunk).order_by().values_list('book_id', flat=True).distinct()
+            )
+        members = set()
+        for chunk in _chunks(sources, CHUNK_SIZE):
+            members.update(
+                Borrowing.objects.filter(book_id__in=chunk).order_by().values_list('member_id', flat=True).distinct()
+            )
+        progress['members'] = len(members)
+
+    now = timezone.now()
+    borrowers = {}
+    partition = 0
+    while partition < partitions:
+        try:
+            counts, pairs = _co_borrow_counts(
+                _member_windows(chunk_size, members), sources, partitions, partition, max_pairs
+            )
+        except _TooManyPairs:
+            # Start over with smaller partitions; lists already written are rewritten.
+            partitions *= 2
+            partition = 0
+            progress.update(partitions=partitions, books=0, pairs=0, rows=0)
+            continue
+        if sources is not None:
+            # Books whose co-borrowers all fell below the minimum lose their list.
+            for book_id in sources:
+                if book_id % partitions == partition and book_id not in counts:
+                    counts[book_id] = {}
+        _borrower_counts({b for row in counts.values() for b in row} | set(counts), borrowers)
+        progress['rows'] += _store(_rank(counts, borrowers), now)
+        progress['books'] += len(counts)
+        progress['pairs'] += pairs
+        progress['elapsed'] = time.perf_counter() - started
+        if on_pass:
+            on_pass(progress)
+        partition += 1
+
+    if not incremental:
+        # Books nobody borrowed any more keep no stale list.
+        BookRecommendation.objects.filter(computed_at__lt=now).delete()
+    _set_watermark(last_id)
+    caching.bump(BookRecommendation)
+    progress['elapsed'] = time.perf_counter() - started
+    return progress
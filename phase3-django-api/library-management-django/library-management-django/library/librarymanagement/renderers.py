@@ -0,0 +1,101 @@
+"""
+Faster JSON and optional MessagePack renderers/parsers for the API.
+
+FastJSONRenderer/FastJSONParser use orjson when it is installed and fall back
+to DRF's stdlib-based JSONRenderer/JSONParser otherwise; the rendered bytes
+are the same either way. orjson encodes str, int, float, dates and datetimes
+itself; everything else goes through ``encode_default``, which turns model
+instances into their primary key and otherwise defers to DRF's JSONEncoder
+(Decimal, UUID, timedelta, querysets, ...).
+
+MessagePackRenderer/MessagePackParser (``Accept: application/msgpack``) are
+for internal consumers and need the ``msgpack`` package; settings.py only
+enables them when it is installed. They carry the same values as the JSON
+renderer, so dates arrive as ISO 8601 strings.
+"""
+import datetime
+
+from django.db import models
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_drf_default = JSONEncoder().default
+
+
+def encode_default(obj):
+    """Types the fast encoders do not handle themselves, encoded as DRF's JSONEncoder would."""
+    if isinstance(obj, models.Model):
+        return obj.pk
+    return _drf_default(obj)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer producing the same bytes through orjson when available."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        try:
+            rendered = orjson.dumps(data, default=encode_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits and the like; the stdlib encoder copes.
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like JSONRenderer, escape the separators that are invalid inside <script>.
+        if b'\xe2\x80\xa8' in rendered or b'\xe2\x80\xa9' in rendered:
+            rendered = rendered.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return rendered
+
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read() if stream is not None else b'')
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, datetime.datetime):
+        value = obj.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    return encode_default(obj)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, TypeError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
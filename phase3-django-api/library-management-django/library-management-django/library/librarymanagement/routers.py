@@ -0,0 +1,188 @@
+"""
+Read-replica routing.
+
+Outside a request (management commands, shells, tests) everything uses the
+primary (``default``). Inside a request ``ReplicaRoutingMiddleware`` decides:
+
+- GET/HEAD/OPTIONS read from one replica, picked round-robin among the
+  healthy ones and kept for the whole request,
+- reads inside a transaction on the primary stay on the primary,
+- any other method, and any request from a client that wrote within the last
+  READ_YOUR_WRITES_SECONDS (tracked with a cookie), stays on the primary so
+  its reads see its own writes.
+
+Streaming bodies are produced after the middleware has returned;
+``stream_in_request()`` carries the request's routing into them, so exports
+read from the replica too.
+
+Replicas may lag for up to READ_YOUR_WRITES_SECONDS after any write, so
+responses and availability entries cached under a generation bumped in that
+window are built from the primary (see ``caching.bumped_recently()``).
+
+A replica is probed with ``SELECT 1`` at most every
+REPLICA_HEALTH_CHECK_INTERVAL seconds. A replica that fails a probe or a
+query is skipped until the next probe, and reads fall back to the primary
+when no replica is healthy.
+"""
+import contextvars
+import itertools
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+_state = contextvars.ContextVar('replica_routing', default=None)
+
+
+class _RequestRouting:
+    __slots__ = ('use_primary', 'pinned', 'replica')
+
+    def __init__(self, use_primary):
+        self.use_primary = use_primary
+        self.pinned = use_primary
+        self.replica = None
+
+
+def replica_aliases():
+    return [alias for alias in connections if alias != DEFAULT_DB_ALIAS]
+
+
+def read_your_writes_seconds():
+    return getattr(settings, 'READ_YOUR_WRITES_SECONDS', 5)
+
+
+def begin_request(use_primary):
+    return _state.set(_RequestRouting(use_primary))
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+def stream_in_request(content):
+    """Iterate a streaming body under the routing of the request that produced it."""
+    state = _state.get()
+
+    def stream():
+        token = _state.set(state)
+        try:
+            yield from content
+        finally:
+            _state.reset(token)
+
+    async def astream():
+        token = _state.set(state)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            _state.reset(token)
+
+    return astream() if hasattr(content, '__aiter__') else stream()
+
+
+def pin_primary():
+    state = _state.get()
+    if state is not None:
+        state.use_primary = True
+        state.replica = None
+
+
+def reading_from_primary():
+    state = _state.get()
+    return state is None or state.use_primary
+
+
+def may_read_from_replica():
+    """True when this request's reads may still go to a replica."""
+    return not reading_from_primary() and bool(replica_aliases())
+
+
+def pinned_to_primary():
+    """True when this request was sent to the primary to read its own writes."""
+    state = _state.get()
+    return state is not None and state.pinned and bool(replica_aliases())
+
+
+def current_replica():
+    state = _state.get()
+    return state.replica if state is not None else None
+
+
+class ReplicaHealth:
+    def __init__(self):
+        self._checked_at = {}
+        self._healthy = {}
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+
+    def interval(self):
+        return getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 5)
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            due = now - self._checked_at.get(alias, float('-inf')) >= self.interval()
+            if due:
+                # Claim the probe so concurrent requests keep the old verdict
+                # instead of all probing at once.
+                self._checked_at[alias] = now
+        if due:
+            healthy = self._probe(alias)
+            with self._lock:
+                self._healthy[alias] = healthy
+        return self._healthy.get(alias, False)
+
+    def _probe(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except DatabaseError:
+            connections[alias].close()
+            return False
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._healthy[alias] = False
+            self._checked_at[alias] = time.monotonic()
+
+    def choose(self, aliases):
+        if not aliases:
+            return None
+        start = next(self._turn)
+        for offset in range(len(aliases)):
+            alias = aliases[(start + offset) % len(aliases)]
+            if self.is_healthy(alias):
+                return alias
+        return None
+
+
+health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.use_primary:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a write transaction must see its uncommitted rows.
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = health.choose(replica_aliases())
+            if state.replica is None:
+                state.use_primary = True
+                return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
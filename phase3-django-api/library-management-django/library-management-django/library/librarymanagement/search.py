@@ -0,0 +1,482 @@
+"""
+In-process inverted index used by BookSearchAPIView.
+
+Each book is indexed under the tokens of its title, its authors' first and
+last names and its categories' names. A query matches a book when every query
+token matches (the last token is also matched as a prefix so search-as-you-type
+works), and matches are ranked by a field-weighted tf-idf score.
+
+Alongside the postings it keeps facet bitmaps: one Python int per category
+and per library, and one for books with a copy available, with bit ``n`` set
+for book ``n``. ``facets()`` counts a large match set by turning it into a
+bitmap once and counting each facet value with an AND and a popcount. That
+costs the same for every facet value whatever the query, so a small match
+set is counted book by book instead, touching only the values its books
+have. ``bench_facets`` measures both on a given catalog.
+
+The index lives in the worker process. It is built lazily from five flat
+queries, kept current by the signal handlers in ``signals.py`` and rebuilt in
+the background every SEARCH_INDEX_REBUILD_INTERVAL seconds so changes made by
+other worker processes show up within that window; updates committed in this
+process while a rebuild runs are replayed onto the new index before it is
+swapped in. Copy counts change on every borrow and return, so
+``availability`` marks those books stale and ``facets()`` re-reads just their
+counts before counting.
+"""
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from itertools import chain
+
+from django.conf import settings
+
+from .models import Book, Author, Category, BookAuthor, BookCategory
+
+TOKEN_RE = re.compile(r'\w+')
+
+TITLE_WEIGHT = 3.0
+AUTHOR_WEIGHT = 2.0
+CATEGORY_WEIGHT = 1.0
+
+# Prefix matches count for less than an exact token match.
+PREFIX_PENALTY = 0.5
+MAX_PREFIX_EXPANSIONS = 64
+
+CHUNK_SIZE = 5000
+
+# Above this many stale books, reload the whole availability bitmap instead.
+AVAILABILITY_REFRESH_LIMIT = 5000
+
+# Counting facets book by book costs about as much per matching book as
+# ANDing this many bits of facet bitmaps (measured with bench_facets).
+FACET_SCAN_COST_IN_BITS = 12000
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(bits):
+        return bin(bits).count('1')
+
+
+def tokenize(text):
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return TOKEN_RE.findall(text.lower())
+
+
+def to_bitmap(ids):
+    """Return an int with bit ``n`` set for every ``n`` in ``ids``."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for n in ids:
+        buffer[n >> 3] |= 1 << (n & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def top_hits(scores, limit):
+    """The ``limit`` best ``(book_id, score)`` pairs of ``match()`` output."""
+    return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)   # term -> {book_id: weight}
+        self._vocabulary = []                # sorted terms, for prefix lookups
+        self._doc_terms = {}                 # book_id -> {term: weight}
+        self._titles = {}                    # book_id -> title
+        self._book_authors = defaultdict(set)
+        self._book_categories = defaultdict(set)
+        self._author_books = defaultdict(set)
+        self._category_books = defaultdict(set)
+        self._author_names = {}              # author_id -> "first last"
+        self._category_names = {}            # category_id -> name
+        self._book_library = {}              # book_id -> library_id
+        self._all_bits = 0                   # facet bitmaps, bit n = book n
+        self._category_bits = {}
+        self._library_bits = {}
+        self._available_bits = 0
+        self._stale_availability = set()
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._titles)
+
+    # -- building ---------------------------------------------------------
+
+    def build(self):
+        library_books = defaultdict(list)
+        available = []
+        books = Book.objects.values_list('id', 'title', 'library_id', 'available_copies')
+        for book_id, title, library_id, available_copies in books.iterator(chunk_size=CHUNK_SIZE):
+            self._titles[book_id] = title
+            if library_id is not None:
+                self._book_library[book_id] = library_id
+                library_books[library_id].append(book_id)
+            if available_copies:
+                available.append(book_id)
+        for author_id, first, last in Author.objects.values_list('id', 'first_name', 'last_name').iterator(chunk_size=CHUNK_SIZE):
+            self._author_names[author_id] = f"{first or ''} {last or ''}"
+        for category_id, name in Category.objects.values_list('id', 'name').iterator(chunk_size=CHUNK_SIZE):
+            self._category_names[category_id] = name
+        for book_id, author_id in BookAuthor.objects.values_list('book_id', 'author_id').iterator(chunk_size=CHUNK_SIZE):
+            self._book_authors[book_id].add(author_id)
+            self._author_books[author_id].add(book_id)
+        for book_id, category_id in BookCategory.objects.values_list('book_id', 'category_id').iterator(chunk_size=CHUNK_SIZE):
+            self._book_categories[book_id].add(category_id)
+            self._category_books[category_id].add(book_id)
+
+        for book_id in self._titles:
+            terms = self._terms_for(book_id)
+            for term, weight in terms.items():
+                self._postings[term][book_id] = weight
+            self._doc_terms[book_id] = terms
+        self._vocabulary = sorted(self._postings)
+
+        self._all_bits = to_bitmap(self._titles)
+        self._category_bits = {category_id: to_bitmap(books) for category_id, books in self._category_books.items()}
+        self._library_bits = {library_id: to_bitmap(books) for library_id, books in library_books.items()}
+        self._available_bits = to_bitmap(available)
+        self.built_at = time.monotonic()
+        return self
+
+    def _terms_for(self, book_id):
+        terms = defaultdict(float)
+        for token in tokenize(self._titles.get(book_id)):
+            terms[token] += TITLE_WEIGHT
+        for author_id in self._book_authors.get(book_id, ()):
+            for token in tokenize(self._author_names.get(author_id)):
+                terms[token] += AUTHOR_WEIGHT
+        for category_id in self._book_categories.get(book_id, ()):
+            for token in tokenize(self._category_names.get(category_id)):
+                terms[token] += CATEGORY_WEIGHT
+        return terms
+
+    def _reindex(self, book_id):
+        for term in self._doc_terms.pop(book_id, {}):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(book_id, None)
+            if not postings:
+                del self._postings[term]
+                i = bisect_left(self._vocabulary, term)
+                if i < len(self._vocabulary) and self._vocabulary[i] == term:
+                    del self._vocabulary[i]
+        if book_id not in self._titles:
+            return
+        terms = self._terms_for(book_id)
+        for term, weight in terms.items():
+            if term not in self._postings:
+                insort(self._vocabulary, term)
+            self._postings[term][book_id] = weight
+        self._doc_terms[book_id] = terms
+
+    def _set_categories(self, book_id, category_ids):
+        bit = 1 << book_id
+        for category_id in self._book_categories.pop(book_id, ()):
+            self._category_books[category_id].discard(book_id)
+            self._category_bits[category_id] &= ~bit
+        for category_id in category_ids:
+            self._book_categories[book_id].add(category_id)
+            self._category_books[category_id].add(book_id)
+            self._category_bits[category_id] = self._category_bits.get(category_id, 0) | bit
+
+    def _set_library(self, book_id, library_id):
+        bit = 1 << book_id
+        old = self._book_library.pop(book_id, None)
+        if old is not None:
+            self._library_bits[old] &= ~bit
+        if library_id is not None:
+            self._book_library[book_id] = library_id
+            self._library_bits[library_id] = self._library_bits.get(library_id, 0) | bit
+
+    # -- incremental updates ----------------------------------------------
+
+    def update_book(self, book_id, title, library_id=None):
+        with self._lock:
+            self._titles[book_id] = title
+            self._all_bits |= 1 << book_id
+            self._set_library(book_id, library_id)
+            self._stale_availability.add(book_id)
+            self._reindex(book_id)
+
+    def remove_book(self, book_id):
+        with self._lock:
+            self._titles.pop(book_id, None)
+            for author_id in self._book_authors.pop(book_id, ()):
+                self._author_books[author_id].discard(book_id)
+            self._set_categories(book_id, ())
+            self._set_library(book_id, None)
+            self._all_bits &= ~(1 << book_id)
+            self._available_bits &= ~(1 << book_id)
+            self._stale_availability.discard(book_id)
+            self._reindex(book_id)
+
+    def update_author(self, author_id, first_name, last_name):
+        with self._lock:
+            self._author_names[author_id] = f"{first_name or ''} {last_name or ''}"
+            for book_id in self._author_books.get(author_id, ()):
+                self._reindex(book_id)
+
+    def remove_author(self, author_id):
+        with self._lock:
+            self._author_names.pop(author_id, None)
+            for book_id in self._author_books.pop(author_id, ()):
+                self._book_authors[book_id].discard(author_id)
+                self._reindex(book_id)
+
+    def update_category(self, category_id, name):
+        with self._lock:
+            self._category_names[category_id] = name
+            for book_id in self._category_books.get(category_id, ()):
+                self._reindex(book_id)
+
+    def remove_category(self, category_id):
+        with self._lock:
+            self._category_names.pop(category_id, None)
+            self._category_bits.pop(category_id, None)
+            for book_id in self._category_books.pop(category_id, ()):
+                self._book_categories[book_id].discard(category_id)
+                self._reindex(book_id)
+
+    def books_for_author(self, author_id):
+        with self._lock:
+            return set(self._author_books.get(author_id, ()))
+
+    def books_for_category(self, category_id):
+        with self._lock:
+            return set(self._category_books.get(category_id, ()))
+
+    def refresh_links(self, book_ids):
+        """Re-read the author and category links of ``book_ids`` from the database."""
+        book_ids = set(book_ids)
+        if not book_ids:
+            return
+        authors = defaultdict(set)
+        categories = defaultdict(set)
+        for book_id, author_id in BookAuthor.objects.filter(book_id__in=book_ids).values_list('book_id', 'author_id'):
+            authors[book_id].add(author_id)
+        for book_id, category_id in BookCategory.objects.filter(book_id__in=book_ids).values_list('book_id', 'category_id'):
+            categories[book_id].add(category_id)
+        with self._lock:
+            for book_id in book_ids:
+                for author_id in self._book_authors.pop(book_id, ()):
+                    self._author_books[author_id].discard(book_id)
+                for author_id in authors[book_id]:
+                    self._book_authors[book_id].add(author_id)
+                    self._author_books[author_id].add(book_id)
+                self._set_categories(book_id, categories[book_id])
+                self._reindex(book_id)
+
+    def mark_availability_stale(self, book_ids):
+        """Note that the copy counts of ``book_ids`` changed; ``facets()`` re-reads them."""
+        with self._lock:
+            self._stale_availability.update(book_ids)
+
+    def _refresh_availability(self):
+        with self._lock:
+            stale, self._stale_availability = self._stale_availability, set()
+        if not stale:
+            return
+        if len(stale) > AVAILABILITY_REFRESH_LIMIT:
+            available = to_bitmap(
+                Book.objects.filter(available_copies__gt=0).values_list('id', flat=True).iterator(chunk_size=CHUNK_SIZE)
+            )
+            with self._lock:
+                self._available_bits = available & self._all_bits
+            return
+        available = set(Book.objects.filter(id__in=stale, available_copies__gt=0).values_list('id', flat=True))
+        with self._lock:
+            for book_id in stale:
+                if book_id in available and book_id in self._titles:
+                    self._available_bits |= 1 << book_id
+                else:
+                    self._available_bits &= ~(1 << book_id)
+
+    # -- querying ---------------------------------------------------------
+
+    def _expand(self, token, prefix):
+        """Return ``[(term, multiplier)]`` for a query token."""
+        matches = []
+        if token in self._postings:
+            matches.append((token, 1.0))
+        if prefix:
+            i = bisect_left(self._vocabulary, token)
+            while i < len(self._vocabulary) and len(matches) < MAX_PREFIX_EXPANSIONS:
+                term = self._vocabulary[i]
+                if not term.startswith(token):
+                    break
+                if term != token:
+                    matches.append((term, PREFIX_PENALTY))
+                i += 1
+        return matches
+
+    def match(self, query):
+        """Return ``{book_id: score}`` for every book matching all query tokens."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return {}
+        with self._lock:
+            total = len(self._titles) or 1
+            scores = None
+            for position, token in enumerate(tokens):
+                token_scores = {}
+                for term, multiplier in self._expand(token, prefix=position == len(tokens) - 1):
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for book_id, weight in postings.items():
+                        score = weight * idf * multiplier
+                        if score > token_scores.get(book_id, 0.0):
+                            token_scores[book_id] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        book_id: score + token_scores[book_id]
+                        for book_id, score in scores.items()
+                        if book_id in token_scores
+                    }
+                if not scores:
+                    return {}
+            return scores
+
+    def search(self, query, limit=20):
+        """Return ``(total_matches, [(book_id, score), ...])`` ranked by relevance."""
+        scores = self.match(query)
+        return len(scores), top_hits(scores, limit)
+
+    def facets(self, book_ids=None):
+        """
+        Count ``book_ids`` (the keys of ``match()`` output; every book when
+        None) per category, per library and by availability:
+        ``{'category': {id: count}, 'library': {id: count}, 'available': n, 'unavailable': n}``.
+        """
+        self._refresh_availability()
+        with self._lock:
+            if book_ids is None:
+                return self._count_bitmaps(self._all_bits)
+            bitmap_cost = (len(self._category_bits) + len(self._library_bits)) * self._all_bits.bit_length()
+            if len(book_ids) * FACET_SCAN_COST_IN_BITS < bitmap_cost:
+                return self._count_books(book_ids)
+            return self._count_bitmaps(to_bitmap(book_ids) & self._all_bits)
+
+    def _count_bitmaps(self, matches):
+        """``facets()`` for a bitmap of indexed books, one AND per facet value."""
+        counts = {}
+        for name, bitmaps in (('category', self._category_bits), ('library', self._library_bits)):
+            counts[name] = {}
+            for key, bits in bitmaps.items():
+                count = popcount(matches & bits)
+                if count:
+                    counts[name][key] = count
+        return self._with_availability(counts, matches)
+
+    def _count_books(self, book_ids):
+        """``facets()`` book by book, for match sets too small to be worth a pass over every bitmap."""
+        book_ids = [book_id for book_id in book_ids if book_id in self._titles]
+        categories = self._book_categories
+        libraries = Counter(map(self._book_library.get, book_ids))
+        libraries.pop(None, None)
+        counts = {
+            'category': dict(Counter(chain.from_iterable(categories.get(book_id, ()) for book_id in book_ids))),
+            'library': dict(libraries),
+        }
+        return self._with_availability(counts, to_bitmap(book_ids))
+
+    def _with_availability(self, counts, matches):
+        available = popcount(matches & self._available_bits)
+        counts['available'] = available
+        counts['unavailable'] = popcount(matches) - available
+        return counts
+
+    def category_name(self, category_id):
+        return self._category_names.get(category_id)
+
+
+_index = None
+_index_lock = threading.Lock()
+_rebuilding = False
+# Updates committed while a background rebuild runs, replayed onto the new index.
+_pending = []
+
+
+def _rebuild_interval():
+    return getattr(settings, 'SEARCH_INDEX_REBUILD_INTERVAL', 300)
+
+
+def _rebuild():
+    """Build a new index and swap it in, replaying the updates made meanwhile."""
+    global _index, _rebuilding
+    try:
+        fresh = InvertedIndex().build()
+        while True:
+            with _index_lock:
+                pending = _pending[:]
+                del _pending[:]
+                if not pending:
+                    _index = fresh
+                    _rebuilding = False
+                    return
+            for method, args in pending:
+                getattr(fresh, method)(*args)
+    except BaseException:
+        with _index_lock:
+            del _pending[:]
+            _rebuilding = False
+        raise
+
+
+def _rebuild_in_background():
+    try:
+        _rebuild()
+    finally:
+        from django.db import connection
+        connection.close()
+
+
+def apply_update(method, *args):
+    """
+    Call ``InvertedIndex.<method>(*args)`` on the loaded index, if any, and
+    queue it for the index being rebuilt in the background, which may have
+    read the rows before the change.
+    """
+    with _index_lock:
+        index = _index
+        if _rebuilding:
+            _pending.append((method, args))
+    if index is not None:
+        getattr(index, method)(*args)
+
+
+def get_index():
+    """Return the process-wide index, building it on first use."""
+    global _index, _rebuilding
+    with _index_lock:
+        if _index is None:
+            _index = InvertedIndex().build()
+        elif (not _rebuilding and _rebuild_interval()
+                and time.monotonic() - _index.built_at > _rebuild_interval()):
+            _rebuilding = True
+            threading.Thread(target=_rebuild_in_background, daemon=True).start()
+        return _index
+
+
+def loaded_index():
+    """Return the index if it has been built in this process, otherwise None."""
+    return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
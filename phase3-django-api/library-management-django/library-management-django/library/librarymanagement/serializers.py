@@ -1,6 +1,56 @@
 from rest_framework import serializers
 from .models import Library, Book, Author, Category, Member, Borrowing, Review
 
+
+class EagerLoadingMixin:
+    """
+    Lets a serializer declare the relations it reads so views can fetch them
+    up front instead of issuing one query per row.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+
+class SparseFieldsMixin:
+    """
+    Honours ``sparse_fields`` and ``expand`` in the serializer context (set by
+    SparseFieldsViewMixin from ``?fields=``/``?expand=``): ``sparse_fields``
+    keeps only the named keys, ``expand`` renders the related object with
+    ``expandable_fields[name]`` in place of its id.
+    """
+    expandable_fields = {}
+
+    @classmethod
+    def readable_field_names(cls):
+        if '_readable_field_names' not in cls.__dict__:
+            cls._readable_field_names = tuple(
+                name for name, field in cls().fields.items() if not field.write_only
+            )
+        return cls._readable_field_names
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.context.get('expand', ()):
+            fields[name] = self.expandable_fields[name](read_only=True)
+        wanted = self.context.get('sparse_fields')
+        if wanted is not None:
+            fields = {name: field for name, field in fields.items() if name in wanted}
+        return fields
+
+
+def full_name(first_name, last_name):
+    parts = [p for p in (first_name, last_name) if p]
+    return " ".join(parts) if parts else None
+
+
 class LibrarySerializer(serializers.ModelSerializer):
     class Meta:
         model = Library
@@ -16,7 +66,10 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = '__all__'
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    prefetch_related_fields = ('authors', 'categories')
+    expandable_fields = {'library': LibrarySerializer}
+
     authors = AuthorSerializer(many=True, read_only=True)
     categories = CategorySerializer(many=True, read_only=True)
 
@@ -61,6 +114,21 @@ class BookSerializer(serializers.ModelSerializer):
         return book
 
 
+class BookUpsertSerializer(serializers.Serializer):
+    """
+    One row of the bulk book upsert. Only checks the row itself; referenced
+    ids are resolved for the whole batch in ``catalog.upsert_books``.
+    """
+    isbn = serializers.CharField(max_length=20)
+    title = serializers.CharField(max_length=200, required=False)
+    publication_date = serializers.DateField(required=False, allow_null=True)
+    total_copies = serializers.IntegerField(min_value=0, required=False)
+    available_copies = serializers.IntegerField(min_value=0, required=False)
+    library_id = serializers.IntegerField(required=False, allow_null=True)
+    author_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    category_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
 class BookSimpleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
@@ -69,6 +137,7 @@ class BookSimpleSerializer(serializers.ModelSerializer):
 
 class MemberSerializer(serializers.ModelSerializer):
     name = serializers.SerializerMethodField(read_only=True)
+    values_sources = {'name': (('first_name', 'last_name'), full_name)}
 
     class Meta:
         model = Member
@@ -79,11 +148,14 @@ class MemberSerializer(serializers.ModelSerializer):
         ]
 
     def get_name(self, obj):
-        parts = [p for p in (obj.first_name, obj.last_name) if p]
-        return " ".join(parts) if parts else None
+        return full_name(obj.first_name, obj.last_name)
 
 
-class BorrowingSerializer(serializers.ModelSerializer):
+class BorrowingSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('book', 'member')
+    expandable_fields = {'book': BookSimpleSerializer, 'member': MemberSerializer}
+    values_sources = {'member_name': (('member__first_name', 'member__last_name'), full_name)}
+
     book_details = BookSimpleSerializer(source='book', read_only=True)
     member_name = serializers.SerializerMethodField(read_only=True)
 
@@ -94,19 +166,23 @@ class BorrowingSerializer(serializers.ModelSerializer):
     def get_member_name(self, obj):
         if not obj or not obj.member:
             return None
-        parts = [p for p in (obj.member.first_name, obj.member.last_name) if p]
-        return " ".join(parts) if parts else None
+        return full_name(obj.member.first_name, obj.member.last_name)
 
     def validate(self, data):
         book = data.get('book') or getattr(self.instance, 'book', None)
-        is_returned = data.get('is_returned', getattr(self.instance, 'is_returned', False))
+        was_returned = getattr(self.instance, 'return_date', None) is not None
+        is_returned = data.get('return_date', getattr(self.instance, 'return_date', None)) is not None
         if book and not is_returned:
-            if not book.is_available() and (not getattr(self.instance, 'is_returned', False)):
+            if not book.is_available() and not was_returned:
                 raise serializers.ValidationError("Book is not available")
         return data
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('member',)
+    expandable_fields = {'book': BookSimpleSerializer, 'member': MemberSerializer}
+    values_sources = {'member_name': (('member__first_name', 'member__last_name'), full_name)}
+
     member_name = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -116,5 +192,4 @@ class ReviewSerializer(serializers.ModelSerializer):
     def get_member_name(self, obj):
         if not obj or not obj.member:
             return None
-        parts = [p for p in (obj.member.first_name, obj.member.last_name) if p]
-        return " ".join(parts) if parts else None
+        return full_name(obj.member.first_name, obj.member.last_name)
@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import availability, caching, search, statistics
+from .models import Library, Book, Author, Category, Member, Borrowing, Review
+
+
+def _on_index(func, *args):
+    # Apply index updates only once the write is committed, and only if this
+    # process has built an index; otherwise the next build picks the change up.
+    transaction.on_commit(lambda: search.apply_update(func, *args))
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, **kwargs):
+    _on_index('update_book', instance.id, instance.title, instance.library_id)
+    availability.invalidate_on_commit(instance.id)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    _on_index('remove_book', instance.id)
+    availability.invalidate_on_commit(instance.id)
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, **kwargs):
+    _on_index('update_author', instance.id, instance.first_name, instance.last_name)
+
+
+@receiver(post_delete, sender=Author)
+def author_deleted(sender, instance, **kwargs):
+    _on_index('remove_author', instance.id)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    _on_index('update_category', instance.id, instance.name)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    _on_index('remove_category', instance.id)
+
+
+def _linked_books(instance, reverse, pk_set, lookup):
+    if not reverse:
+        return {instance.pk}
+    if pk_set is not None:
+        return set(pk_set)
+    # reverse clear() does not report the affected books; the index still
+    # holds the links at this point since updates are applied on commit.
+    index = search.loaded_index()
+    return getattr(index, lookup)(instance.pk) if index is not None else set()
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _on_index('refresh_links', _linked_books(instance, reverse, pk_set, 'books_for_author'))
+
+
+@receiver(m2m_changed, sender=Book.categories.through)
+def book_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _on_index('refresh_links', _linked_books(instance, reverse, pk_set, 'books_for_category'))
+
+
+COUNTED_MODELS = {Book: 'total_books', Member: 'total_members', Library: 'total_libraries'}
+
+
+def counted_model_saved(sender, instance, created, **kwargs):
+    if created:
+        statistics.increment(**{COUNTED_MODELS[sender]: 1})
+
+
+def counted_model_deleted(sender, instance, **kwargs):
+    statistics.increment(**{COUNTED_MODELS[sender]: -1})
+
+
+# Receivers are connected per model: one connected for every sender would
+# also listen to BookAuthor/BookCategory and make Django load those rows
+# before deleting them, which their composite primary keys do not allow.
+for _model in COUNTED_MODELS:
+    post_save.connect(counted_model_saved, sender=_model)
+    post_delete.connect(counted_model_deleted, sender=_model)
+
+
+@receiver(post_save, sender=Borrowing)
+def borrowing_saved(sender, instance, created, **kwargs):
+    if created and instance.return_date is None:
+        statistics.increment(active_borrowings=1)
+
+
+@receiver(post_delete, sender=Borrowing)
+def borrowing_deleted(sender, instance, **kwargs):
+    if instance.return_date is None:
+        statistics.increment(active_borrowings=-1)
+
+
+CACHED_MODELS = (Library, Book, Author, Category, Member, Borrowing, Review)
+
+
+def cached_model_changed(sender, instance, **kwargs):
+    caching.bump_rows_on_commit(sender, [instance.pk])
+
+
+for _model in CACHED_MODELS:
+    post_save.connect(cached_model_changed, sender=_model)
+    post_delete.connect(cached_model_changed, sender=_model)
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_cache(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        caching.bump_on_commit(Book, Author)
+
+
+@receiver(m2m_changed, sender=Book.categories.through)
+def book_categories_cache(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        caching.bump_on_commit(Book, Category)
@@ -0,0 +1,177 @@
+"""
+Running totals behind StatisticsAPIView.
+
+Instead of counting tables on every request, each write that changes a total
+adjusts a counter row in the same transaction:
+
+- books/members/libraries/borrowings created or deleted through the ORM
+  (signal handlers in ``signals.py``),
+- borrow and return (``circulation.py``), which also bump ``Book.borrow_count``
+  that the most-borrowed list reads through its index,
+- review create/update/delete (the review views), which also keep
+  ``Book.rating_count``/``rating_sum``/``average_rating`` current through
+  ``rate()`` for the top-rated list and its index.
+
+Counters are split over STATISTICS_COUNTER_SHARDS rows chosen at random per
+write, so concurrent borrows of different books do not queue on one row lock.
+
+Counters start from zero: on a database that already holds data, run
+``python manage.py reconcile_statistics`` once (see ``upgrade.sql``). Reading
+the counters never reconciles, so a request costs the same however large the
+catalog is.
+
+Writes that bypass these paths (raw SQL, bulk loads, editing return_date
+through the generic borrowing endpoints) make the totals drift until the next
+``python manage.py reconcile_statistics``, which recomputes everything from
+the source tables and should run periodically (e.g. every 15 minutes).
+"""
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, F, Avg, Count, Sum, Value, OuterRef, Subquery, IntegerField, FloatField
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from . import caching
+from .models import Library, Book, Member, Borrowing, Review, StatisticCounter
+
+COUNTERS = (
+    'total_books',
+    'total_members',
+    'total_libraries',
+    'active_borrowings',
+    'rating_sum',
+    'rating_count',
+)
+
+TOP_BORROWED = 5
+
+TOP_RATED = 10
+
+
+def _shards():
+    return getattr(settings, 'STATISTICS_COUNTER_SHARDS', 8)
+
+
+def _add(rows, deltas):
+    return rows.update(value=F('value') + Case(
+        *[When(name=name, then=Value(delta)) for name, delta in deltas.items()],
+        default=Value(0),
+    ))
+
+
+def increment(**deltas):
+    """
+    Add ``deltas`` (counter name -> amount) to the counters in one UPDATE,
+    creating the shard's rows first if they do not exist yet.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    shard = random.randrange(_shards())
+    rows = StatisticCounter.objects.filter(name__in=deltas, shard=shard)
+    if _add(rows, deltas) == len(deltas):
+        return
+    # Some rows are missing (a new database, or more shards configured). The
+    # existing ones were just updated; create the others at zero, ignoring
+    # rows a concurrent writer created meanwhile, and add to those.
+    missing = set(deltas) - set(rows.values_list('name', flat=True))
+    StatisticCounter.objects.bulk_create(
+        [StatisticCounter(name=name, shard=shard) for name in missing], ignore_conflicts=True,
+    )
+    _add(rows.filter(name__in=missing), {name: deltas[name] for name in missing})
+
+
+def rate(book_id, rating_sum=0, rating_count=0):
+    """Apply a review change to the book's rating columns, inside the review's transaction."""
+    Book.objects.filter(pk=book_id).update(
+        # Listed first: MySQL applies SET assignments left to right, and the
+        # average must be computed from the old totals.
+        average_rating=(
+            Cast(F('rating_sum') + rating_sum, FloatField()) / NullIf(F('rating_count') + rating_count, 0)
+        ),
+        rating_sum=F('rating_sum') + rating_sum,
+        rating_count=F('rating_count') + rating_count,
+    )
+    caching.bump_rows_on_commit(Book, [book_id])
+
+
+def top_rated(limit=TOP_RATED, min_reviews=1):
+    """Best average rating first, read in idx_book_rating order."""
+    return (
+        Book.objects.filter(rating_count__gte=max(min_reviews, 1))
+        .order_by('-average_rating', '-rating_count', '-id')
+        .values('id', 'title', 'average_rating', 'rating_count')[:limit]
+    )
+
+
+def counters():
+    """``{name: total}`` for every counter in COUNTERS; counters without rows are 0."""
+    totals = dict.fromkeys(COUNTERS, 0)
+    totals.update(
+        StatisticCounter.objects.filter(name__in=COUNTERS).values_list('name').annotate(total=Sum('value'))
+    )
+    return totals
+
+
+def snapshot():
+    totals = counters()
+    return {
+        'total_books': totals['total_books'],
+        'total_members': totals['total_members'],
+        'active_borrowings': totals['active_borrowings'],
+        'total_libraries': totals['total_libraries'],
+        'average_rating': (
+            totals['rating_sum'] / totals['rating_count'] if totals['rating_count'] else None
+        ),
+        'most_borrowed_books': list(
+            Book.objects.order_by('-borrow_count', 'id')
+            .values('title', 'borrow_count')[:TOP_BORROWED]
+        ),
+    }
+
+
+def reconcile(chunk_size=10000):
+    """Recompute every counter and the per-book borrow and rating columns from the source tables."""
+    borrow_counts = (
+        Borrowing.objects.filter(book_id=OuterRef('id'))
+        .order_by().values('book_id').annotate(n=Count('*')).values('n')
+    )
+    book_reviews = Review.objects.filter(book_id=OuterRef('id')).order_by().values('book_id')
+    last_id = 0
+    while True:
+        ids = list(
+            Book.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        Book.objects.filter(id__gte=ids[0], id__lte=ids[-1]).update(
+            borrow_count=Coalesce(Subquery(borrow_counts, output_field=IntegerField()), 0),
+            rating_count=Coalesce(Subquery(book_reviews.annotate(n=Count('*')).values('n')), 0),
+            rating_sum=Coalesce(Subquery(book_reviews.annotate(total=Sum('rating')).values('total')), 0),
+            average_rating=Subquery(book_reviews.annotate(average=Avg('rating')).values('average')),
+        )
+        last_id = ids[-1]
+
+    with transaction.atomic():
+        StatisticCounter.objects.bulk_create(
+            [StatisticCounter(name=name, shard=shard) for name in COUNTERS for shard in range(_shards())],
+            ignore_conflicts=True,
+        )
+        # Lock the counters before counting: writers committing meanwhile wait
+        # here and apply their increment on top of the recomputed totals.
+        rows = StatisticCounter.objects.select_for_update().filter(name__in=COUNTERS)
+        list(rows.values_list('id'))
+        ratings = Review.objects.aggregate(rating_sum=Sum('rating'), rating_count=Count('id'))
+        totals = {
+            'total_books': Book.objects.count(),
+            'total_members': Member.objects.count(),
+            'total_libraries': Library.objects.count(),
+            'active_borrowings': Borrowing.objects.filter(return_date__isnull=True).count(),
+            'rating_sum': ratings['rating_sum'] or 0,
+            'rating_count': ratings['rating_count'],
+        }
+        rows.exclude(shard=0).update(value=0)
+        for name, value in totals.items():
+            rows.filter(name=name, shard=0).update(value=value)
+    return totals
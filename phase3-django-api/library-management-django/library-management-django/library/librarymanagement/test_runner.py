@@ -0,0 +1,27 @@
+from django.apps import apps
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class UnmanagedModelTestRunner(DiscoverRunner):
+    """
+    The app's models map onto the hand-written schema in schema.sql and are
+    declared ``managed = False``, so Django would not create their tables in
+    the test database. Treat them as managed, and build them from the models
+    rather than the migrations, for the duration of the test run.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        self._unmanaged = [
+            model for model in apps.get_app_config('librarymanagement').get_models()
+            if not model._meta.managed
+        ]
+        for model in self._unmanaged:
+            model._meta.managed = True
+        settings.MIGRATION_MODULES = {**settings.MIGRATION_MODULES, 'librarymanagement': None}
+        super().setup_test_environment(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        super().teardown_test_environment(**kwargs)
+        for model in self._unmanaged:
+            model._meta.managed = False
@@ -1,3 +1,1247 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+
+from . import (
+    admission, apischema, availability, caching, catalog, datagen, exports, fees, metrics, middleware, queryplans,
+    recommendations, renderers, routers, search, statistics,
+)
+from .management.commands.stress_borrow import run_stress
+from .models import (
+    Library, Book, Author, Category, Member, Borrowing, Review, BookAuthor, BookCategory, StatisticCounter,
+)
+
+
+def make_catalog(books=3, prefix='Book'):
+    library = Library.objects.create(name=f'{prefix} Library')
+    author = Author.objects.create(first_name='Jane', last_name='Austen')
+    category = Category.objects.create(name=f'{prefix} Fiction')
+    created = []
+    for i in range(books):
+        book = Book.objects.create(
+            title=f'{prefix} {i}', isbn=f'{prefix}-{i}',
+            total_copies=2, available_copies=2, library=library,
+        )
+        BookAuthor.objects.create(book=book, author=author)
+        BookCategory.objects.create(book=book, category=category)
+        created.append(book)
+    return created
+
+
+def make_member(first_name='Alice', last_name='Smith'):
+    return Member.objects.create(first_name=first_name, last_name=last_name, member_type='student')
+
+
+class EagerLoadingTests(APITestCase):
+    """List pages must cost the same number of queries regardless of row count."""
+
+    def setUp(self):
+        search.reset_index()
+
+    def queries_for(self, url):
+        caching.get_cache().clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, url, add_rows):
+        before = self.queries_for(url)
+        add_rows()
+        self.assertEqual(self.queries_for(url), before)
+
+    def test_book_list(self):
+        make_catalog(2, 'A')
+        self.assertConstantQueries(reverse('book-list-create'), lambda: make_catalog(10, 'B'))
+
+    def test_book_search(self):
+        def add_books(prefix, count):
+            make_catalog(count, prefix)
+            search.reset_index()
+            search.get_index()
+
+        add_books('A', 2)
+        self.assertConstantQueries(reverse('book-search') + '?q=austen', lambda: add_books('B', 10))
+
+    def test_borrowing_list(self):
+        member = make_member()
+
+        def borrow(books):
+            for book in books:
+                Borrowing.objects.create(
+                    member=member, book=book,
+                    borrow_date=date.today(), due_date=date.today() + timedelta(days=14),
+                )
+
+        borrow(make_catalog(2, 'A'))
+        self.assertConstantQueries(reverse('borrowing-list-create'), lambda: borrow(make_catalog(10, 'B')))
+        self.assertConstantQueries(reverse('member-borrowings', args=[member.pk]), lambda: borrow(make_catalog(10, 'C')))
+
+    def test_review_list(self):
+        def review(books):
+            for i, book in enumerate(books):
+                Review.objects.create(member=make_member(f'M{book.pk}'), book=book, rating=i % 5 + 1)
+
+        review(make_catalog(2, 'A'))
+        self.assertConstantQueries(reverse('review-list-create'), lambda: review(make_catalog(10, 'B')))
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        now = timezone.now()
+        self.books = make_catalog(3)
+        Book.objects.filter(id=self.books[0].id).update(created_at=now, average_rating='4.50')
+        member = make_member()
+        Borrowing.objects.create(
+            member=member, book=self.books[0], borrow_date=date.today(),
+            due_date=date.today() + timedelta(days=14), late_fee='1.50', created_at=now,
+        )
+        Review.objects.create(book=self.books[1], member=member, rating=5, review_date=date.today())
+
+    def get(self, url):
+        caching.get_cache().clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_values_path_matches_serializer(self):
+        for url in (
+            reverse('book-list-create'),
+            reverse('book-list-create') + '?fields=id,title,authors,library&expand=library',
+            reverse('borrowing-list-create') + '?expand=member',
+            reverse('review-list-create') + '?expand=book',
+        ):
+            fast = self.get(url).content
+            with self.settings(FAST_LIST_SERIALIZATION=False):
+                self.assertEqual(self.get(url).content, fast, url)
+
+    def test_fields_and_expand(self):
+        rows = self.get(reverse('book-list-create') + '?fields=id,title').data['results']
+        self.assertEqual([list(row) for row in rows], [['id', 'title']] * 3)
+        row = self.get(reverse('borrowing-list-create') + '?fields=member,late_fee&expand=member').data['results'][0]
+        self.assertEqual(row, {'member': dict(row['member'], name='Alice Smith'), 'late_fee': '1.50'})
+        self.assertEqual(self.client.get(reverse('review-list-create') + '?fields=rating,stars').status_code, 400)
+        self.assertEqual(self.client.get(reverse('review-list-create') + '?expand=authors').status_code, 400)
+
+
+class RenderingTests(APITestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        make_catalog(10)
+
+    def test_fast_json_matches_drf(self):
+        data = {
+            'date': date(2026, 1, 2), 'at': timezone.now(), 'late_fee': Decimal('1.50'),
+            'text': 'caf\u00e9 \u2028', 'items': [1, 2.5, None, True], 'keys': {1: 'x'},
+        }
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_large_bodies_are_compressed(self):
+        url = reverse('book-list-create')
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        small = self.client.get(reverse('book-availability', args=[Book.objects.first().id]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+    @skipIf(renderers.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_negotiation(self):
+        url = reverse('book-list-create')
+        response = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(renderers.msgpack.unpackb(response.content), self.client.get(url).json())
+
+
+class OpenAPISchemaTests(APITestCase):
+    def setUp(self):
+        apischema.reset()
+        self.addCleanup(apischema.reset)
+
+    def test_generated_once_and_revalidated(self):
+        with mock.patch.object(apischema, 'build_schema', wraps=apischema.build_schema) as build:
+            first = self.client.get(reverse('schema-json'))
+            self.assertEqual(self.client.get(reverse('schema-swagger-ui')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('schema-yaml')).status_code, 200)
+            again = self.client.get(reverse('schema-json'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(build.call_count, 1)
+        self.assertIn('/books/{id}/', first.json()['paths'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_generate_command_writes_served_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('generate_openapi', '--output-dir', directory, stdout=io.StringIO())
+            call_command('generate_openapi', '--output-dir', directory, '--check', stdout=io.StringIO())
+            path = os.path.join(directory, f'openapi-{apischema.api_version()}.json')
+            with self.settings(OPENAPI_SCHEMA_FILE=path):
+                with open(path, 'rb') as handle:
+                    self.assertEqual(self.client.get(reverse('schema-json')).content, handle.read())
+            with open(path, 'ab') as handle:
+                handle.write(b' ')
+            with self.assertRaises(CommandError):
+                call_command('generate_openapi', '--output-dir', directory, '--check', stdout=io.StringIO())
+
+    def test_configured_files_are_read_at_startup(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('generate_openapi', '--output-dir', directory, stdout=io.StringIO())
+            path = os.path.join(directory, f'openapi-{apischema.api_version()}.json')
+            with open(path, 'rb') as handle:
+                json_body = handle.read()
+            with open(path.replace('.json', '.yaml'), 'rb') as handle:
+                yaml_body = handle.read()
+            with self.settings(OPENAPI_SCHEMA_FILE=path):
+                apps.get_app_config('librarymanagement').ready()
+                os.remove(path)
+                with mock.patch.object(apischema, 'build_schema') as build:
+                    self.assertEqual(self.client.get(reverse('schema-json')).content, json_body)
+                    self.assertEqual(self.client.get(reverse('schema-yaml')).content, yaml_body)
+        build.assert_not_called()
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.book = make_catalog(1)[0]
+        self.url = reverse('book-detail', args=[self.book.pk])
+
+    def test_conditional_get_and_invalidation(self):
+        first = self.client.get(self.url)
+        etag = first['ETag']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(self.url).data['title'], first.data['title'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'title': 'Renamed'}, format='json')
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['title'], 'Renamed')
+        self.assertNotEqual(second['ETag'], etag)
+
+    def test_update_moves_last_modified(self):
+        Book.objects.filter(pk=self.book.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'title': 'Renamed'}, format='json')
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_borrow_only_invalidates_the_borrowed_book(self):
+        other = make_catalog(1, 'Other')[0]
+        other_url = reverse('book-detail', args=[other.pk])
+        etag, other_etag = self.client.get(self.url)['ETag'], self.client.get(other_url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('book-borrow'), {
+                'book_id': self.book.id, 'member_id': make_member().id,
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.client.cookies.clear()   # with replicas, the writer's own reads skip the cache for a while
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(other_url, HTTP_IF_NONE_MATCH=other_etag).status_code, 304)
+        borrowed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(borrowed.status_code, 200)
+        self.assertEqual(borrowed.data['available_copies'], 1)
+
+    def test_hits_and_misses_are_counted(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        self.client.get(self.url)
+        self.client.get(self.url)
+        with self.settings(RESPONSE_CACHE_ENABLED=False):
+            self.client.get(self.url)
+        self.assertEqual(metrics.registry.counter_values('library_response_cache_total'), {
+            (('route', 'book-detail'), ('outcome', 'miss')): 1,
+            (('route', 'book-detail'), ('outcome', 'hit')): 1,
+        })
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    """The benchmark's worker threads have their own connections, so its data must be committed."""
+
+    def setUp(self):
+        caching.get_cache().clear()
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        make_catalog(1)
+        make_member()
+
+    def test_reports_cache_hits_and_runs_without_the_cache(self):
+        for flags, cached in (((), '100%'), (('--no-cache',), '-')):
+            out = io.StringIO()
+            call_command(
+                'benchmark', '--endpoint', 'book-detail', '--requests', '5', '--concurrency', '1',
+                '--warmup', '1', *flags, stdout=out, stderr=io.StringIO(),
+            )
+            self.assertEqual(out.getvalue().splitlines()[-1].split()[-2:], [cached, '0'])
+        self.assertTrue(getattr(settings, 'RESPONSE_CACHE_ENABLED', True))
+
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.book = make_catalog(1)[0]
+        self.member = make_member()
+        # Borrowed on the same day: the ordering must not depend on borrow_date ties.
+        self.borrowings = [
+            Borrowing.objects.create(
+                member=self.member, book=self.book, borrow_date=date(2024, 9, 2), due_date=date(2024, 9, 16)
+            )
+            for _ in range(7)
+        ]
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_member_borrowings_reach_every_row(self):
+        newest_first = [b.id for b in reversed(self.borrowings)]
+        first = self.client.get(reverse('member-borrowings', args=[self.member.pk]) + '?page_size=3')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        third = self.client.get(second.data['next'])
+        self.assertEqual(self.ids(first) + self.ids(second) + self.ids(third), newest_first)
+        self.assertIsNone(third.data['next'])
+        self.assertEqual(self.ids(self.client.get(third.data['previous'])), newest_first[3:6])
+        self.assertEqual(self.ids(self.client.get(second.data['previous'])), newest_first[:3])
+        invalid = self.client.get(reverse('member-borrowings', args=[self.member.pk]) + '?cursor=%%%')
+        self.assertEqual(invalid.status_code, 404)
+
+    def test_book_list_pages_by_id(self):
+        books = [self.book] + make_catalog(2, 'Beta')
+        first = self.client.get(reverse('book-list-create') + '?page_size=2')
+        second = self.client.get(first.data['next'])
+        self.assertEqual(self.ids(first) + self.ids(second), [book.id for book in books])
+        self.assertIsNone(second.data['next'])
+
+
+class AvailabilityTests(APITestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        availability.get_map().clear()
+        self.books = make_catalog(2)
+
+    def test_hits_skip_the_database_until_a_borrow(self):
+        book = self.books[0]
+        self.assertEqual(availability.get_map().get_many([book.id])[book.id].available, 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('book-availability', args=[book.id])).data['available_copies'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('book-borrow'), {'book_id': book.id, 'member_id': make_member().id}, format='json')
+        self.assertEqual(availability.get_map().get_many([book.id])[book.id].available, 1)
+
+    def test_borrow_committed_during_a_read_counts_once(self):
+        # The row is read after the borrow commits but before its on-commit
+        # callback runs: the entry already holds the change.
+        book, availability_map = self.books[0], availability.get_map()
+        real_filter = Book.objects.filter
+
+        def borrow_then_filter(*args, **kwargs):
+            real_filter(pk=book.id).update(available_copies=1)
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(Book.objects, 'filter', side_effect=borrow_then_filter):
+            self.assertEqual(availability_map.get_many([book.id])[book.id].available, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            availability.invalidate_on_commit(book.id)
+        self.assertEqual(availability_map.get_many([book.id])[book.id].available, 1)
+
+    def test_versions_are_kept_only_for_books_that_exist(self):
+        book, cache = self.books[0], caching.get_cache()
+        self.assertEqual(list(availability.get_map().get_many([book.id, 999999])), [book.id])
+        self.assertIsNotNone(cache.get(availability._version_key(book.id)))
+        self.assertIsNone(cache.get(availability._version_key(999999)))
+
+    def test_batch(self):
+        url = reverse('book-availability-batch')
+        ids = [self.books[1].id, self.books[0].id]
+        response = self.client.get(url, {'ids': f'{ids[0]},{ids[1]},{ids[0]},999999'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['book_id'] for row in response.data['results']], ids)
+        self.assertEqual(response.data['missing'], [999999])
+
+        self.assertEqual(self.client.get(url, {'ids': f'{ids[0]},abc'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'ids': ' , '}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+
+class SearchIndexTests(APITestCase):
+    def setUp(self):
+        search.reset_index()
+        caching.get_cache().clear()
+        self.library = Library.objects.create(name='Central')
+        self.austen = Author.objects.create(first_name='Jane', last_name='Austen')
+        self.pride = self.book('Pride and Prejudice', self.austen)
+        self.emma = self.book('Emma', self.austen)
+        self.prideful = self.book('A Prideful Life', Author.objects.create(first_name='Tom', last_name='Pride'))
+        search.get_index()
+
+    def book(self, title, author):
+        book = Book.objects.create(title=title, isbn=title[:20], total_copies=1, available_copies=1, library=self.library)
+        BookAuthor.objects.create(book=book, author=author)
+        return book
+
+    def ids(self, query):
+        return [book_id for book_id, _ in search.get_index().search(query)[1]]
+
+    def test_ranking_and_prefix_matching(self):
+        # A title match outranks an author match; "pri" matches "pride" and "prideful" as prefixes.
+        self.assertEqual(self.ids('pride')[:2], [self.pride.id, self.prideful.id])
+        self.assertEqual(set(self.ids('pri')), {self.pride.id, self.prideful.id})
+        self.assertEqual(self.ids('austen emm'), [self.emma.id])
+        self.assertEqual(self.ids('austen pri'), [self.pride.id])
+        self.assertEqual(self.ids('zzz'), [])
+
+    def test_signals_update_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.emma.title = 'Persuasion'
+            self.emma.save()
+            self.austen.last_name = 'Bennet'
+            self.austen.save()
+            BookAuthor.objects.filter(book=self.prideful).delete()
+            self.prideful.delete()
+        self.assertEqual(self.ids('persuasion'), [self.emma.id])
+        self.assertEqual(self.ids('emma'), [])
+        self.assertEqual(set(self.ids('bennet')), {self.pride.id, self.emma.id})
+        self.assertEqual(self.ids('prideful'), [])
+
+    def test_updates_during_rebuild_are_replayed(self):
+        build = search.InvertedIndex.build
+
+        def build_then_commit(index):
+            build(index)
+            # A write commits after the rebuild has read the books.
+            Book.objects.filter(id=self.emma.id).update(title='Sanditon')
+            search.apply_update('update_book', self.emma.id, 'Sanditon', self.library.id)
+            return index
+
+        search._rebuilding = True
+        with mock.patch.object(search.InvertedIndex, 'build', build_then_commit):
+            search._rebuild()
+        self.assertFalse(search._rebuilding)
+        self.assertEqual(self.ids('sanditon'), [self.emma.id])
+
+
+class SearchFacetTests(APITestCase):
+    def setUp(self):
+        search.reset_index()
+        caching.get_cache().clear()
+        self.books = make_catalog(3, 'Alpha') + make_catalog(2, 'Beta')
+        search.get_index()
+
+    def facets(self, query):
+        response = self.client.get(reverse('book-search') + f'?q={query}&facets=1')
+        self.assertEqual(response.status_code, 200)
+        return response.data['facets']
+
+    def test_counts_cover_all_matches(self):
+        facets = self.facets('austen')
+        self.assertEqual([(c['name'], c['count']) for c in facets['category']], [('Alpha Fiction', 3), ('Beta Fiction', 2)])
+        self.assertEqual([(l['name'], l['count']) for l in facets['library']], [('Alpha Library', 3), ('Beta Library', 2)])
+        self.assertEqual(facets['availability'], {'available': 5, 'unavailable': 0})
+        self.assertEqual(self.facets('beta')['availability'], {'available': 2, 'unavailable': 0})
+
+    def test_availability_follows_borrows(self):
+        member = make_member()
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                self.client.post(reverse('book-borrow'), {'book_id': self.books[0].id, 'member_id': member.id}, format='json')
+        self.assertEqual(self.facets('alpha')['availability'], {'available': 2, 'unavailable': 1})
+
+    def test_small_and_large_match_sets_count_alike(self):
+        index = search.get_index()
+        Book.objects.filter(id=self.books[1].id).update(available_copies=0)
+        index.mark_availability_stale([self.books[1].id])
+        for book_ids in (index.match('alpha'), index.match('austen'), {self.books[3].id: 1.0}, {}):
+            with mock.patch.object(search, 'FACET_SCAN_COST_IN_BITS', 0):
+                by_book = index.facets(book_ids)
+            with mock.patch.object(search, 'FACET_SCAN_COST_IN_BITS', 10 ** 9):
+                self.assertEqual(index.facets(book_ids), by_book)
+        self.assertEqual(by_book, {'category': {}, 'library': {}, 'available': 0, 'unavailable': 0})
+        # A five-book catalog is cheaper to count with bitmaps; make scanning the cheaper one.
+        with mock.patch.object(search, 'FACET_SCAN_COST_IN_BITS', 1), \
+                mock.patch.object(index, '_count_bitmaps', wraps=index._count_bitmaps) as bitmaps:
+            facets = index.facets(index.match('alpha 1'))
+        bitmaps.assert_not_called()
+        self.assertEqual(facets['category'], {BookCategory.objects.get(book=self.books[1]).category_id: 1})
+        self.assertEqual((facets['available'], facets['unavailable']), (0, 1))
+
+
+class StatisticsCounterTests(APITestCase):
+    def test_increment_creates_missing_rows(self):
+        StatisticCounter.objects.create(name='total_books', shard=0, value=10)
+        with self.settings(STATISTICS_COUNTER_SHARDS=1):
+            statistics.increment(total_books=2, active_borrowings=1)
+            statistics.increment(total_books=-1, active_borrowings=1)
+        totals = statistics.counters()
+        self.assertEqual((totals['total_books'], totals['active_borrowings'], totals['total_members']), (11, 2, 0))
+        self.assertEqual(StatisticCounter.objects.count(), 2)
+
+    def test_reading_never_reconciles(self):
+        StatisticCounter.objects.create(name='some_watermark', shard=0, value=99)
+        with mock.patch.object(statistics, 'reconcile') as reconcile:
+            totals = statistics.counters()
+            self.assertEqual(self.client.get(reverse('statistics')).data['total_books'], 0)
+        reconcile.assert_not_called()
+        self.assertEqual(totals, dict.fromkeys(statistics.COUNTERS, 0))
+
+    def test_reconcile_command_recounts(self):
+        make_catalog(3)
+        make_member()
+        StatisticCounter.objects.update(value=0)
+        call_command('reconcile_statistics', stdout=io.StringIO())
+        response = self.client.get(reverse('statistics'))
+        self.assertEqual((response.data['total_books'], response.data['total_members']), (3, 1))
+
+
+class RatingTests(APITestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.a, self.b = make_catalog(2)
+        self.members = [make_member(f'M{i}') for i in range(4)]
+
+    def review(self, book, member, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('review-list-create'), {'book': book.pk, 'member': member.pk, 'rating': rating}, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def test_aggregates_follow_review_writes(self):
+        for member, rating in zip(self.members, (5, 4, 2)):
+            self.review(self.a, member, rating)
+        moved = self.review(self.b, self.members[3], 5)
+        self.assertEqual(self.client.get(reverse('book-detail', args=[self.a.pk])).data['average_rating'], '3.67')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('review-detail', args=[moved]), {'book': self.a.pk, 'rating': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.rating_count, self.a.rating_sum, str(self.a.average_rating)), (4, 14, '3.50'))
+        self.assertEqual((self.b.rating_count, self.b.average_rating), (0, None))
+
+        top = self.client.get(reverse('book-top-rated') + '?min_reviews=1').data
+        self.assertEqual([(row['book_id'], row['average_rating']) for row in top], [(self.a.pk, '3.50')])
+        self.assertEqual(self.client.get(reverse('book-top-rated') + '?min_reviews=5').data, [])
+
+    def test_reconcile_recomputes_ratings(self):
+        Review.objects.create(book=self.a, member=self.members[0], rating=4, review_date=date.today())
+        Review.objects.create(book=self.a, member=self.members[1], rating=1, review_date=date.today())
+        statistics.reconcile()
+        self.a.refresh_from_db()
+        self.assertEqual((self.a.rating_count, self.a.rating_sum, str(self.a.average_rating)), (2, 5, '2.50'))
+
+
+class RecommendationTests(APITestCase):
+    def setUp(self):
+        self.a, self.b, self.c, self.d = make_catalog(4)
+        self.members = [make_member(f'M{i}') for i in range(4)]
+
+    def borrow(self, member, *books):
+        for book in books:
+            Borrowing.objects.create(
+                member=member, book=book, borrow_date=date.today(), due_date=date.today() + timedelta(days=14)
+            )
+
+    def recommended(self, book):
+        response = self.client.get(reverse('book-recommendations', args=[book.pk]))
+        self.assertEqual(response.status_code, 200)
+        return [(row['book_id'], row['co_borrowers']) for row in response.data['results']]
+
+    def test_full_then_incremental(self):
+        for member in self.members[:3]:
+            self.borrow(member, self.a, self.b)
+        for member in self.members[:2]:
+            self.borrow(member, self.c)
+        self.assertEqual(recommendations.compute()['mode'], 'full')
+        self.assertEqual(recommendations.watermark(), Borrowing.objects.latest('id').id)
+        self.assertFalse(StatisticCounter.objects.exclude(name__in=statistics.COUNTERS).exists())
+        self.assertEqual(self.recommended(self.a), [(self.b.pk, 3), (self.c.pk, 2)])
+        self.assertEqual(self.recommended(self.d), [])
+
+        self.borrow(self.members[2], self.c)
+        self.borrow(self.members[3], self.c, self.d)
+        progress = recommendations.compute(partitions=2)
+        self.assertEqual(progress['mode'], 'incremental')
+        self.assertEqual(self.recommended(self.a), [(self.b.pk, 3), (self.c.pk, 3)])
+        self.assertEqual(self.recommended(self.c)[0], (self.a.pk, 3))
+        self.assertEqual(self.client.get(reverse('book-recommendations', args=[0])).status_code, 404)
+
+
+class BookBulkUpsertTests(APITestCase):
+    def setUp(self):
+        search.reset_index()
+        self.books = make_catalog(2, 'Alpha')
+        Book.objects.filter(id=self.books[0].id).update(available_copies=1)   # one copy on loan
+        self.author = Author.objects.create(first_name='Anne', last_name='Elliot')
+        self.category = Category.objects.create(name='Romance')
+        search.get_index()
+
+    def test_creates_updates_and_reports_rows(self):
+        rows = [
+            {'isbn': 'Alpha-0', 'total_copies': 4, 'author_ids': [self.author.id]},
+            {'isbn': 'P-1', 'title': 'Persuasion', 'author_ids': [self.author.id], 'category_ids': [self.category.id]},
+            {'isbn': 'P-1', 'title': 'Persuasion again'},
+            {'isbn': 'P-2', 'title': 'Unknown', 'author_ids': [999999]},
+            {'isbn': 'Alpha-1', 'total_copies': 1, 'available_copies': 2},
+            {'isbn': 'P-3'},
+            {'title': 'No ISBN'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('book-bulk-upsert'), {'books': rows}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 1, 5))
+        self.assertEqual([r['status'] for r in response.data['results']], [200, 201, 400, 400, 400, 400, 400])
+
+        book = Book.objects.get(isbn='Alpha-0')
+        self.assertEqual((book.total_copies, book.available_copies), (4, 3))
+        self.assertEqual(list(book.authors.all()), [self.author])
+        created = Book.objects.get(isbn='P-1')
+        self.assertEqual(response.data['results'][1]['id'], created.id)
+        self.assertEqual(list(created.categories.all()), [self.category])
+        self.assertEqual(statistics.counters()['total_books'], 3)
+
+        hits = self.client.get(reverse('book-search') + '?q=elliot').data
+        self.assertEqual(sorted(hit['id'] for hit in hits), sorted([book.id, created.id]))
+
+    def test_cannot_withdraw_copies_on_loan(self):
+        response = self.client.post(
+            reverse('book-bulk-upsert'), {'books': [{'isbn': 'Alpha-0', 'total_copies': 0}]}, format='json'
+        )
+        self.assertEqual(response.data['results'][0]['status'], 409)
+        self.assertEqual(Book.objects.get(isbn='Alpha-0').total_copies, 2)
+
+    def test_duplicates_name_the_row_as_sent(self):
+        rows = [{'isbn': ''}, {'isbn': 'P-1', 'title': 'Persuasion'}, {'isbn': 'P-1', 'title': 'Persuasion'}]
+        response = self.client.post(reverse('book-bulk-upsert'), {'books': rows}, format='json')
+        self.assertEqual([r['status'] for r in response.data['results']], [400, 201, 400])
+        self.assertEqual(response.data['results'][2]['error'], 'duplicate of row 1')
+
+    def test_insert_race_becomes_an_update(self):
+        Book.objects.create(isbn='P-1', title='Persuasion', total_copies=1, available_copies=1)
+        select_for_update = Book.objects.select_for_update
+        lookups = []
+
+        def racing_lookup():
+            # The first lookup runs before a concurrent batch has inserted P-1.
+            lookups.append(1)
+            queryset = select_for_update()
+            return queryset.exclude(isbn='P-1') if len(lookups) == 1 else queryset
+
+        rows = [{'isbn': 'P-1', 'title': 'Persuasion', 'total_copies': 3}, {'isbn': 'P-2', 'title': 'Emma'}]
+        with mock.patch.object(Book.objects, 'select_for_update', side_effect=racing_lookup):
+            response = self.client.post(reverse('book-bulk-upsert'), {'books': rows}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.data['results']], [200, 201])
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(Book.objects.get(isbn='P-1').total_copies, 3)
+        self.assertEqual(Book.objects.filter(isbn__in=['P-1', 'P-2']).count(), 2)
+
+    def test_rows_of_a_batch_that_keeps_conflicting_get_409(self):
+        rows = [{'isbn': 'P-1', 'title': 'Persuasion'}, {'isbn': 'Alpha-1', 'total_copies': 3}]
+        conflict = IntegrityError('UNIQUE constraint failed: Book.isbn')
+        with mock.patch.object(Book.objects, 'bulk_create', side_effect=conflict) as bulk_create:
+            response = self.client.post(reverse('book-bulk-upsert'), {'books': rows}, format='json')
+        self.assertEqual(bulk_create.call_count, catalog.CONFLICT_RETRIES + 1)
+        self.assertEqual([r['status'] for r in response.data['results']], [409, 409])
+        self.assertEqual(Book.objects.get(isbn='Alpha-1').total_copies, 2)
+
+    def test_other_integrity_errors_fail_only_their_rows(self):
+        bulk_create = Book.objects.bulk_create
+
+        def reject_p2(books, **kwargs):
+            if any(book.isbn == 'P-2' for book in books):
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return bulk_create(books, **kwargs)
+
+        rows = [{'isbn': 'P-1', 'title': 'Persuasion'}, {'isbn': 'P-2', 'title': 'Emma'}]
+        with mock.patch.object(Book.objects, 'bulk_create', side_effect=reject_p2) as patched:
+            response = self.client.post(reverse('book-bulk-upsert'), {'books': rows}, format='json')
+        self.assertEqual(patched.call_count, 3)
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 400])
+        self.assertIn('FOREIGN KEY', response.data['results'][1]['error'])
+        self.assertEqual(list(Book.objects.filter(isbn__in=['P-1', 'P-2']).values_list('isbn', flat=True)), ['P-1'])
+
+
+class CirculationTests(APITestCase):
+    def setUp(self):
+        self.book = make_catalog(1)[0]
+        self.book.available_copies = 1
+        self.book.save()
+        self.member = make_member()
+
+    def borrow(self, **data):
+        return self.client.post(reverse('book-borrow'), {
+            'book_id': self.book.id, 'member_id': self.member.id, **data
+        }, format='json')
+
+    def test_last_copy_can_only_be_borrowed_once(self):
+        first = self.borrow()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.data['due_date'], str(date.fromisoformat(first.data['borrow_date']) + timedelta(days=14)))
+        second = self.borrow()
+        self.assertEqual(second.status_code, 400)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(Borrowing.objects.filter(book=self.book).count(), 1)
+
+    def test_unknown_book_and_member(self):
+        self.assertEqual(self.borrow(book_id=999999).status_code, 404)
+        self.assertEqual(self.borrow(member_id=999999).status_code, 404)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+    def test_days_must_be_within_the_loan_limit(self):
+        with self.settings(MAX_LOAN_DAYS=30):
+            for days in (0, -3, 'two', 31, 5000000):
+                self.assertEqual(self.borrow(days=days).status_code, 400)
+            for days in (-1, 5000000):
+                response = self.client.post(reverse('book-borrow-bulk'), {
+                    'items': [{'book_id': self.book.id, 'member_id': self.member.id}], 'days': days,
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+            self.assertEqual(self.borrow(days=30).status_code, 201)
+
+    def test_return_restores_copy_once(self):
+        borrowing_id = self.borrow().data['id']
+        url = reverse('book-return')
+        response = self.client.post(url, {'borrowing_id': borrowing_id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['return_date'])
+        self.assertEqual(self.client.post(url, {'borrowing_id': borrowing_id}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'borrowing_id': 999999}, format='json').status_code, 404)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+    def test_bulk_borrow_and_return(self):
+        other = make_member('Bob')
+        items = [
+            {'book_id': self.book.id, 'member_id': self.member.id},
+            {'book_id': self.book.id, 'member_id': other.id},
+            {'book_id': 999999, 'member_id': other.id},
+        ]
+        response = self.client.post(reverse('book-borrow-bulk'), {'items': items}, format='json')
+        self.assertEqual([r['status'] for r in response.data['results']], [201, 400, 404])
+        borrowing_id = response.data['results'][0]['borrowing']['id']
+
+        response = self.client.post(
+            reverse('book-return-bulk'), {'borrowing_ids': [borrowing_id, borrowing_id]}, format='json'
+        )
+        self.assertEqual([r['status'] for r in response.data['results']], [200, 400])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+
+class AsyncViewTests(APITestCase):
+    """The /api/async/ views must answer with the same JSON as their sync counterparts."""
+
+    def setUp(self):
+        caching.get_cache().clear()
+        search.reset_index()
+        self.books = make_catalog(3)
+        self.member = make_member()
+        self.borrowings = [
+            Borrowing.objects.create(member=self.member, book=book, borrow_date=date(2024, 9, 2), due_date=date(2024, 9, 16))
+            for book in self.books * 2
+        ]
+
+    def async_get(self, url, **extra):
+        async def get():
+            return await self.async_client.get(url, **extra)
+        return async_to_sync(get)()
+
+    def assertSameJSON(self, sync_url, async_url):
+        sync, async_ = self.client.get(sync_url), self.async_get(async_url)
+        self.assertEqual((async_.status_code, async_.json()), (sync.status_code, sync.json()))
+        return sync, async_
+
+    def test_book_detail_availability_and_search(self):
+        book = self.books[1]
+        self.assertSameJSON(reverse('book-detail', args=[book.id]), reverse('async-book-detail', args=[book.id]))
+        self.assertSameJSON(reverse('book-availability', args=[book.id]), reverse('async-book-availability', args=[book.id]))
+        sync, async_ = self.assertSameJSON(reverse('book-search') + '?q=austen', reverse('async-book-search') + '?q=austen')
+        self.assertEqual(async_['X-Total-Count'], sync['X-Total-Count'])
+        self.assertEqual(self.async_get(reverse('async-book-detail', args=[999999])).status_code, 404)
+
+    def test_middleware_runs_in_the_async_stack(self):
+        for middleware_class in (
+            middleware.MetricsMiddleware, middleware.ReplicaRoutingMiddleware, middleware.CompressionMiddleware,
+        ):
+            self.assertTrue(middleware_class.sync_capable and middleware_class.async_capable)
+        url = reverse('book-list-create')
+        with self.settings(COMPRESSION_MIN_BYTES=0):
+            response = self.async_get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.client.get(url).content)
+
+    def test_metrics_count_queries_run_off_the_event_loop(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        self.async_get(reverse('async-book-detail', args=[self.books[0].id]))
+        self.async_get(reverse('book-detail', args=[self.books[0].id]))
+        queries = metrics.registry.histogram_totals('library_db_queries_per_request')
+        for route in ('async-book-detail', 'book-detail'):
+            count, requests = queries[(('route', route),)]
+            self.assertEqual(requests, 1)
+            self.assertGreater(count, 0, route)
+
+    def test_member_borrowings_pages_like_the_sync_view(self):
+        sync_url = reverse('member-borrowings', args=[self.member.pk]) + '?page_size=4'
+        async_url = reverse('async-member-borrowings', args=[self.member.pk]) + '?page_size=4'
+        sync, async_ = self.client.get(sync_url).json(), self.async_get(async_url).json()
+        self.assertEqual(set(async_), {'next', 'previous', 'results'})
+        self.assertEqual(async_['results'], sync['results'])
+        self.assertEqual(async_['next'].replace('/api/async/', '/api/'), sync['next'])
+
+        second = self.async_get(async_['next']).json()
+        self.assertEqual(second['results'], self.client.get(sync['next']).json()['results'])
+        self.assertEqual(
+            [row['id'] for row in async_['results'] + second['results']], [b.id for b in reversed(self.borrowings)]
+        )
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.async_get(second['previous']).json()['results'], async_['results'])
+
+        self.assertEqual(self.async_get(async_url + '&cursor=%%%').status_code, 404)
+        self.assertEqual(self.async_get(reverse('async-member-borrowings', args=[999999])).status_code, 404)
+
+
+class MemberSummaryTests(APITestCase):
+    def test_counts_loans_and_fees(self):
+        books = make_catalog(4)
+        member = make_member()
+        today = timezone.localdate()
+        for book, borrowed, due, returned, fee in (
+            (books[0], 20, 10, None, '0.00'),     # open, 10 days overdue
+            (books[1], 3, -11, None, '0.00'),     # open, not yet due
+            (books[2], 30, 16, 12, '2.00'),       # returned 4 days late
+            (books[3], 40, 26, 30, '0.00'),       # returned on time
+        ):
+            Borrowing.objects.create(
+                member=member, book=book, borrow_date=today - timedelta(days=borrowed),
+                due_date=today - timedelta(days=due),
+                return_date=today - timedelta(days=returned) if returned is not None else None, late_fee=fee,
+            )
+        Borrowing.objects.create(member=make_member('Bob'), book=books[0], borrow_date=today, due_date=today)
+
+        with self.assertNumQueries(3):
+            data = self.client.get(reverse('member-summary', args=[member.pk])).data
+        self.assertEqual(data['name'], 'Alice Smith')
+        self.assertEqual(data['counts'], {
+            'total_borrowings': 4, 'current_loans': 2, 'overdue_loans': 1, 'returned': 2, 'returned_late': 1,
+        })
+        self.assertEqual([loan['book_id'] for loan in data['current_loans']], [books[0].id, books[1].id])
+        self.assertEqual(data['overdue_loans'], data['current_loans'][:1])
+        self.assertEqual(data['overdue_loans'][0]['days_overdue'], 10)
+        self.assertEqual(data['outstanding_fees'], '5.00')
+        self.assertEqual(Decimal(data['assessed_fees']), Decimal('2.00'))
+
+    def test_member_without_history_and_unknown_member(self):
+        data = self.client.get(reverse('member-summary', args=[make_member().pk])).data
+        self.assertEqual(data['counts']['total_borrowings'], 0)
+        self.assertEqual((data['current_loans'], data['outstanding_fees']), ([], '0.00'))
+        self.assertEqual(Decimal(data['assessed_fees']), 0)
+        self.assertEqual(self.client.get(reverse('member-summary', args=[999999])).status_code, 404)
+
+
+class LateFeeAssessmentTests(APITestCase):
+    def setUp(self):
+        self.as_of = date(2026, 3, 1)
+        book, member = make_catalog(1)[0], make_member()
+        self.loans = [
+            Borrowing.objects.create(
+                member=member, book=book, borrow_date=date(2026, 1, 1), due_date=self.as_of - timedelta(days=days),
+                return_date=date(2026, 2, 1) if days == 8 else None, late_fee='0.00',
+            )
+            for days in (4, 8, 2, -3, 10, 4)
+        ]
+
+    def fees(self):
+        return [loan.late_fee for loan in Borrowing.objects.order_by('id')]
+
+    def test_rerun_is_idempotent(self):
+        first = fees.assess(as_of=self.as_of, chunk_size=2)
+        # Four open overdue loans; the returned and not-yet-due ones are left alone.
+        self.assertEqual((first['scanned'], first['updated'], first['last_id']), (4, 4, self.loans[-1].id))
+        expected = [Decimal(fee) for fee in ('2.00', '0.00', '1.00', '0.00', '5.00', '2.00')]
+        self.assertEqual(self.fees(), expected)
+
+        second = fees.assess(as_of=self.as_of, chunk_size=2)
+        self.assertEqual((second['scanned'], second['updated']), (4, 0))
+        self.assertEqual(self.fees(), expected)
+
+    def test_resume_from_start_id(self):
+        out = io.StringIO()
+        call_command(
+            'assess_late_fees', as_of=self.as_of.isoformat(), start_id=self.loans[3].id, chunk_size=2, stdout=out,
+        )
+        self.assertIn('2 overdue loans checked, 2 updated', out.getvalue())
+        self.assertEqual(self.fees(), [Decimal(fee) for fee in ('0.00', '0.00', '0.00', '0.00', '5.00', '2.00')])
+
+        with self.assertRaises(CommandError):
+            call_command('assess_late_fees', as_of='March 1st')
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.books = make_catalog(5)
+
+    def export(self, path, **params):
+        response = self.client.get(reverse('export', args=path.split('.')), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_streams_every_row_in_chunks(self):
+        # Five rows in chunks of two: three chunks and the empty read that ends the stream.
+        with self.settings(EXPORT_CHUNK_SIZE=2), self.assertNumQueries(4):
+            lines = self.export('books.ndjson').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows], [book.id for book in self.books])
+        self.assertEqual(rows[0]['title'], 'Book 0')
+        self.assertEqual(list(rows[0]), list(exports.EXPORTS['books'][1]))
+
+    def test_csv_and_resume(self):
+        lines = list(csv.reader(io.StringIO(self.export('books.csv', after=self.books[2].id))))
+        self.assertEqual(lines[0], list(exports.EXPORTS['books'][1]))
+        self.assertEqual([int(row[0]) for row in lines[1:]], [book.id for book in self.books[3:]])
+
+    def test_unknown_export_and_bad_after(self):
+        self.assertEqual(self.client.get(reverse('export', args=['libraries', 'csv'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', args=['books', 'xml'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', args=['books', 'csv']), {'after': 'x'}).status_code, 400)
+
+
+class MetricsMiddlewareTests(APITestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        self.book = make_catalog(1)[0]
+
+    def test_requests_are_counted_per_route(self):
+        url = reverse('book-detail', args=[self.book.id])
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get(reverse('book-detail', args=[0]))
+        rendered = metrics.registry.render()
+        self.assertIn('library_http_requests_total{route="book-detail",method="GET",status="200"} 2', rendered)
+        self.assertIn('library_http_requests_total{route="book-detail",method="GET",status="404"} 1', rendered)
+        queries, requests = metrics.registry.histogram_totals('library_db_queries_per_request')[(('route', 'book-detail'),)]
+        self.assertEqual(requests, 3)
+        self.assertGreater(queries, 0)
+
+    def test_streamed_body_is_measured_once_consumed(self):
+        response = self.client.get(reverse('export', args=['books', 'ndjson']))
+        sizes = metrics.registry.histogram_totals('library_http_response_size_bytes')
+        self.assertNotIn((('route', 'export'),), sizes)
+        body = b''.join(response.streaming_content)
+        sizes = metrics.registry.histogram_totals('library_http_response_size_bytes')
+        self.assertEqual(sizes[(('route', 'export'),)], (len(body), 1))
+        queries, _ = metrics.registry.histogram_totals('library_db_queries_per_request')[(('route', 'export'),)]
+        self.assertGreater(queries, 0)
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.settings(METRICS_SLOW_REQUEST_SECONDS=0), \
+                self.assertLogs('librarymanagement.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('book-detail', args=[self.book.id]))
+        self.assertIn('(book-detail)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_scrape_endpoint(self):
+        self.client.get(reverse('book-detail', args=[self.book.id]))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE library_http_requests_total counter', response.content)
+        with self.settings(METRICS_ALLOWED_IPS=('10.0.0.1',)):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class DataGenerationTests(APITestCase):
+    scale = datagen.Scale(
+        libraries=2, authors=10, categories=4, books=40, members=15, borrowings=600, reviews=60, days=90,
+    )
+
+    def test_database_sink_keeps_the_catalog_consistent(self):
+        make_catalog(2)
+        first_book = Book.objects.order_by('-id').values_list('id', flat=True).first() + 1
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = datagen.generate(self.scale, datagen.DatabaseSink(), batch_size=100)
+
+        self.assertEqual((counts['Borrowing'], Borrowing.objects.count()), (600, 600))
+        self.assertEqual(Book.objects.filter(id__gte=first_book).count(), 40)
+        self.assertEqual(counts['Review'], Review.objects.count())
+        self.assertLessEqual(counts['Review'], 60)
+        for book in Book.objects.filter(id__gte=first_book):
+            loans = Borrowing.objects.filter(book=book)
+            self.assertEqual(book.available_copies, book.total_copies - loans.filter(return_date__isnull=True).count())
+            self.assertEqual(book.borrow_count, loans.count())
+            self.assertEqual(book.rating_count, Review.objects.filter(book=book).count())
+        self.assertEqual(
+            Review.objects.values('member_id', 'book_id').distinct().count(), Review.objects.count(),
+        )
+        borrow_dates = list(Borrowing.objects.order_by('id').values_list('borrow_date', flat=True))
+        self.assertEqual(borrow_dates, sorted(borrow_dates))
+        self.assertFalse(Borrowing.objects.filter(return_date__lte=F('due_date'), late_fee__gt=0).exists())
+        self.assertTrue(Borrowing.objects.filter(return_date__gt=F('due_date'), late_fee__gt=0).exists())
+        self.assertEqual(statistics.counters()['total_books'], Book.objects.count())
+
+    def test_csv_output_is_reproducible(self):
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            datagen.generate(self.scale, datagen.CsvSink(first))
+            call_command(
+                'generate_data', '--csv', second, *(
+                    f'--{name}={getattr(self.scale, name)}' for name in (
+                        'libraries', 'authors', 'categories', 'books', 'members', 'borrowings', 'reviews', 'days',
+                    )
+                ), stdout=io.StringIO(),
+            )
+            rows = {}
+            for model, columns in datagen.TABLES:
+                name = f'{model._meta.db_table}.csv'
+                with open(os.path.join(first, name)) as a, open(os.path.join(second, name)) as b:
+                    rows[model] = list(csv.reader(a))
+                    self.assertEqual(rows[model], list(csv.reader(b)), name)
+                self.assertEqual(len(rows[model][0]), len(columns))
+            with open(os.path.join(first, 'load.sql')) as f:
+                load = f.read()
+        self.assertEqual(load.count('LOAD DATA LOCAL INFILE'), len(datagen.TABLES))
+        self.assertEqual((len(rows[Book]), len(rows[Borrowing])), (1 + 40, 1 + 600))
+        self.assertIn('\\N', {value for row in rows[Borrowing] for value in row})   # open loans
+
+
+class AdmissionControlTests(APITestCase):
+    def setUp(self):
+        admission.reset()
+        self.addCleanup(admission.reset)
+        metrics.registry.reset()
+        self.book = make_catalog(1)[0]
+        self.book.total_copies = self.book.available_copies = 10
+        self.book.save()
+        self.member = make_member()
+
+    def borrow(self, member):
+        return self.client.post(reverse('book-borrow'), {'book_id': self.book.id, 'member_id': member.id}, format='json')
+
+    def test_member_rate_limit(self):
+        with self.settings(THROTTLE_RATES={'member': '2/min', 'client': None}):
+            self.assertEqual([self.borrow(self.member).status_code for _ in range(3)], [201, 201, 429])
+            rejected = self.borrow(self.member)
+            self.assertEqual(self.borrow(make_member('Bob')).status_code, 201)
+        self.assertGreaterEqual(int(rejected['Retry-After']), 1)
+        rendered = metrics.registry.render()
+        self.assertIn('library_admission_requests_total{route="book-borrow",outcome="admitted"} 3', rendered)
+        self.assertIn('library_admission_requests_total{route="book-borrow",outcome="member_rate"} 2', rendered)
+
+    def test_client_limit_ignores_headers_from_untrusted_addresses(self):
+        def borrow(n):
+            return self.client.post(
+                reverse('book-borrow'), {'book_id': self.book.id, 'member_id': self.member.id}, format='json',
+                HTTP_X_CLIENT_ID=f'client-{n}', HTTP_X_FORWARDED_FOR=f'10.0.0.{n}',
+            ).status_code
+
+        with self.settings(THROTTLE_RATES={'client': '2/min'}, THROTTLE_CLIENT_HEADER='X-Client-Id'):
+            self.assertEqual([borrow(n) for n in range(3)], [201, 201, 429])
+            admission.reset()
+            with self.settings(THROTTLE_TRUSTED_PROXIES=('127.0.0.1',)):
+                self.assertEqual([borrow(n) for n in range(3)], [201, 201, 201])
+                self.assertEqual(borrow(0), 201)
+                self.assertEqual(borrow(0), 429)
+
+    def test_writes_beyond_concurrency_limit_are_shed(self):
+        with self.settings(THROTTLE_RATES={}, WRITE_CONCURRENCY_LIMIT=1, WRITE_QUEUE_TIMEOUT=0, WRITE_RETRY_AFTER=2):
+            limiter = admission.get_limiter()
+            self.assertTrue(limiter.acquire())
+            shed = self.borrow(self.member)
+            self.assertEqual(self.client.get(reverse('review-list-create')).status_code, 200)
+            limiter.release()
+            self.assertEqual(self.borrow(self.member).status_code, 201)
+            self.assertEqual(self.borrow(self.member).status_code, 201)
+        self.assertEqual((shed.status_code, shed['Retry-After']), (429, '2'))
+        self.assertIn('outcome="concurrency"} 1', metrics.registry.render())
+
+    def test_review_edits_are_admitted_like_other_writes(self):
+        review = Review.objects.create(book=self.book, member=self.member, rating=3)
+        url = reverse('review-detail', args=[review.id])
+        with self.settings(THROTTLE_RATES={}, WRITE_CONCURRENCY_LIMIT=1, WRITE_QUEUE_TIMEOUT=0):
+            limiter = admission.get_limiter()
+            self.assertTrue(limiter.acquire())
+            self.assertEqual(self.client.patch(url, {'rating': 5}, format='json').status_code, 429)
+            self.assertEqual(self.client.delete(url).status_code, 429)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            limiter.release()
+            self.assertEqual(self.client.patch(url, {'rating': 5}, format='json').status_code, 200)
+        self.assertIn('library_admission_requests_total{route="review-detail",outcome="admitted"} 1', metrics.registry.render())
+
+
+@skipIf(connection.vendor == 'sqlite', "SQLite serialises writers; run against MySQL")
+class ConcurrentBorrowTests(TransactionTestCase):
+    def test_no_oversell_under_contention(self):
+        book = make_catalog(1)[0]
+        book.total_copies = book.available_copies = 25
+        book.save()
+        member = make_member()
+
+        borrowed, rejected, _ = run_stress(book.id, member.id, threads=8, attempts=10)
+
+        book.refresh_from_db()
+        self.assertEqual(borrowed, 25)
+        self.assertEqual(rejected, 8 * 10 - 25)
+        self.assertEqual(book.available_copies, 0)
+        self.assertEqual(Borrowing.objects.filter(book=book).count(), 25)
+
+
+REPLICA = 'replica1'
+
+
+@skipIf(REPLICA not in settings.DATABASES, 'needs a second database as replica1 (see library/test_settings.py)')
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    ``replica1`` is a second database the router never migrates, so any read
+    routed to it fails until a test creates the table. Transactional,
+    because reads inside an atomic block stay on the primary.
+    """
+    databases = '__all__'
+    client_class = APIClient
+
+    def setUp(self):
+        caching.get_cache().clear()
+        health = mock.patch.object(routers, 'health', routers.ReplicaHealth())
+        health.start()
+        self.addCleanup(health.stop)
+        self.member = make_member()
+
+    def replica_table(self, model):
+        with connections[REPLICA].schema_editor() as editor:
+            editor.create_model(model)
+
+        def drop():
+            with connections[REPLICA].schema_editor() as editor:
+                editor.delete_model(model)
+        self.addCleanup(drop)
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Book), 'default')   # outside a request
+        token = routers.begin_request(use_primary=False)
+        try:
+            self.assertEqual(router.db_for_read(Book), REPLICA)
+            self.assertEqual(router.db_for_write(Book), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Book), 'default')
+        finally:
+            routers.end_request(token)
+        token = routers.begin_request(use_primary=True)
+        try:
+            self.assertEqual(router.db_for_read(Book), 'default')
+        finally:
+            routers.end_request(token)
+
+    def test_failed_replica_read_is_retried_on_the_primary(self):
+        url = reverse('member-summary', args=[self.member.pk])
+        with mock.patch.object(routers.health, 'mark_down', wraps=routers.health.mark_down) as mark_down:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Alice Smith')
+        mark_down.assert_called_once_with(REPLICA)
+
+        # Skipped until the next probe.
+        with mock.patch.object(routers.health, 'mark_down') as mark_down:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        mark_down.assert_not_called()
+
+    def test_writer_reads_from_the_primary_for_a_while(self):
+        response = self.client.patch(reverse('member-detail', args=[self.member.pk]), {'first_name': 'Ann'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(middleware.PRIMARY_COOKIE, response.cookies)
+        url = reverse('member-summary', args=[self.member.pk])
+        with mock.patch.object(routers.health, 'mark_down') as mark_down:
+            self.assertEqual(self.client.get(url).data['name'], 'Ann Smith')
+            mark_down.assert_not_called()
+
+            self.client.cookies.clear()
+            self.assertEqual(self.client.get(url).data['name'], 'Ann Smith')
+            mark_down.assert_called_once_with(REPLICA)
+
+    def test_streamed_export_reads_from_the_replica(self):
+        self.replica_table(Member)
+        Member.objects.using(REPLICA).create(first_name='Replica', last_name='Copy', member_type='student')
+        body = b''.join(self.client.get(reverse('export', args=['members', 'ndjson'])).streaming_content)
+        self.assertEqual([json.loads(line)['first_name'] for line in body.splitlines()], ['Replica'])
+
+    def test_responses_are_not_cached_from_a_lagging_replica(self):
+        self.replica_table(Member)
+        Member.objects.using(REPLICA).create(id=self.member.id, first_name='Stale', last_name='Smith', member_type='student')
+        url = reverse('member-detail', args=[self.member.pk])
+        self.client.patch(url, {'first_name': 'Fresh'})
+        self.client.cookies.clear()
+
+        # The generation just moved: the miss is built from the primary and cached.
+        self.assertEqual(self.client.get(url).data['first_name'], 'Fresh')
+        self.assertEqual(self.client.get(url).data['first_name'], 'Fresh')
+
+        # Past the window, misses are built from the replica again.
+        caching.get_cache().clear()
+        with self.settings(READ_YOUR_WRITES_SECONDS=0):
+            self.assertEqual(self.client.get(url).data['first_name'], 'Stale')
+
+    def test_availability_is_not_loaded_from_a_lagging_replica(self):
+        self.replica_table(Book)
+        book = make_catalog(1)[0]
+        with connections[REPLICA].constraint_checks_disabled():
+            Book.objects.using(REPLICA).bulk_create([Book(id=book.id, title=book.title, total_copies=2, available_copies=2)])
+        availability.get_map().clear()
+        self.client.post(reverse('book-borrow'), {'book_id': book.id, 'member_id': self.member.id})
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(reverse('book-availability', args=[book.id])).data['available_copies'], 1)
+
+
+class QueryPlanTests(APITestCase):
+    """
+    Fails when an endpoint's query plans differ from query_plans.json. Run
+    with UPDATE_QUERY_PLANS=1 to accept the new plans.
+    """
+
+    def setUp(self):
+        datagen.generate(datagen.Scale.proportional(200, 50, seed=7), datagen.DatabaseSink())
+        search.reset_index()
+
+    def test_plans_match_baseline(self):
+        summary = queryplans.plan_summary(queryplans.collect_plans())
+        if os.environ.get('UPDATE_QUERY_PLANS'):
+            queryplans.save_baseline(connection.vendor, summary)
+            return
+        baseline = queryplans.load_baseline(connection.vendor)
+        if baseline is None:
+            self.skipTest(f"No {connection.vendor} baseline; run with UPDATE_QUERY_PLANS=1")
+        changes = queryplans.diff(baseline, summary)
+        self.assertFalse(changes, 'Query plans changed:\n' + '\n'.join(changes))
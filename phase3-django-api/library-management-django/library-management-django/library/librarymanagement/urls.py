@@ -1,34 +1,30 @@
 from django.contrib import admin
 from django.urls import path
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from librarymanagement import views
-
-schema_view = get_schema_view(
-   openapi.Info(
-      title="My API",
-      default_version='v1',
-      description="API documentation",
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
+from librarymanagement import apischema, async_views, views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('swagger/', apischema.ui_view, {'renderer': 'swagger'}, name='schema-swagger-ui'),
+    path('redoc/', apischema.ui_view, {'renderer': 'redoc'}, name='schema-redoc'),
+    path('swagger.json', apischema.schema_view, {'fmt': 'json'}, name='schema-json'),
+    path('swagger.yaml', apischema.schema_view, {'fmt': 'yaml'}, name='schema-yaml'),
     
     path('api/libraries/', views.LibraryListCreateAPIView.as_view(), name='library-list-create'),
     path('api/libraries/<int:pk>/', views.LibraryDetailAPIView.as_view(), name='library-detail'),
     
     path('api/books/', views.BookListCreateAPIView.as_view(), name='book-list-create'),
     path('api/books/<int:pk>/', views.BookDetailAPIView.as_view(), name='book-detail'),
+    path('api/books/top-rated/', views.TopRatedBooksAPIView.as_view(), name='book-top-rated'),
     path('api/books/search/', views.BookSearchAPIView.as_view(), name='book-search'),
+    path('api/books/<int:pk>/recommendations/', views.BookRecommendationsAPIView.as_view(), name='book-recommendations'),
     path('api/books/<int:pk>/availability/', views.BookAvailabilityAPIView.as_view(), name='book-availability'),
+    path('api/books/availability/', views.BookAvailabilityBatchAPIView.as_view(), name='book-availability-batch'),
     path('api/books/borrow/', views.BorrowBookAPIView.as_view(), name='book-borrow'),
     path('api/books/return/', views.ReturnBookAPIView.as_view(), name='book-return'),
+    path('api/books/borrow/bulk/', views.BulkBorrowAPIView.as_view(), name='book-borrow-bulk'),
+    path('api/books/return/bulk/', views.BulkReturnAPIView.as_view(), name='book-return-bulk'),
+    path('api/books/bulk/', views.BookBulkUpsertAPIView.as_view(), name='book-bulk-upsert'),
     
     path('api/authors/', views.AuthorListCreateAPIView.as_view(), name='author-list-create'),
     path('api/authors/<int:pk>/', views.AuthorDetailAPIView.as_view(), name='author-detail'),
@@ -39,6 +35,7 @@ urlpatterns = [
     path('api/members/', views.MemberListCreateAPIView.as_view(), name='member-list-create'),
     path('api/members/<int:pk>/', views.MemberDetailAPIView.as_view(), name='member-detail'),
     path('api/members/<int:pk>/borrowings/', views.MemberBorrowingsAPIView.as_view(), name='member-borrowings'),
+    path('api/members/<int:pk>/summary/', views.MemberSummaryAPIView.as_view(), name='member-summary'),
     
     path('api/borrowings/', views.BorrowingListCreateAPIView.as_view(), name='borrowing-list-create'),
     path('api/borrowings/<int:pk>/', views.BorrowingDetailAPIView.as_view(), name='borrowing-detail'),
@@ -47,4 +44,13 @@ urlpatterns = [
     path('api/reviews/<int:pk>/', views.ReviewDetailAPIView.as_view(), name='review-detail'),
     
     path('api/statistics/', views.StatisticsAPIView.as_view(), name='statistics'),
+
+    path('metrics', views.metrics_view, name='metrics'),
+
+    path('api/export/<slug:resource>.<slug:fmt>', views.ExportAPIView.as_view(), name='export'),
+
+    path('api/async/books/<int:pk>/', async_views.book_detail, name='async-book-detail'),
+    path('api/async/books/search/', async_views.book_search, name='async-book-search'),
+    path('api/async/books/<int:pk>/availability/', async_views.book_availability, name='async-book-availability'),
+    path('api/async/members/<int:pk>/borrowings/', async_views.member_borrowings, name='async-member-borrowings'),
 ]
\ No newline at end of file
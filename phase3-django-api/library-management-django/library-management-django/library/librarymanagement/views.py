@@ -1,189 +1,468 @@
+import time
+from decimal import Decimal
+
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.db.models import Q, Count, Avg
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from datetime import datetime, timedelta
+from django.utils import timezone
 
-from .models import Library, Book, Author, Category, Member, Borrowing, Review
+from . import availability, catalog, circulation, exports, fees, metrics, search, statistics
+from .mixins import AdmissionControlMixin, CachedResponseMixin, EagerLoadingViewMixin, SparseFieldsViewMixin
+from .models import Library, Book, Author, Category, Member, Borrowing, Review, BookRecommendation
+from .pagination import MemberBorrowingsPagination
 from .serializers import (
     LibrarySerializer, BookSerializer, AuthorSerializer,
     CategorySerializer, MemberSerializer, BorrowingSerializer, ReviewSerializer
 )
 
-class LibraryListCreateAPIView(generics.ListCreateAPIView):
+
+def _limit_param(request):
+    default = getattr(settings, 'SEARCH_RESULT_LIMIT', 20)
+    maximum = getattr(settings, 'SEARCH_MAX_RESULT_LIMIT', 100)
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+class LibraryListCreateAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
+    cache_models = (Library,)
     queryset = Library.objects.all()
     serializer_class = LibrarySerializer
 
-class LibraryDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class LibraryDetailAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    cache_models = (Library,)
     queryset = Library.objects.all()
     serializer_class = LibrarySerializer
 
-class BookListCreateAPIView(generics.ListCreateAPIView):
-    queryset = Book.objects.select_related('library').all()
+class BookListCreateAPIView(CachedResponseMixin, SparseFieldsViewMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
+    cache_models = (Book, Author, Category, Library)
+    queryset = Book.objects.all()
     serializer_class = BookSerializer
 
-class BookDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Book.objects.select_related('library').all()
+class BookDetailAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    cache_models = (Book, Author, Category)
+    queryset = Book.objects.all()
     serializer_class = BookSerializer
 
-class BookSearchAPIView(APIView):
-    def get(self, request):
-        query = request.query_params.get('q', '').strip()
-        books = Book.objects.all()
+class BookSearchAPIView(CachedResponseMixin, APIView):
+    cache_models = (Book, Author, Category, Library)
 
-        if query:
-            books = books.filter(
-                Q(title__icontains=query) |
-                Q(authors__first_name__icontains=query) |
-                Q(authors__last_name__icontains=query) |
-                Q(categories__name__icontains=query)
-            ).distinct()
+    def uncached_get(self, request):
+        query = request.query_params.get('q', '').strip()
+        limit = _limit_param(request)
+
+        if not query:
+            books = list(BookSerializer.setup_eager_loading(Book.objects.order_by('id'))[:limit])
+            total = len(books)
+            matches = None
+        else:
+            matches = search.get_index().match(query)
+            hits = search.top_hits(matches, limit)
+            total = len(matches)
+            found = BookSerializer.setup_eager_loading(Book.objects.all()).in_bulk(
+                [book_id for book_id, _ in hits]
+            )
+            books = [found[book_id] for book_id, _ in hits if book_id in found]
+
+        data = BookSerializer(books, many=True).data
+        if request.query_params.get('facets') in ('1', 'true'):
+            data = {'results': data, 'facets': self._facets(search.get_index(), matches)}
+        return Response(data, headers={'X-Total-Count': str(total)})
+
+    @staticmethod
+    def _facets(index, matches):
+        """Facet counts over every match, not just the returned page; over the whole catalog without ``q``."""
+        counts = index.facets(book_ids=matches)
+        library_names = dict(Library.objects.filter(id__in=counts['library']).values_list('id', 'name'))
+
+        def ranked(items):
+            return sorted(items, key=lambda item: (-item['count'], item['id']))
+
+        return {
+            'category': ranked(
+                {'id': category_id, 'name': index.category_name(category_id), 'count': count}
+                for category_id, count in counts['category'].items()
+            ),
+            'library': ranked(
+                {'id': library_id, 'name': library_names.get(library_id), 'count': count}
+                for library_id, count in counts['library'].items()
+            ),
+            'availability': {'available': counts['available'], 'unavailable': counts['unavailable']},
+        }
 
+class BookRecommendationsAPIView(CachedResponseMixin, APIView):
+    """Books most often borrowed by the members who borrowed this one (see ``recommendations.py``)."""
+    cache_models = (Book, BookRecommendation)
 
-        books = books.prefetch_related('authors', 'categories', 'library')
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
+    def uncached_get(self, request, pk):
+        limit = _limit_param(request)
+        rows = list(
+            BookRecommendation.objects.filter(book_id=pk).order_by('position')
+            .values('recommended_book_id', 'recommended_book__title', 'score', 'co_borrowers')[:limit]
+        )
+        if not rows and not Book.objects.filter(pk=pk).exists():
+            return Response({'error': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'book_id': pk,
+            'results': [
+                {
+                    'book_id': row['recommended_book_id'],
+                    'title': row['recommended_book__title'],
+                    'score': round(row['score'], 4),
+                    'co_borrowers': row['co_borrowers'],
+                }
+                for row in rows
+            ],
+        })
 
 class BookAvailabilityAPIView(APIView):
     def get(self, request, pk):
-        book = get_object_or_404(Book.objects.select_related('library'), pk=pk)
+        entry = availability.get_map().get_many([pk]).get(pk)
+        if entry is None:
+            return Response({'error': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(entry.as_dict(pk))
+
+class BookAvailabilityBatchAPIView(APIView):
+    def get(self, request):
+        try:
+            ids = list(dict.fromkeys(
+                int(book_id) for book_id in request.query_params.get('ids', '').split(',') if book_id.strip()
+            ))
+        except ValueError:
+            return Response({'error': 'ids must be a comma-separated list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not ids:
+            return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        max_ids = getattr(settings, 'AVAILABILITY_BATCH_MAX_IDS', 500)
+        if len(ids) > max_ids:
+            return Response({'error': f'at most {max_ids} ids per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = availability.get_map().get_many(ids)
         return Response({
-            'book_id': book.id,
-            'title': book.title,
-            'is_available': book.is_available(),
-            'available_copies': book.available_copies,
-            'total_copies': book.total_copies
+            'results': [found[book_id].as_dict(book_id) for book_id in ids if book_id in found],
+            'missing': [book_id for book_id in ids if book_id not in found],
         })
 
-class BorrowBookAPIView(APIView):
-    def post(self, request):
-        book_id = request.data.get('book_id')
-        member_id = request.data.get('member_id')
-        days = int(request.data.get('days', 14))
+def _max_loan_days():
+    return getattr(settings, 'MAX_LOAN_DAYS', 365)
 
-        if not book_id or not member_id:
-            return Response({'error': 'book_id and member_id are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            # use select_for_update in a transaction for concurrency-critical updates in production;
-            # here we keep it simple
-            book = Book.objects.get(id=book_id)
-            member = Member.objects.get(id=member_id)
-        except Book.DoesNotExist:
-            return Response({'error': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
-        except Member.DoesNotExist:
-            return Response({'error': 'Member not found'}, status=status.HTTP_404_NOT_FOUND)
+def _days_param(request):
+    """The loan length in ``days`` (14 by default), or None unless it is an integer from 1 to MAX_LOAN_DAYS."""
+    try:
+        days = int(request.data.get('days', 14))
+    except (TypeError, ValueError):
+        return None
+    return days if 0 < days <= _max_loan_days() else None
 
-        if not book.is_available():
-            return Response({'error': 'Book not available'}, status=status.HTTP_400_BAD_REQUEST)
 
-        borrow_date = datetime.now().date()
-        due_date = borrow_date + timedelta(days=days)
+def _days_error():
+    return Response({'error': f'days must be an integer from 1 to {_max_loan_days()}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        borrowing = Borrowing.objects.create(
-            book=book,
-            member=member,
-            borrow_date=borrow_date,
-            due_date=due_date
-        )
 
+class BorrowBookAPIView(AdmissionControlMixin, APIView):
+    def post(self, request):
+        book_id = request.data.get('book_id')
+        member_id = request.data.get('member_id')
+        days = _days_param(request)
+        if days is None:
+            return _days_error()
 
-        book.available_copies = (book.available_copies or 0) - 1
-        if book.available_copies < 0:
+        if not book_id or not member_id:
+            return Response({'error': 'book_id and member_id are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-            book.available_copies = 0
-        book.save(update_fields=['available_copies'])
+        try:
+            borrowing = circulation.borrow_book(book_id, member_id, days)
+        except circulation.CirculationError as exc:
+            return Response({'error': str(exc)}, status=exc.status_code)
 
         serializer = BorrowingSerializer(borrowing)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-class ReturnBookAPIView(APIView):
+class ReturnBookAPIView(AdmissionControlMixin, APIView):
     def post(self, request):
         borrowing_id = request.data.get('borrowing_id')
         if not borrowing_id:
             return Response({'error': 'borrowing_id is required'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            borrowing = Borrowing.objects.get(id=borrowing_id)
-        except Borrowing.DoesNotExist:
-            return Response({'error': 'Borrowing not found'}, status=status.HTTP_404_NOT_FOUND)
+            borrowing = circulation.return_book(borrowing_id)
+        except circulation.CirculationError as exc:
+            return Response({'error': str(exc)}, status=exc.status_code)
 
-        if borrowing.is_returned:
-            return Response({'error': 'Book already returned'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = BorrowingSerializer(borrowing)
+        return Response(serializer.data)
 
+def _bulk_response(results, ok_status):
+    body = []
+    succeeded = 0
+    for index, result in enumerate(results):
+        if isinstance(result, circulation.CirculationError):
+            body.append({'index': index, 'status': result.status_code, 'error': str(result)})
+        elif isinstance(result, dict):
+            body.append({'index': index, **result})
+        else:
+            succeeded += 1
+            body.append({'index': index, 'status': ok_status, 'borrowing': BorrowingSerializer(result).data})
+    return Response({'succeeded': succeeded, 'failed': len(results) - succeeded, 'results': body})
 
-        borrowing.return_date = datetime.now().date()
-        borrowing.is_returned = True
-        borrowing.save(update_fields=['return_date', 'is_returned'])
 
+def _bulk_max_items():
+    return getattr(settings, 'BULK_CIRCULATION_MAX_ITEMS', 200)
 
-        book = borrowing.book
-        book.available_copies = (book.available_copies or 0) + 1
-        book.save(update_fields=['available_copies'])
 
-        serializer = BorrowingSerializer(borrowing)
-        return Response(serializer.data)
+class BulkBorrowAPIView(AdmissionControlMixin, APIView):
+    def post(self, request):
+        items = request.data.get('items')
+        days = _days_param(request)
+        if days is None:
+            return _days_error()
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'items must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > _bulk_max_items():
+            return Response({'error': f'at most {_bulk_max_items()} items per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, (int(item['book_id']), int(item['member_id']))))
+            except (KeyError, TypeError, ValueError):
+                results[index] = {'status': status.HTTP_400_BAD_REQUEST, 'error': 'book_id and member_id are required'}
+
+        borrowed = circulation.borrow_books([pair for _, pair in valid], days) if valid else []
+        for (index, _), result in zip(valid, borrowed):
+            results[index] = result
+        return _bulk_response(results, status.HTTP_201_CREATED)
+
+class BulkReturnAPIView(AdmissionControlMixin, APIView):
+    def post(self, request):
+        borrowing_ids = request.data.get('borrowing_ids')
+        if not isinstance(borrowing_ids, list) or not borrowing_ids:
+            return Response({'error': 'borrowing_ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(borrowing_ids) > _bulk_max_items():
+            return Response({'error': f'at most {_bulk_max_items()} items per request'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            borrowing_ids = [int(borrowing_id) for borrowing_id in borrowing_ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'borrowing_ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return _bulk_response(circulation.return_books(borrowing_ids), status.HTTP_200_OK)
+
+class BookBulkUpsertAPIView(AdmissionControlMixin, APIView):
+    """Insert or update up to BULK_BOOKS_MAX_ITEMS books keyed by ISBN; see catalog.upsert_books."""
+
+    def post(self, request):
+        rows = request.data.get('books')
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'books must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = getattr(settings, 'BULK_BOOKS_MAX_ITEMS', 5000)
+        if len(rows) > max_items:
+            return Response({'error': f'at most {max_items} books per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        started = time.perf_counter()
+        valid, errors = catalog.validate_rows(rows)
+        results = {index: {'status': status.HTTP_400_BAD_REQUEST, 'error': error} for index, error in errors.items()}
+        if valid:
+            results.update(catalog.upsert_books(valid))
+        elapsed = time.perf_counter() - started
+
+        body = []
+        for index, row in enumerate(rows):
+            isbn = row.get('isbn') if isinstance(row, dict) else None
+            body.append({'index': index, 'isbn': isbn, **results[index]})
+        return Response({
+            'created': sum(result['status'] == status.HTTP_201_CREATED for result in results.values()),
+            'updated': sum(result['status'] == status.HTTP_200_OK for result in results.values()),
+            'failed': sum(result['status'] >= 400 for result in results.values()),
+            'elapsed': round(elapsed, 6),
+            'rows_per_second': round(len(rows) / elapsed, 1) if elapsed else None,
+            'results': body,
+        })
+
+class ExportAPIView(APIView):
+    def get(self, request, resource, fmt):
+        if resource not in exports.EXPORTS or fmt not in exports.CONTENT_TYPES:
+            return Response({'error': 'Unknown export'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            after = int(request.query_params.get('after', 0))
+        except ValueError:
+            return Response({'error': 'after must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
 
-class AuthorListCreateAPIView(generics.ListCreateAPIView):
+        response = StreamingHttpResponse(
+            exports.stream(resource, fmt, after=after), content_type=exports.CONTENT_TYPES[fmt]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{fmt}"'
+        return response
+
+class AuthorListCreateAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
+    cache_models = (Author,)
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
 
-class AuthorDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class AuthorDetailAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    cache_models = (Author,)
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
 
-class CategoryListCreateAPIView(generics.ListCreateAPIView):
+class CategoryListCreateAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
+    cache_models = (Category,)
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
-class CategoryDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class CategoryDetailAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    cache_models = (Category,)
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
-class MemberListCreateAPIView(generics.ListCreateAPIView):
+class MemberListCreateAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
+    cache_models = (Member,)
     queryset = Member.objects.all()
     serializer_class = MemberSerializer
 
-class MemberDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class MemberDetailAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    cache_models = (Member,)
     queryset = Member.objects.all()
     serializer_class = MemberSerializer
 
-class MemberBorrowingsAPIView(APIView):
-    def get(self, request, pk):
+class MemberBorrowingsAPIView(CachedResponseMixin, APIView):
+    cache_models = (Borrowing, Book, Member)
+    pagination_class = MemberBorrowingsPagination
+
+    def uncached_get(self, request, pk):
         member = get_object_or_404(Member, pk=pk)
-        borrowings = member.borrowings.all().order_by('-borrow_date')
-        serializer = BorrowingSerializer(borrowings, many=True)
-        return Response(serializer.data)
+        paginator = self.pagination_class()
+        borrowings = BorrowingSerializer.setup_eager_loading(member.borrowings.all())
+        page = paginator.paginate_queryset(borrowings, request, view=self)
+        serializer = BorrowingSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class MemberSummaryAPIView(APIView):
+    """
+    A member's account at a glance, built from three queries whatever the
+    size of their history: the member, one conditional aggregate over their
+    borrowings and the list of open loans.
+    """
+
+    def get(self, request, pk):
+        member = get_object_or_404(Member.objects.only('id', 'first_name', 'last_name', 'member_type'), pk=pk)
+        today = timezone.localdate()
+        open_loan = Q(return_date__isnull=True)
+        counts = Borrowing.objects.filter(member_id=pk).aggregate(
+            total_borrowings=Count('id'),
+            current_loans=Count('id', filter=open_loan),
+            overdue_loans=Count('id', filter=open_loan & Q(due_date__lt=today)),
+            returned=Count('id', filter=Q(return_date__isnull=False)),
+            returned_late=Count('id', filter=Q(return_date__gt=F('due_date'))),
+            assessed_fees=Sum('late_fee', filter=Q(return_date__isnull=False)),
+        )
+        assessed_fees = counts.pop('assessed_fees') or Decimal('0.00')
+
+        loans = []
+        for loan in (
+            Borrowing.objects.filter(open_loan, member_id=pk).order_by('due_date', 'id')
+            .values('id', 'book_id', 'book__title', 'borrow_date', 'due_date')
+        ):
+            overdue_days = fees.days_overdue(loan['due_date'], today)
+            loans.append({
+                'borrowing_id': loan['id'],
+                'book_id': loan['book_id'],
+                'title': loan['book__title'],
+                'borrow_date': loan['borrow_date'],
+                'due_date': loan['due_date'],
+                'days_overdue': overdue_days,
+                'late_fee': str(fees.late_fee(loan['due_date'], today)),
+            })
+        overdue = [loan for loan in loans if loan['days_overdue'] > 0]
 
-class BorrowingListCreateAPIView(generics.ListCreateAPIView):
+        return Response({
+            'member_id': member.id,
+            'name': f"{member.first_name} {member.last_name}".strip(),
+            'member_type': member.member_type,
+            'as_of': today,
+            'counts': counts,
+            'current_loans': loans,
+            'overdue_loans': overdue,
+            'late_fee_per_day': str(fees.late_fee_per_day()),
+            'outstanding_fees': str(sum((Decimal(loan['late_fee']) for loan in overdue), Decimal('0.00'))),
+            'assessed_fees': str(assessed_fees),
+        })
+
+class BorrowingListCreateAPIView(CachedResponseMixin, SparseFieldsViewMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
+    cache_models = (Borrowing, Book, Member)
     queryset = Borrowing.objects.all()
     serializer_class = BorrowingSerializer
 
-class BorrowingDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class BorrowingDetailAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    cache_models = (Borrowing, Book, Member)
     queryset = Borrowing.objects.all()
     serializer_class = BorrowingSerializer
 
-class ReviewListCreateAPIView(generics.ListCreateAPIView):
+class ReviewListCreateAPIView(AdmissionControlMixin, CachedResponseMixin, SparseFieldsViewMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
+    cache_models = (Review, Member, Book)
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
 
-class ReviewDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+    @transaction.atomic
+    def perform_create(self, serializer):
+        review = serializer.save()
+        statistics.increment(rating_sum=review.rating, rating_count=1)
+        statistics.rate(review.book_id, rating_sum=review.rating, rating_count=1)
+
+class ReviewDetailAPIView(AdmissionControlMixin, CachedResponseMixin, EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    cache_models = (Review, Member, Book)
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_rating, old_book_id = serializer.instance.rating, serializer.instance.book_id
+        super().perform_update(serializer)
+        review = serializer.instance
+        statistics.increment(rating_sum=review.rating - old_rating)
+        if review.book_id == old_book_id:
+            statistics.rate(review.book_id, rating_sum=review.rating - old_rating)
+        else:
+            statistics.rate(old_book_id, rating_sum=-old_rating, rating_count=-1)
+            statistics.rate(review.book_id, rating_sum=review.rating, rating_count=1)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        statistics.increment(rating_sum=-instance.rating, rating_count=-1)
+        statistics.rate(instance.book_id, rating_sum=-instance.rating, rating_count=-1)
+
+class TopRatedBooksAPIView(CachedResponseMixin, APIView):
+    """Highest average rating first; ``?min_reviews=`` leaves out books with fewer reviews."""
+    cache_models = (Book,)
+
+    def uncached_get(self, request):
+        try:
+            min_reviews = int(request.query_params.get('min_reviews', getattr(settings, 'TOP_RATED_MIN_REVIEWS', 3)))
+        except ValueError:
+            return Response({'error': 'min_reviews must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response([
+            {
+                'book_id': row['id'],
+                'title': row['title'],
+                'average_rating': str(row['average_rating']),
+                'rating_count': row['rating_count'],
+            }
+            for row in statistics.top_rated(limit=_limit_param(request), min_reviews=min_reviews)
+        ])
+
 class StatisticsAPIView(APIView):
     def get(self, request):
-        stats = {
-            'total_books': Book.objects.count(),
-            'total_members': Member.objects.count(),
-            'active_borrowings': Borrowing.objects.filter(return_date__isnull=True).count(),
-            'total_libraries': Library.objects.count(),
-            'average_rating': Review.objects.aggregate(Avg('rating'))['rating__avg'],
-            'most_borrowed_books': list(
-                Book.objects.annotate(
-                    borrow_count=Count('borrowings')
-                ).order_by('-borrow_count')[:5].values('title', 'borrow_count')
-            )
-        }
-        return Response(stats)
+        return Response(statistics.snapshot())
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; only answers METRICS_ALLOWED_IPS."""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', None)
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -28,11 +28,17 @@ CREATE TABLE Book (
     total_copies      INT DEFAULT 0,
     available_copies  INT DEFAULT 0,
     library_id        INT,
+    borrow_count      INT NOT NULL DEFAULT 0,
+    rating_count      INT NOT NULL DEFAULT 0,
+    rating_sum        INT NOT NULL DEFAULT 0,
+    average_rating    DECIMAL(3,2),
     created_at        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     CONSTRAINT fk_book_library
         FOREIGN KEY (library_id) REFERENCES Library(library_id),
-    CONSTRAINT chk_book_copies CHECK (available_copies <= total_copies)
+    CONSTRAINT chk_book_copies CHECK (available_copies <= total_copies),
+    INDEX idx_book_borrow_count (borrow_count),
+    INDEX idx_book_rating (average_rating, rating_count)
 );
 
 INSERT INTO Book (title, isbn, publication_date, total_copies, available_copies, library_id)
@@ -146,7 +152,10 @@ CREATE TABLE Borrowing (
     CONSTRAINT fk_borrowing_book   FOREIGN KEY (book_id)   REFERENCES Book(book_id),
     CONSTRAINT chk_borrowing_dates CHECK (due_date >= borrow_date),
     CONSTRAINT chk_return_after_borrow CHECK (return_date IS NULL OR return_date >= borrow_date),
-    CONSTRAINT chk_late_fee_nonneg CHECK (late_fee >= 0)
+    CONSTRAINT chk_late_fee_nonneg CHECK (late_fee >= 0),
+    INDEX idx_borrowing_open_due (return_date, due_date),
+    INDEX idx_borrowing_member_date (member_id, borrow_date),
+    INDEX idx_borrowing_member_id (member_id, borrowing_id)
 );
 
 INSERT INTO Borrowing (member_id, book_id, borrow_date, due_date, return_date, late_fee)
@@ -189,7 +198,8 @@ CREATE TABLE Review (
     updated_at  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     CONSTRAINT fk_review_member FOREIGN KEY (member_id) REFERENCES Member(member_id),
     CONSTRAINT fk_review_book   FOREIGN KEY (book_id)   REFERENCES Book(book_id),
-    CONSTRAINT chk_rating_1_5   CHECK (rating BETWEEN 1 AND 5)
+    CONSTRAINT chk_rating_1_5   CHECK (rating BETWEEN 1 AND 5),
+    INDEX idx_review_book (book_id)
 );
 
 INSERT INTO Review (member_id, book_id, rating, comment, review_date)
@@ -259,4 +269,42 @@ VALUES
 (14,2),
 (15,3);
 
+-- 10) StatisticCounter  (running totals behind /api/statistics/)
+-- Each counter is split over a few shard rows so concurrent borrows do not
+-- all queue on one row lock; a counter's value is the sum of its shards.
+CREATE TABLE StatisticCounter (
+    counter_id  INT AUTO_INCREMENT PRIMARY KEY,
+    name        VARCHAR(50) NOT NULL,
+    shard       SMALLINT NOT NULL DEFAULT 0,
+    value       BIGINT NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    CONSTRAINT uq_counter_shard UNIQUE (name, shard)
+);
+
+-- 11) BookRecommendation  ("members who borrowed this also borrowed")
+-- Top-K co-borrowed books per book, written by
+-- `python manage.py compute_recommendations`; the API reads one book's rows
+-- through uq_recommendation_position.
+CREATE TABLE BookRecommendation (
+    recommendation_id   INT AUTO_INCREMENT PRIMARY KEY,
+    book_id             INT NOT NULL,
+    recommended_book_id INT NOT NULL,
+    position            SMALLINT NOT NULL,
+    score               DOUBLE NOT NULL,
+    co_borrowers        INT NOT NULL,
+    computed_at         TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_recommendation_position UNIQUE (book_id, position),
+    CONSTRAINT fk_recommendation_book
+        FOREIGN KEY (book_id) REFERENCES Book(book_id) ON DELETE CASCADE,
+    CONSTRAINT fk_recommendation_recommended
+        FOREIGN KEY (recommended_book_id) REFERENCES Book(book_id) ON DELETE CASCADE
+);
 
+-- 12) RecommendationWatermark  (where compute_recommendations left off)
+-- One row: the last borrowing id the stored recommendations include, so an
+-- incremental run only reads newer borrowings.
+CREATE TABLE RecommendationWatermark (
+    watermark_id      SMALLINT PRIMARY KEY,
+    last_borrowing_id INT NOT NULL,
+    updated_at        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
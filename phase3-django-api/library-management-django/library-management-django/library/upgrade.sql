@@ -0,0 +1,69 @@
+-- Brings a database created from an earlier schema.sql up to date with the
+-- current one. Run it once:
+--
+--     mysql db < upgrade.sql
+--     python manage.py reconcile_statistics
+--
+-- reconcile_statistics fills the new Book columns and the StatisticCounter
+-- rows from the existing data; until it has run, /api/statistics/ and the
+-- most-borrowed and top-rated lists undercount.
+
+-- 1) Book: borrow and rating totals, kept current by the API.
+ALTER TABLE Book
+    ADD COLUMN borrow_count   INT NOT NULL DEFAULT 0 AFTER library_id,
+    ADD COLUMN rating_count   INT NOT NULL DEFAULT 0 AFTER borrow_count,
+    ADD COLUMN rating_sum     INT NOT NULL DEFAULT 0 AFTER rating_count,
+    ADD COLUMN average_rating DECIMAL(3,2) AFTER rating_sum,
+    ADD INDEX idx_book_borrow_count (borrow_count),
+    ADD INDEX idx_book_rating (average_rating, rating_count);
+
+-- 2) Borrowing: open/overdue loans and a member's history.
+ALTER TABLE Borrowing
+    ADD INDEX idx_borrowing_open_due (return_date, due_date),
+    ADD INDEX idx_borrowing_member_date (member_id, borrow_date);
+
+-- 3) Review: rating aggregates per book.
+ALTER TABLE Review
+    ADD INDEX idx_review_book (book_id);
+
+-- 4) StatisticCounter: running totals behind /api/statistics/.
+CREATE TABLE IF NOT EXISTS StatisticCounter (
+    counter_id  INT AUTO_INCREMENT PRIMARY KEY,
+    name        VARCHAR(50) NOT NULL,
+    shard       SMALLINT NOT NULL DEFAULT 0,
+    value       BIGINT NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    CONSTRAINT uq_counter_shard UNIQUE (name, shard)
+);
+
+-- 5) BookRecommendation: top-K co-borrowed books per book.
+CREATE TABLE IF NOT EXISTS BookRecommendation (
+    recommendation_id   INT AUTO_INCREMENT PRIMARY KEY,
+    book_id             INT NOT NULL,
+    recommended_book_id INT NOT NULL,
+    position            SMALLINT NOT NULL,
+    score               DOUBLE NOT NULL,
+    co_borrowers        INT NOT NULL,
+    computed_at         TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_recommendation_position UNIQUE (book_id, position),
+    CONSTRAINT fk_recommendation_book
+        FOREIGN KEY (book_id) REFERENCES Book(book_id) ON DELETE CASCADE,
+    CONSTRAINT fk_recommendation_recommended
+        FOREIGN KEY (recommended_book_id) REFERENCES Book(book_id) ON DELETE CASCADE
+);
+
+-- 6) RecommendationWatermark: compute_recommendations' watermark, which
+-- earlier versions kept as a StatisticCounter row.
+CREATE TABLE IF NOT EXISTS RecommendationWatermark (
+    watermark_id      SMALLINT PRIMARY KEY,
+    last_borrowing_id INT NOT NULL,
+    updated_at        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+INSERT IGNORE INTO RecommendationWatermark (watermark_id, last_borrowing_id)
+    SELECT 1, value FROM StatisticCounter WHERE name = 'recommendations_last_borrowing_id' AND shard = 0;
+DELETE FROM StatisticCounter WHERE name = 'recommendations_last_borrowing_id';
+
+-- 7) Borrowing: a member's history newest first, in the primary-key order the
+-- member borrowings endpoint pages on.
+ALTER TABLE Borrowing
+    ADD INDEX idx_borrowing_member_id (member_id, borrowing_id);